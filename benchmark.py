@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+画像処理・PDF化の処理速度を計測するベンチマーク
+
+kindle_pdf_output/screenshots にあるスクリーンショットを複製して100/500/1000ページなどの
+疑似的な本を作り、Kindleアプリ・Gemini APIを使わずに以下を計測します。
+
+- 文字起こし前処理（デコード・RGB変換・縮小・JPEGエンコード）の時間
+- create_pdf_from_images のスループットとピークメモリ使用量（RSS）
+- 偽のキャプチャと偽のLLMバックエンドを使った一連の処理のページ/秒
+- 処理（モード）ごとの起動時間（新しいPythonプロセスで必要なパッケージを読み込むまで）
+
+結果は1回の実行を1行のJSONとしてファイルに追記するため、PillowのアップグレードやPDF設定の変更の前後で比較できます。
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import platform
+import subprocess
+import resource
+import tempfile
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import PIL
+from PIL import Image
+
+from kindle_ocr import (
+    KindlePDF, FakeBackend, FakeFocusManager, StreamingPDFWriter, find_screenshots, percentile
+)
+
+
+DEFAULT_SOURCE_DIR = Path(__file__).parent / "kindle_pdf_output" / "screenshots"
+
+# 起動時間を計測するモード（名前, kindle_ocr.py の引数）。eager は従来どおりすべてのパッケージを読み込んだ場合
+STARTUP_MODES = [
+    ('search', ['--search', 'x']),
+    ('replay', ['--replay', 'screenshots']),
+    ('replay+ocr', ['--replay', 'screenshots', '--ocr']),
+    ('capture', ['--pages', '1']),
+    ('capture+ocr', ['--pages', '1', '--ocr']),
+    ('capture+ocr+tesseract', ['--pages', '1', '--ocr', '--local-ocr', 'tesseract']),
+    ('eager', None),
+]
+
+# 新しいプロセスで kindle_ocr を読み込み、引数の処理で使う部品のパッケージを読み込んで結果をJSONで出力する
+STARTUP_SCRIPT = '''
+import sys, time, json
+start = time.perf_counter()
+import kindle_ocr
+imported = time.perf_counter()
+if sys.argv[1:] == ['--eager']:
+    names = list(kindle_ocr.COMPONENTS)
+else:
+    names = kindle_ocr.components_for(kindle_ocr.build_parser().parse_args(sys.argv[1:]))
+missing = []
+for name in names:
+    for module in kindle_ocr.COMPONENTS[name].modules:
+        if not module.available() and module.package not in missing:
+            missing.append(module.package)
+print(json.dumps({
+    'import_ms': round((imported - start) * 1000, 1),
+    'ready_ms': round((time.perf_counter() - start) * 1000, 1),
+    'components': names,
+    'missing': missing,
+    'modules': len(sys.modules)
+}))
+'''
+
+
+def peak_rss_mb() -> float:
+    """このプロセスのピークメモリ使用量（MB）を返す"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss はLinuxではKB、macOSではバイト単位
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+def build_book(source_images: List[Path], num_pages: int, book_dir: Path) -> List[Path]:
+    """
+    元のスクリーンショットを繰り返し並べて、指定ページ数の疑似的な本を作る
+
+    画像はシンボリックリンク（作成できない場合はコピー）で配置するため、ページ数を増やしてもディスクを消費しません。
+
+    Args:
+        source_images: 元のスクリーンショットのリスト
+        num_pages: ページ数
+        book_dir: 疑似的な本を作るディレクトリ
+
+    Returns:
+        ページ順の画像パスのリスト
+    """
+    book_dir.mkdir(parents=True, exist_ok=True)
+    pages = []
+    for page in range(1, num_pages + 1):
+        source = source_images[(page - 1) % len(source_images)]
+        path = book_dir / f"page_{page:04d}_20000101_000000.png"
+        try:
+            path.symlink_to(source.resolve())
+        except OSError:
+            shutil.copy(source, path)
+        pages.append(path)
+    return pages
+
+
+def bench_preprocess(source_images: List[Path], iterations: int) -> dict:
+    """
+    文字起こし前処理（KindlePDF.prepare_image）の時間を段階別に計測する
+
+    段階別の内訳は prepare_image と同じ手順を1段階ずつ計測したものです。
+
+    Args:
+        source_images: 計測に使う画像のリスト
+        iterations: 各画像を処理する回数
+
+    Returns:
+        計測結果
+    """
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        kindle_pdf = KindlePDF(output_dir=tmp, enable_ocr=True, backend=FakeBackend(), use_cache=False)
+        totals = []
+        stages: Dict[str, List[float]] = {'decode': [], 'convert': [], 'thumbnail': [], 'encode': []}
+        upload_bytes = []
+        for _ in range(iterations):
+            for path in source_images:
+                start = time.perf_counter()
+                _, _, payload = kindle_pdf.prepare_image(path)
+                totals.append(time.perf_counter() - start)
+                upload_bytes.append(len(payload.data))
+
+                start = time.perf_counter()
+                img = Image.open(path)
+                img.load()
+                stages['decode'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                stages['convert'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                if max(img.size) > 2048:
+                    img.thumbnail((2048, 2048), Image.Resampling.LANCZOS)
+                stages['thumbnail'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                img.save(io.BytesIO(), format="JPEG", quality=90)
+                stages['encode'].append(time.perf_counter() - start)
+
+    def summarize(values: List[float]) -> dict:
+        values = sorted(values)
+        return {
+            'mean_ms': round(statistics.mean(values) * 1000, 2),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 2)
+        }
+
+    return {
+        'images': len(totals),
+        **summarize(totals),
+        'upload_profile': kindle_pdf.upload_encoder.label,
+        'mean_upload_bytes': int(statistics.mean(upload_bytes)),
+        'stages': {stage: summarize(values) for stage, values in stages.items()}
+    }
+
+
+def bench_pdf(source_images: List[Path], num_pages: int, pdf_profile: str = 'jpeg',
+              convert_workers: int = 0) -> dict:
+    """
+    create_pdf_from_images でnum_pagesページのPDFを作成し、スループットとピークメモリを計測する
+
+    ピークメモリを計測ごとに分けるため、別プロセスで実行します。
+
+    Args:
+        source_images: 元のスクリーンショットのリスト
+        num_pages: ページ数
+        pdf_profile: PDFの出力プロファイル
+        convert_workers: 画像の変換に使うプロセス数（0の場合は並列化しない）
+
+    Returns:
+        計測結果
+    """
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        pages = build_book(source_images, num_pages, Path(tmp) / "book")
+        kindle_pdf = KindlePDF(output_dir=Path(tmp) / "output", pdf_profile=pdf_profile,
+                               convert_workers=convert_workers)
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        pdf_path = kindle_pdf.create_pdf_from_images(pages, "benchmark.pdf")
+        seconds = time.perf_counter() - start
+        pdf_bytes = pdf_path.stat().st_size if pdf_path else 0
+    return {
+        'pages': num_pages,
+        'seconds': round(seconds, 3),
+        'pages_per_second': round(num_pages / seconds, 2),
+        'pdf_bytes': pdf_bytes,
+        'bytes_per_page': pdf_bytes // num_pages,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_before_mb': rss_before
+    }
+
+
+class FakeCaptureKindlePDF(KindlePDF):
+    """Kindleアプリの代わりに疑似的な本の画像を順に「キャプチャ」するKindlePDF"""
+
+    def __init__(self, pages: List[Path], **kwargs):
+        super().__init__(focus_manager=FakeFocusManager(), **kwargs)
+        self.pages = pages
+        self.shown = 0
+        # ページめくり・前面表示の待機は計測対象外
+        self.tracer.sleeper = self.skip_sleep
+
+    @staticmethod
+    def skip_sleep(seconds: float):
+        """待機しない"""
+
+    def activate_kindle_app(self) -> bool:
+        return True
+
+    def take_screenshot(self, page_number: int) -> Optional[Path]:
+        with self.tracer.span('capture'):
+            path = self.screenshots_dir / f"page_{page_number:04d}_20000101_000000.png"
+            shutil.copy(self.pages[self.shown], path)
+        return path
+
+    def turn_page(self, direction: str = "next") -> bool:
+        self.shown = min(self.shown + 1, len(self.pages) - 1)
+        self.last_settle = (0.0, False)
+        return True
+
+
+def bench_pipeline(source_images: List[Path], num_pages: int, ocr_workers: int, fake_latency: float) -> dict:
+    """
+    偽のキャプチャと偽のLLMバックエンドで process_pages を実行し、ページ/秒を計測する
+
+    Args:
+        source_images: 元のスクリーンショットのリスト
+        num_pages: ページ数
+        ocr_workers: 文字起こしワーカー数
+        fake_latency: 偽のLLMバックエンドの応答時間（秒）
+
+    Returns:
+        計測結果
+    """
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        pages = build_book(source_images, num_pages, Path(tmp) / "book")
+        kindle_pdf = FakeCaptureKindlePDF(
+            pages,
+            output_dir=Path(tmp) / "output",
+            enable_ocr=True,
+            adaptive_settle=True,
+            use_cache=False,
+            backend=FakeBackend(latency=fake_latency)
+        )
+        start = time.perf_counter()
+        kindle_pdf.process_pages(num_pages=num_pages, delay_between_pages=0, ocr_workers=ocr_workers)
+        seconds = time.perf_counter() - start
+        with open(kindle_pdf.output_dir / "results.json", encoding='utf-8') as f:
+            results = json.load(f)
+    return {
+        'pages': num_pages,
+        'ocr_workers': ocr_workers,
+        'fake_latency': fake_latency,
+        'seconds': round(seconds, 3),
+        'pages_per_second': round(num_pages / seconds, 2),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': {stage: stats['p50'] for stage, stats in results['timings']['stages'].items()}
+    }
+
+
+def bench_startup(iterations: int) -> List[dict]:
+    """
+    モードごとに新しいPythonプロセスを起動し、処理を始められる状態になるまでの時間を計測する
+
+    Kindleアプリの操作やAPIの呼び出しは行わず、kindle_ocr の読み込みと、そのモードで使う部品の
+    パッケージ（Pillow・pyautogui・google-generativeai など）の読み込みまでを計測します。
+
+    Args:
+        iterations: モードごとの計測回数（中央値を記録）
+
+    Returns:
+        モードごとの計測結果（インストールされていないパッケージは missing に記録）
+    """
+    results = []
+    for mode, argv in STARTUP_MODES:
+        walls = []
+        readies = []
+        info = {}
+        for _ in range(iterations):
+            start = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, '-c', STARTUP_SCRIPT] + (argv if argv is not None else ['--eager']),
+                cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+            )
+            walls.append(time.perf_counter() - start)
+            info = json.loads(completed.stdout.strip().splitlines()[-1])
+            readies.append(info['ready_ms'])
+        results.append({
+            'mode': mode,
+            'components': info['components'],
+            'wall_ms': round(statistics.median(walls) * 1000, 1),
+            'ready_ms': round(statistics.median(readies), 1),
+            'import_ms': info['import_ms'],
+            'modules': info['modules'],
+            'missing': info['missing']
+        })
+    return results
+
+
+def run_isolated(func, *args) -> dict:
+    """ピークメモリを計測ごとに分けるため、関数を新しいプロセスで実行する"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(func, *args).result()
+
+
+def main():
+    """メイン関数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="画像処理・PDF化の処理速度を計測するベンチマーク",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # 100/500/1000ページのPDF化と100ページの一連の処理を計測
+  python benchmark.py
+
+  # 短時間で確認
+  python benchmark.py --sizes 20 --pipeline-sizes 20 --iterations 1
+
+  # モードごとの起動時間だけを計測
+  python benchmark.py --startup-only
+        """
+    )
+    parser.add_argument('--source', default=str(DEFAULT_SOURCE_DIR),
+                        help=f'元のスクリーンショットのディレクトリ（デフォルト: {DEFAULT_SOURCE_DIR}）')
+    parser.add_argument('--sizes', default='100,500,1000',
+                        help='PDF化を計測するページ数（カンマ区切り、デフォルト: 100,500,1000）')
+    parser.add_argument('--pipeline-sizes', default='100',
+                        help='一連の処理を計測するページ数（カンマ区切り、空にすると省略、デフォルト: 100）')
+    parser.add_argument('--iterations', type=int, default=3,
+                        help='前処理の計測で各画像を処理する回数（デフォルト: 3）')
+    parser.add_argument('--ocr-workers', type=int, default=2,
+                        help='一連の処理で使う文字起こしワーカー数（デフォルト: 2）')
+    parser.add_argument('--fake-latency', type=float, default=0.0,
+                        help='偽のLLMバックエンドの応答時間（秒、デフォルト: 0）')
+    parser.add_argument('--pdf-profile', choices=StreamingPDFWriter.PROFILES, default='jpeg',
+                        help='PDF化の計測に使う出力プロファイル（デフォルト: jpeg）')
+    parser.add_argument('--convert-workers', type=int, default=0,
+                        help='PDF化で画像の変換に使うプロセス数（0で並列化しない、デフォルト: 0）')
+    parser.add_argument('--startup-iterations', type=int, default=5,
+                        help='起動時間の計測でモードごとにプロセスを起動する回数（0で省略、デフォルト: 5）')
+    parser.add_argument('--startup-only', action='store_true',
+                        help='起動時間だけを計測する（スクリーンショットは不要）')
+    parser.add_argument('--output', default='benchmark_results.jsonl',
+                        help='結果を追記するファイル（デフォルト: benchmark_results.jsonl）')
+    args = parser.parse_args()
+
+    startup = []
+    if args.startup_iterations > 0 or args.startup_only:
+        print(f"🚀 起動時間（モードごとに{max(1, args.startup_iterations)}回の中央値）")
+        startup = bench_startup(max(1, args.startup_iterations))
+        for result in startup:
+            missing = f"（未インストール: {', '.join(result['missing'])}）" if result['missing'] else ""
+            print(f"   {result['mode']:<24}{result['wall_ms']:>8.1f}ms（読み込み完了 {result['ready_ms']:.1f}ms、"
+                  f"モジュール {result['modules']}個）{missing}")
+    if args.startup_only:
+        record = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'startup': startup
+        }
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"\n✅ 結果を追記しました: {args.output}")
+        return
+
+    source_images = list(find_screenshots(Path(args.source)).values())
+    if not source_images:
+        print(f"❌ スクリーンショットが見つかりません: {args.source}")
+        sys.exit(1)
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    pipeline_sizes = [int(size) for size in args.pipeline_sizes.split(',') if size]
+
+    print(f"📊 ベンチマークを開始します（元画像: {len(source_images)}枚、Pillow {PIL.__version__}）")
+
+    print(f"\n🖼️ 文字起こし前処理")
+    preprocess = bench_preprocess(source_images, args.iterations)
+    print(f"   {preprocess['images']}枚: 平均 {preprocess['mean_ms']}ms / p95 {preprocess['p95_ms']}ms")
+    for stage, stats in preprocess['stages'].items():
+        print(f"     {stage}: 平均 {stats['mean_ms']}ms")
+
+    print(f"\n📄 PDF化（create_pdf_from_images、{args.pdf_profile}、変換プロセス{args.convert_workers}個）")
+    pdf = []
+    for size in sizes:
+        result = run_isolated(bench_pdf, source_images, size, args.pdf_profile, args.convert_workers)
+        pdf.append(result)
+        print(f"   {size}ページ: {result['seconds']}秒（{result['pages_per_second']}ページ/秒）、"
+              f"ピークメモリ {result['peak_rss_mb']}MB、{result['pdf_bytes'] / 1024 / 1024:.1f}MB")
+
+    pipeline = []
+    if pipeline_sizes:
+        print(f"\n⚙️ 一連の処理（偽のキャプチャ＋偽のLLM、ワーカー{args.ocr_workers}個）")
+    for size in pipeline_sizes:
+        result = run_isolated(bench_pipeline, source_images, size, args.ocr_workers, args.fake_latency)
+        pipeline.append(result)
+        print(f"   {size}ページ: {result['seconds']}秒（{result['pages_per_second']}ページ/秒）、"
+              f"ピークメモリ {result['peak_rss_mb']}MB")
+
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'source_images': len(source_images),
+        'pdf_profile': args.pdf_profile,
+        'convert_workers': args.convert_workers,
+        'startup': startup,
+        'preprocess': preprocess,
+        'pdf': pdf,
+        'pipeline': pipeline
+    }
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    print(f"\n✅ 結果を追記しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
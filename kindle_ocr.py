@@ -9,11 +9,31 @@ macOSでKindleアプリを開き、ページを一枚ずつめくりながら
 import os
 import sys
 import time
+import asyncio
+import contextvars
+import functools
 import subprocess
 import io
+import re
+import struct
+import shutil
+import hashlib
+import math
+import tempfile
+import importlib
+import random
+import sqlite3
+import queue
+import difflib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait as wait_futures
+from contextlib import contextmanager
+from multiprocessing import get_context
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Callable, Tuple, NamedTuple, Iterator, AsyncIterator
 import json
 
 # .envファイルの読み込み
@@ -27,256 +47,139 @@ except ImportError:
     # python-dotenvがインストールされていない場合はスキップ
     pass
 
-try:
-    import pyautogui
-    from PIL import Image
-    import google.generativeai as genai
-except ImportError as e:
-    print(f"❌ 必要なパッケージがインストールされていません: {e}")
-    print("以下のコマンドでインストールしてください:")
-    print("pip install pyautogui pillow google-generativeai")
-    sys.exit(1)
+class MissingDependencyError(RuntimeError):
+    """処理に必要な任意のパッケージ・コマンドがない"""
 
 
-class KindlePDF:
-    """Kindleアプリの自動ページめくりとスクリーンショット取得＋PDF化・LLM文字起こし処理クラス"""
-    
-    def __init__(self, output_dir: str = "kindle_pdf_output", api_key: Optional[str] = None, enable_ocr: bool = False):
+class LazyModule:
+    """
+    最初に属性が参照されたときに読み込むモジュール
+
+    Pillow・pyautogui・google-generativeai などの読み込みは時間がかかるため、
+    起動時にはすべてを読み込まず、処理（キャプチャ・PDF化・LLM文字起こしなど）で実際に使うものだけを読み込みます。
+    全文検索のようにどれも使わない処理では何も読み込みません。
+    """
+
+    def __init__(self, name: str, package: str, on_load: Optional[Callable[[object], None]] = None):
         """
         初期化
-        
+
         Args:
-            output_dir: 出力ディレクトリ
-            api_key: Gemini APIキー（LLM文字起こしを使用する場合）
-            enable_ocr: LLM文字起こしを有効にするかどうか
-        """
-        # LLM文字起こしの設定
-        self.enable_ocr = enable_ocr
-        if self.enable_ocr:
-            # APIキーの設定
-            self.api_key = api_key or os.getenv('GEMINI_API_KEY')
-            if not self.api_key:
-                raise ValueError(
-                    "LLM文字起こしを有効にするには、Gemini APIキーが必要です。\n"
-                    "環境変数 GEMINI_API_KEY を設定するか、--api-key オプションで指定してください。"
-                )
-            
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('models/gemini-2.0-flash-exp')
-            print(f"✅ LLM文字起こし機能を有効にしました")
-        
-        # 出力ディレクトリの設定
-        self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
-        
-        # スクリーンショット保存用ディレクトリ
-        self.screenshots_dir = self.output_dir / "screenshots"
-        self.screenshots_dir.mkdir(exist_ok=True)
-        
-        # LLM文字起こし結果保存用ディレクトリ（有効な場合のみ）
-        if self.enable_ocr:
-            self.texts_dir = self.output_dir / "texts"
-            self.texts_dir.mkdir(exist_ok=True)
-        
-        # pyautoguiの設定
-        pyautogui.FAILSAFE = True  # マウスを左上に移動すると緊急停止
-        pyautogui.PAUSE = 0.5  # 各操作の間に0.5秒待機
-        
-        mode_text = "PDF化" if not self.enable_ocr else "PDF化＋LLM文字起こし"
-        print(f"✅ Kindle {mode_text}アプリを初期化しました")
-        print(f"   出力ディレクトリ: {self.output_dir.absolute()}")
-    
-    def open_kindle_app(self) -> bool:
-        """
-        Kindleアプリを開く
-        
-        Returns:
-            成功した場合True
+            name: モジュール名
+            package: インストールするパッケージ名（エラーメッセージ用）
+            on_load: 読み込んだ直後に1回だけ呼び出す設定用の関数
         """
-        print("\n📚 Kindleアプリを開いています...")
-        
-        try:
-            # AppleScriptでKindleアプリを開く（複数のアプリ名を試す）
-            app_names = ["Kindle", "Amazon Kindle"]
-            opened = False
-            
-            for app_name in app_names:
-                try:
-                    script = f'''
-                    tell application "{app_name}"
-                        activate
-                    end tell
-                    '''
-                    subprocess.run(['osascript', '-e', script], check=True, capture_output=True)
-                    print(f"✅ Kindleアプリ（{app_name}）を開きました")
-                    opened = True
-                    break
-                except subprocess.CalledProcessError:
-                    continue
-            
-            if not opened:
-                # アプリが既に実行中の場合はactivateのみ試す
-                try:
-                    subprocess.run(['osascript', '-e', 'tell application "System Events" to set frontmost of process "Kindle" to true'], 
-                                 check=True, capture_output=True)
-                    print("✅ Kindleアプリを前面に表示しました")
-                    opened = True
-                except:
-                    pass
-            
-            if opened:
-                # アプリが起動するまで待機
-                time.sleep(3)
-                return True
-            else:
-                print("❌ Kindleアプリを開けませんでした")
-                print("   Kindleアプリがインストールされているか確認してください")
-                print("   または、--skip-open オプションを使用して手動でKindleアプリを開いてください")
-                return False
-            
-        except Exception as e:
-            print(f"❌ エラー: {e}")
-            print("   --skip-open オプションを使用して手動でKindleアプリを開いてください")
-            return False
-        except Exception as e:
-            print(f"❌ エラー: {e}")
-            return False
-    
-    def activate_kindle_app(self) -> bool:
+        self.name = name
+        self.package = package
+        self.on_load = on_load
+        self.error: Optional[Exception] = None
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
         """
-        Kindleアプリを前面に表示する
-        
-        Returns:
-            成功した場合True
+        モジュールを読み込む（読み込み済みの場合はそのまま返す）
+
+        Raises:
+            MissingDependencyError: パッケージがない、または読み込めない場合
         """
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    try:
+                        module = importlib.import_module(self.name)
+                    except Exception as e:
+                        # pyautoguiはディスプレイのない環境ではImportError以外の例外を送出する
+                        self.error = e
+                        raise MissingDependencyError(
+                            f"{self.package} を読み込めません（pip install {self.package}）: {e}"
+                        ) from e
+                    if self.on_load:
+                        self.on_load(module)
+                    self._module = module
+        return self._module
+
+    def available(self) -> bool:
+        """モジュールを読み込めるかどうか"""
         try:
-            # 複数の方法でKindleアプリを前面に表示
-            app_names = ["Kindle", "Amazon Kindle"]
-            activated = False
-            
-            for app_name in app_names:
-                try:
-                    # 方法1: AppleScriptでactivate
-                    script = f'''
-                    tell application "{app_name}"
-                        activate
-                    end tell
-                    '''
-                    result = subprocess.run(['osascript', '-e', script], check=True, capture_output=True, timeout=5)
-                    print(f"  ✅ {app_name}をactivateしました")
-                    activated = True
-                    break
-                except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-                    print(f"  ⚠️ {app_name}のactivateに失敗: {e}")
-                    continue
-            
-            # 方法2: System Eventsでプロセスを前面に
-            try:
-                result = subprocess.run(
-                    ['osascript', '-e', 'tell application "System Events" to set frontmost of process "Kindle" to true'],
-                    check=True,
-                    capture_output=True,
-                    timeout=5
-                )
-                print(f"  ✅ System EventsでKindleを前面に表示しました")
-                activated = True
-            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-                print(f"  ⚠️ System Eventsでの前面表示に失敗: {e}")
-            
-            # アプリが前面に来るまで少し待機
-            time.sleep(1.5)
-            
-            # 現在アクティブなアプリを確認
-            try:
-                result = subprocess.run(
-                    ['osascript', '-e', 'tell application "System Events" to get name of first application process whose frontmost is true'],
-                    check=True,
-                    capture_output=True,
-                    timeout=3
-                )
-                active_app = result.stdout.decode('utf-8').strip()
-                print(f"  📱 現在アクティブなアプリ: {active_app}")
-                if 'Kindle' in active_app:
-                    print(f"  ✅ Kindleアプリがアクティブです")
-                else:
-                    print(f"  ⚠️ 警告: Kindleアプリがアクティブではありません")
-            except Exception as e:
-                print(f"  ⚠️ アクティブアプリの確認に失敗: {e}")
-            
-            return activated
-            
-        except Exception as e:
-            print(f"  ⚠️ Kindleアプリを前面に表示できませんでした: {e}")
+            self.load()
+        except MissingDependencyError:
             return False
-    
-    def take_screenshot(self, page_number: int) -> Optional[Path]:
-        """
-        スクリーンショットを取得
-        
-        Args:
-            page_number: ページ番号
-            
-        Returns:
-            保存されたスクリーンショットのパス
-        """
-        # スクリーンショット取得前にKindleアプリを前面に表示
-        self.activate_kindle_app()
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"page_{page_number:04d}_{timestamp}.png"
-        screenshot_path = self.screenshots_dir / filename
-        
-        try:
-            # macOSのscreencaptureコマンドを使用
-            subprocess.run(
-                ['screencapture', '-x', str(screenshot_path)],
-                check=True,
-                capture_output=True
-            )
-            print(f"  📸 スクリーンショット保存: {filename}")
-            return screenshot_path
-            
-        except subprocess.CalledProcessError as e:
-            print(f"  ❌ スクリーンショット取得エラー: {e}")
-            return None
-        except Exception as e:
-            print(f"  ❌ エラー: {e}")
-            return None
-    
-    def extract_text_from_image(self, image_path: Path) -> Optional[str]:
-        """
-        LLM（Gemini）を使って画像からテキストを文字起こし
-        
-        OCRではなく、LLMの文脈理解能力を使って自然な文章として文字起こしします。
-        
-        Args:
-            image_path: 画像ファイルのパス
-            
-        Returns:
-            文字起こしされたテキスト
-        """
-        if not self.enable_ocr:
-            return None
-        
-        print(f"  🤖 LLMで文字起こし中...")
-        
-        try:
-            # 画像を読み込んで準備
-            with open(image_path, 'rb') as f:
-                img = Image.open(f)
-                if img.mode in ('RGBA', 'P'):
-                    img = img.convert('RGB')
-                
-                # 画像サイズが大きい場合はリサイズ（LLMの処理能力を考慮）
-                if max(img.size) > 2048:
-                    img.thumbnail((2048, 2048), Image.Resampling.LANCZOS)
-                
-                buffer = io.BytesIO()
-                img.save(buffer, format="JPEG", quality=90)
-                image_data = buffer.getvalue()
-            
-            # LLMによる文字起こしプロンプト
-            prompt_text = """
+        return True
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+
+def configure_pyautogui(module):
+    """pyautoguiの安全設定"""
+    module.FAILSAFE = True  # マウスを左上に移動すると緊急停止
+    module.PAUSE = 0.5  # 各操作の間に0.5秒待機
+
+
+# 遅延読み込みするモジュール
+Image = LazyModule('PIL.Image', 'pillow')
+ImageChops = LazyModule('PIL.ImageChops', 'pillow')
+ImageStat = LazyModule('PIL.ImageStat', 'pillow')
+features = LazyModule('PIL.features', 'pillow')
+# pyautoguiは画面操作（キャプチャ・ページめくり）にのみ使用するため、
+# ディスプレイのない環境でも既存のスクリーンショットを再処理（--replay）できる
+pyautogui = LazyModule('pyautogui', 'pyautogui', on_load=configure_pyautogui)
+genai = LazyModule('google.generativeai', 'google-generativeai')
+# pytesseractはローカルOCR（--local-ocr tesseract）にのみ使用する
+pytesseract = LazyModule('pytesseract', 'pytesseract')
+# Quartz（pyobjc）は画面の静止検出（--adaptive-settle）で画面の一部を低解像度で取得するのにのみ使用する
+# （macOSではpyautoguiの依存パッケージとしてインストールされます）
+Quartz = LazyModule('Quartz', 'pyobjc-framework-Quartz')
+
+
+class Component(NamedTuple):
+    """処理の部品ごとに必要なモジュールとコマンド"""
+    modules: Tuple[LazyModule, ...]
+    commands: Tuple[str, ...]
+
+
+# 処理の部品（capture: 画面の取得とページめくり、focus: Kindleアプリの前面表示、
+# pdf: 画像の処理とPDF化、llm: Gemini APIによる文字起こし、local_ocr: Tesseractによる文字認識）
+COMPONENTS: Dict[str, Component] = {
+    'capture': Component((pyautogui, Image), ('screencapture',)),
+    'focus': Component((), ('osascript',)),
+    'pdf': Component((Image, ImageChops, ImageStat, features), ()),
+    'llm': Component((genai,), ()),
+    'local_ocr': Component((pytesseract,), ('tesseract',)),
+}
+
+
+def require(*names: str):
+    """
+    処理の部品に必要なモジュールを読み込み、コマンドがあることを確かめる
+
+    足りないものはまとめて1つのエラーにします。
+
+    Args:
+        names: COMPONENTS の部品名
+
+    Raises:
+        MissingDependencyError: 足りないモジュール・コマンドがある場合
+    """
+    missing = []
+    packages = []
+    for name in names:
+        component = COMPONENTS[name]
+        for module in component.modules:
+            if not module.available() and module.package not in packages:
+                packages.append(module.package)
+                missing.append(f"{module.package}（{module.error}）")
+        missing.extend(f"{command} コマンド" for command in component.commands if shutil.which(command) is None)
+    if missing:
+        message = "必要なパッケージ・コマンドがありません: " + "、".join(missing)
+        if packages:
+            message += f"\n以下のコマンドでインストールしてください:\npip install {' '.join(packages)}"
+        raise MissingDependencyError(message)
+
+
+# LLMによる文字起こしプロンプト
+TRANSCRIPTION_PROMPT = """
 この画像はKindleアプリのページです。画像内のテキストを、LLMの文脈理解能力を使って自然な文章として文字起こししてください。
 
 【重要な指示】
@@ -296,286 +199,6898 @@ class KindlePDF:
 - 本文のみを出力し、追加の説明やコメントは不要です
 
 テキストのみを出力してください。
-            """
-            
-            response = self.model.generate_content(
-                [prompt_text, {"mime_type": "image/jpeg", "data": image_data}]
-            )
-            
-            transcribed_text = response.text.strip()
-            print(f"  ✅ 文字起こし完了（{len(transcribed_text)}文字）")
-            return transcribed_text
-            
-        except Exception as e:
-            print(f"  ❌ 文字起こしエラー: {e}")
-            return None
-    
-    def save_text(self, text: str, page_number: int) -> Optional[Path]:
+"""
+
+# 複数ページをまとめて文字起こしする場合にプロンプトの後に追加する指示
+BATCH_TRANSCRIPTION_PROMPT = """
+【複数ページの指示】
+これから{num_pages}枚のページ画像を順番に渡します（「ページ1」「ページ2」…の見出しの直後の画像がそのページです）。
+各ページを上記の指示どおりに個別に文字起こしし、次のJSON配列のみを出力してください。
+[{{"page": 1, "text": "ページ1の文字起こし"}}, {{"page": 2, "text": "ページ2の文字起こし"}}]
+pageは画像の順番（1始まり）で、すべてのページを1件ずつ含めてください。
+"""
+
+# 文字起こしプロンプトのバージョン（プロンプトを変更したら上げる。キャッシュのキーに含まれます）
+PROMPT_VERSION = 1
+
+# 全文検索インデックスの既定の保存先
+DEFAULT_INDEX_PATH = Path.home() / '.local' / 'share' / 'kindle_ocr' / 'index.db'
+
+# フレームストア（重複を除いたスクリーンショットの保存先）の既定の場所と、本ごとの索引のファイル名
+DEFAULT_FRAME_STORE_PATH = Path.home() / '.local' / 'share' / 'kindle_ocr' / 'frames'
+FRAME_INDEX_NAME = 'frames.json'
+
+# 文字起こしに使用するGeminiモデル
+DEFAULT_MODEL_NAME = 'models/gemini-2.0-flash-exp'
+
+
+class BackendResponse:
+    """LLMバックエンドの応答（テキストとトークン使用量）"""
+
+    def __init__(self, text: str, prompt_tokens: int = 0, output_tokens: int = 0, total_tokens: int = 0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.total_tokens = total_tokens or prompt_tokens + output_tokens
+
+
+class TransientBackendError(Exception):
+    """再試行すれば成功する可能性のあるLLMバックエンドのエラー（レート制限・一時的な障害など）"""
+
+
+async def run_in_thread(func: Callable, *args):
+    """
+    ブロックする関数を既定のスレッドプールで実行して結果を待つ（asyncio.to_thread 相当）
+
+    呼び出し元のコンテキスト（トレースのページ番号など）を引き継ぎます。
+    """
+    loop = asyncio.get_event_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args)
+    return await loop.run_in_executor(None, call)
+
+
+class TranscriptionBackend(ABC):
+    """
+    文字起こしに使うLLMバックエンドのインターフェース
+
+    サブクラスは model_name と generate() を実装します。
+    model_name は文字起こしキャッシュのキーに含まれます。
+    非同期APIを持つバックエンドは generate_async() も実装します（既定ではスレッドで generate() を実行します）。
+    """
+
+    model_name = 'unknown'
+
+    @abstractmethod
+    def generate(self, parts: list) -> BackendResponse:
         """
-        抽出したテキストをファイルに保存
-        
+        プロンプトと画像のリストを送信して応答を返す
+
         Args:
-            text: 抽出されたテキスト
-            page_number: ページ番号
-            
+            parts: 文字列と {"mime_type": ..., "data": ...} の画像からなるリスト
+
         Returns:
-            保存されたファイルのパス
+            応答
         """
-        if not self.enable_ocr:
-            return None
-        
-        filename = f"page_{page_number:04d}.txt"
-        text_path = self.texts_dir / filename
-        
-        with open(text_path, 'w', encoding='utf-8') as f:
-            f.write(text)
-        
-        return text_path
-    
-    def turn_page(self, direction: str = "next") -> bool:
+
+    async def generate_async(self, parts: list) -> BackendResponse:
         """
-        ページをめくる（シンプルにスペースキーを使用）
-        
+        generate() の非同期版
+
+        既定の実装はスレッドで generate() を実行するため、タイムアウトやキャンセルで待つのをやめても
+        リクエスト自体は最後まで実行されます。
+
         Args:
-            direction: "next"（次へ）または "prev"（前へ）
-            
+            parts: 文字列と {"mime_type": ..., "data": ...} の画像からなるリスト
+
         Returns:
-            成功した場合True
+            応答
         """
-        # ページめくる前にKindleアプリを前面に表示
-        self.activate_kindle_app()
-        time.sleep(0.5)  # アプリが前面に来るまで少し待機
-        
-        try:
-            if direction == "next":
+        return await run_in_thread(self.generate, parts)
+
+
+class GeminiBackend(TranscriptionBackend):
+    """Gemini APIを使うバックエンド"""
+
+    def __init__(self, api_key: str, model_name: str = DEFAULT_MODEL_NAME):
+        """
+        初期化
+
+        Args:
+            api_key: Gemini APIキー
+            model_name: 使用するモデル名
+        """
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, parts: list) -> BackendResponse:
+        return self._to_response(self.model.generate_content(parts))
+
+    async def generate_async(self, parts: list) -> BackendResponse:
+        return self._to_response(await self.model.generate_content_async(parts))
+
+    @staticmethod
+    def _to_response(response) -> BackendResponse:
+        usage = getattr(response, 'usage_metadata', None)
+        return BackendResponse(
+            response.text,
+            prompt_tokens=getattr(usage, 'prompt_token_count', 0) or 0,
+            output_tokens=getattr(usage, 'candidates_token_count', 0) or 0,
+            total_tokens=getattr(usage, 'total_token_count', 0) or 0
+        )
+
+
+class FakeBackend(TranscriptionBackend):
+    """
+    APIを呼び出さないローカルの偽バックエンド（スループットの調整や負荷試験用）
+
+    画像の内容から決まるテキストを返し、指定した遅延とエラー率を再現します。
+    乱数のシードを固定しているため、同じ設定・同じ呼び出し順なら結果は毎回同じです。
+    """
+
+    model_name = 'fake'
+
+    # 出力1文字あたりのトークン数の目安（画像のトークン数は estimate_image_tokens() で画像の大きさから計算）
+    TOKENS_PER_OUTPUT_CHAR = 1
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        """
+        初期化
+
+        Args:
+            latency: 1リクエストあたりの応答時間（秒）
+            error_rate: TransientBackendErrorを送出する確率（0〜1）
+            seed: 乱数のシード
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, parts: list) -> BackendResponse:
+        fail = self._draw_failure()
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(parts, fail)
+
+    async def generate_async(self, parts: list) -> BackendResponse:
+        fail = self._draw_failure()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(parts, fail)
+
+    def _draw_failure(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _respond(self, parts: list, fail: bool) -> BackendResponse:
+        if fail:
+            raise TransientBackendError("429 Resource has been exhausted（偽バックエンドによる疑似エラー）")
+
+        images = [part['data'] for part in parts if isinstance(part, dict)]
+        texts = [f"（偽の文字起こし: {hashlib.sha1(data).hexdigest()[:12]}）" for data in images]
+        if len(texts) == 1:
+            text = texts[0]
+        else:
+            text = json.dumps([{'page': i, 'text': t} for i, t in enumerate(texts, 1)], ensure_ascii=False)
+        prompt_chars = sum(len(part) for part in parts if isinstance(part, str))
+        image_tokens = 0
+        for data in images:
+            with Image.open(io.BytesIO(data)) as img:
+                image_tokens += estimate_image_tokens(*img.size)
+        return BackendResponse(
+            text,
+            prompt_tokens=prompt_chars + image_tokens,
+            output_tokens=len(text) * self.TOKENS_PER_OUTPUT_CHAR
+        )
+
+
+class LocalOCRResult(NamedTuple):
+    """ローカルOCRの結果"""
+    text: str
+    # 認識した単語の信頼度の文字数による加重平均（0〜100）
+    confidence: float
+    # 認識したテキストブロックの数（段組みや図と本文の混在の目安）
+    blocks: int
+
+
+class LocalOCREngine(ABC):
+    """
+    LLMの前にページを文字起こしするローカルOCRエンジンのインターフェース
+
+    サブクラスは name と recognize() を実装します。
+    """
+
+    name = 'unknown'
+
+    @abstractmethod
+    def recognize(self, image: 'Image.Image') -> LocalOCRResult:
+        """
+        ページ画像を文字認識する
+
+        Args:
+            image: RGBのページ画像
+
+        Returns:
+            認識結果
+        """
+
+
+# 日本語の文字（かな・漢字・全角記号）
+CJK_CHARS = '\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef'
+
+
+class TesseractEngine(LocalOCREngine):
+    """Tesseract（pytesseract経由）を使うローカルOCRエンジン"""
+
+    name = 'tesseract'
+
+    # Tesseractが日本語の文字の間に入れる空白
+    CJK_SPACE = re.compile(f'(?<=[{CJK_CHARS}]) +(?=[{CJK_CHARS}])')
+
+    def __init__(self, lang: str = 'jpn+eng', config: str = '--psm 3'):
+        """
+        初期化
+
+        Args:
+            lang: Tesseractの言語データ（+で複数指定）
+            config: Tesseractに渡す追加の設定
+        """
+        try:
+            require('local_ocr')
+        except MissingDependencyError as e:
+            raise RuntimeError(f"{e}\nTesseract本体は brew install tesseract tesseract-lang でインストールしてください。")
+        try:
+            available = set(pytesseract.get_languages(config=''))
+        except Exception as e:
+            raise RuntimeError(f"Tesseractを実行できません: {e}")
+        missing = [code for code in lang.split('+') if code not in available]
+        if missing:
+            raise RuntimeError(f"Tesseractの言語データがありません: {', '.join(missing)}")
+        self.lang = lang
+        self.config = config
+
+    def recognize(self, image: 'Image.Image') -> LocalOCRResult:
+        data = pytesseract.image_to_data(
+            image.convert('L'), lang=self.lang, config=self.config, output_type=pytesseract.Output.DICT
+        )
+        # 単語を行・段落ごとにまとめる（信頼度が負の項目は単語ではない）
+        paragraphs: Dict[Tuple[int, int], Dict[int, List[str]]] = OrderedDict()
+        weighted = 0.0
+        chars = 0
+        blocks = set()
+        for i, word in enumerate(data['text']):
+            word = word.strip()
+            confidence = float(data['conf'][i])
+            if not word or confidence < 0:
+                continue
+            paragraph = paragraphs.setdefault((data['block_num'][i], data['par_num'][i]), OrderedDict())
+            paragraph.setdefault(data['line_num'][i], []).append(word)
+            weighted += confidence * len(word)
+            chars += len(word)
+            blocks.add(data['block_num'][i])
+
+        texts = []
+        for lines in paragraphs.values():
+            # 段落内の改行は折り返しとみなして連結する（日本語どうしは空白を入れない）
+            texts.append(self.CJK_SPACE.sub('', ' '.join(' '.join(words) for words in lines.values())))
+        return LocalOCRResult('\n\n'.join(texts), weighted / chars if chars else 0.0, len(blocks))
+
+
+class FakeLocalOCR(LocalOCREngine):
+    """
+    OCRを実行しないローカルの偽エンジン（振り分けの調整や試験用）
+
+    画像の内容から決まるテキストと、confidence ± spread の範囲で画像ごとに決まる信頼度を返します。
+    """
+
+    name = 'fake-local'
+
+    def __init__(self, confidence: float = 90.0, spread: float = 0.0, blocks: int = 1, latency: float = 0.0):
+        """
+        初期化
+
+        Args:
+            confidence: 信頼度の中心値（0〜100）
+            spread: 画像ごとに信頼度をずらす幅
+            blocks: 返すテキストブロックの数
+            latency: 1ページあたりの処理時間（秒）
+        """
+        self.confidence = confidence
+        self.spread = spread
+        self.blocks = blocks
+        self.latency = latency
+
+    def recognize(self, image: 'Image.Image') -> LocalOCRResult:
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.sha1(image.tobytes()).digest()
+        offset = (digest[0] / 255 * 2 - 1) * self.spread
+        confidence = min(100.0, max(0.0, self.confidence + offset))
+        return LocalOCRResult(f"（偽のローカルOCR: {digest.hex()[:12]}）", confidence, self.blocks)
+
+
+class RouteDecision(NamedTuple):
+    """ページの文字起こしに使うエンジンの判定結果"""
+    # local（ローカルOCRの結果を使う）または llm（LLMに回す）
+    engine: str
+    # 判定の理由（ok / figure / table / mixed_layout / low_confidence / little_text / local_error）
+    reason: str
+    # ローカルOCRの結果（実行しなかった・失敗した場合None）
+    text: Optional[str]
+    confidence: Optional[float]
+
+
+class OCRRouter:
+    """
+    ページを先にローカルOCRで文字起こしし、難しいページだけをLLMに回す振り分け
+
+    次のいずれかに当てはまるページはLLMに回します。
+        figure: 色付きや中間調の多いページ（挿絵・写真・図）。ローカルOCRは実行しない
+        table: 縦横の罫線がそれぞれ min_rules 本以上あるページ（表）。ローカルOCRは実行しない
+        mixed_layout: テキストブロックが max_blocks より多いページ（段組み・図と本文の混在）
+        low_confidence: ローカルOCRの信頼度が min_confidence 未満のページ
+        little_text: 認識できた文字が min_chars 未満のページ（白紙・図だけのページ）
+    """
+
+    def __init__(self, engine: LocalOCREngine, min_confidence: float = 80.0, max_blocks: int = 5,
+                 min_chars: int = 20, min_rules: int = 2, rule_ratio: float = 0.4):
+        """
+        初期化
+
+        Args:
+            engine: ローカルOCRエンジン
+            min_confidence: ローカルOCRの結果を使う信頼度の下限（0〜100）
+            max_blocks: ローカルOCRの結果を使うテキストブロック数の上限
+            min_chars: ローカルOCRの結果を使う文字数の下限
+            min_rules: 表とみなす縦・横それぞれの罫線の本数の下限
+            rule_ratio: 罫線とみなす線の長さの下限（ページの短辺に対する割合）
+        """
+        self.engine = engine
+        self.min_confidence = min_confidence
+        self.max_blocks = max_blocks
+        self.min_chars = min_chars
+        self.min_rules = min_rules
+        self.rule_ratio = rule_ratio
+        # 色と中間調の判定はPDFのautoプロファイルと同じ基準を使う
+        self.profiler = PDFPageEncoder(profile='auto')
+        # 切り抜いていないスクリーンショットはメニューバーやDockを除いたページ領域だけを判定・文字認識する
+        self.region_detector = PageRegionDetector()
+
+    def page_image(self, frame: 'Frame') -> 'Image.Image':
+        """
+        判定と文字認識に使うページ画像（ページ領域に切り抜き、ダークモードは白地に黒字に反転）
+
+        Args:
+            frame: ページの画面
+
+        Returns:
+            RGBのページ画像
+        """
+        def build() -> 'Image.Image':
+            image = frame.image
+            region = self.region_detector.detect(image)
+            if region and region != (0, 0) + image.size:
+                image = image.crop(region)
+            if ImageStat.Stat(image.convert('L').reduce(4)).mean[0] < 128:
+                image = ImageChops.invert(image)
+            return image
+        return frame.derived('ocr_page', build)
+
+    def count_rules(self, mask: 'Image.Image', min_length: float) -> int:
+        """
+        2値画像の横方向の罫線の本数を数える
+
+        行ごとの黒画素の割合で候補を絞り込んでから、実際に連続した線かどうかを確かめます。
+
+        Args:
+            mask: 黒画素を255とした2値画像
+            min_length: 罫線とみなす線の長さの下限（ピクセル）
+
+        Returns:
+            罫線の本数
+        """
+        width, height = mask.size
+        profile = mask.resize((1, height), Image.Resampling.BOX).tobytes()
+        # 罫線は細い線のため、太い帯（塗りつぶしなど）は数えない
+        max_thickness = max(2, height // 100)
+        rules = 0
+        run = 0
+        for y, level in enumerate(list(profile) + [0]):
+            if level * width >= min_length * 255:
+                start, end = _longest_run(mask.crop((0, y, width, y + 1)).tobytes(), 255)
+                if end - start >= min_length:
+                    run += 1
+                    continue
+            if 0 < run <= max_thickness:
+                rules += 1
+            run = 0
+        return rules
+
+    def classify_layout(self, frame: 'Frame') -> Optional[str]:
+        """
+        OCRの前に画像だけで判定できる難しいページの種類を返す
+
+        Args:
+            frame: ページの画面
+
+        Returns:
+            figure / table（どちらでもない場合None）
+        """
+        image = self.page_image(frame)
+        gray = image.convert('L')
+        if self.profiler.choose_profile(image, gray) == 'jpeg':
+            return 'figure'
+        small = gray.reduce(2) if min(gray.size) >= 1000 else gray
+        mask = small.point(lambda v: 255 if v < 128 else 0)
+        min_length = self.rule_ratio * min(mask.size)
+        if self.count_rules(mask, min_length) >= self.min_rules and \
+                self.count_rules(mask.transpose(Image.Transpose.ROTATE_90), min_length) >= self.min_rules:
+            return 'table'
+        return None
+
+    def route(self, frame: 'Frame') -> RouteDecision:
+        """
+        ページの文字起こしに使うエンジンを判定する
+
+        Args:
+            frame: ページの画面
+
+        Returns:
+            判定結果（engine が local の場合は text にローカルOCRの結果）
+        """
+        layout = self.classify_layout(frame)
+        if layout:
+            return RouteDecision('llm', layout, None, None)
+
+        try:
+            result = self.engine.recognize(self.page_image(frame))
+        except Exception as e:
+            print(f"  ⚠️ ローカルOCRエラー: {e}")
+            return RouteDecision('llm', 'local_error', None, None)
+
+        text = result.text.strip()
+        confidence = round(result.confidence, 1)
+        if result.blocks > self.max_blocks:
+            reason = 'mixed_layout'
+        elif len(text) < self.min_chars:
+            reason = 'little_text'
+        elif result.confidence < self.min_confidence:
+            reason = 'low_confidence'
+        else:
+            return RouteDecision('local', 'ok', text, confidence)
+        return RouteDecision('llm', reason, text, confidence)
+
+
+class RateLimiter:
+    """
+    リクエスト数/分とトークン数/分のトークンバケットによるレート制限
+
+    acquire() はバケットに余裕ができるまでブロックします。
+    送信前はトークン数を見積もりで差し引き、応答後に settle() で実際の使用量との差を精算します。
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        初期化
+
+        Args:
+            requests_per_minute: 1分あたりの最大リクエスト数（0の場合は制限なし）
+            tokens_per_minute: 1分あたりの最大トークン数（0の場合は制限なし）
+            clock: 経過時間の計測に使う関数
+            sleep: 待機に使う関数
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.throttled_seconds = 0.0
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0):
+        """
+        1リクエスト分（見積もりトークン数を含む）の枠を確保する
+
+        Args:
+            tokens: このリクエストの見積もりトークン数
+        """
+        while True:
+            wait = self.reserve(tokens)
+            if not wait:
+                return
+            self.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        """acquire() の非同期版（待機中もイベントループをブロックしない）"""
+        while True:
+            wait = self.reserve(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        枠に余裕があれば確保し、なければ確保できるまでの待機時間を返す（待機はしない）
+
+        Args:
+            tokens: このリクエストの見積もりトークン数
+
+        Returns:
+            確保できた場合0、できなかった場合は次に試すまでの待機時間（秒）
+        """
+        if self.tokens_per_minute:
+            # 1回のリクエストがバケットの容量を超える場合は満タンになるまで待つ
+            tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            self._refill()
+            waits = []
+            if self.requests_per_minute and self._requests < 1:
+                waits.append((1 - self._requests) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute and self._tokens < tokens:
+                waits.append((tokens - self._tokens) * 60 / self.tokens_per_minute)
+            if not waits:
+                if self.requests_per_minute:
+                    self._requests -= 1
+                if self.tokens_per_minute:
+                    self._tokens -= tokens
+                return 0.0
+            wait = max(waits)
+            self.throttled_seconds += wait
+            return wait
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """
+        見積もりと実際のトークン数の差を精算する
+
+        Args:
+            estimated_tokens: acquire() に渡した見積もりトークン数
+            actual_tokens: 実際に使用したトークン数
+        """
+        if not self.tokens_per_minute or not actual_tokens:
+            return
+        with self._lock:
+            self._tokens -= actual_tokens - estimated_tokens
+
+
+class RetryPolicy:
+    """
+    一時的なエラーに対するジッター付き指数バックオフと、実行全体の再試行回数の上限（リトライバジェット）
+    """
+
+    # 再試行するHTTPステータスコード
+    RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+    # 再試行する例外クラス名（google.api_coreの例外を直接importせずに判定するため）
+    RETRYABLE_NAMES = {
+        'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+        'DeadlineExceeded', 'GatewayTimeout', 'BadGateway'
+    }
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 retry_budget: int = 100, seed: Optional[int] = None):
+        """
+        初期化
+
+        Args:
+            max_retries: 1リクエストあたりの最大再試行回数
+            base_delay: 1回目の再試行までの待機時間の上限（秒）
+            max_delay: 待機時間の上限（秒）
+            retry_budget: 実行全体での再試行回数の上限
+            seed: ジッターの乱数のシード
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+        self.retries = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def is_retryable(self, error: Exception) -> bool:
+        """再試行すべきエラーかどうかを判定する"""
+        if isinstance(error, (TransientBackendError, TimeoutError, ConnectionError)):
+            return True
+        if getattr(error, 'code', None) in self.RETRYABLE_CODES:
+            return True
+        return type(error).__name__ in self.RETRYABLE_NAMES
+
+    def next_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """
+        次の再試行までの待機時間を返す
+
+        Args:
+            attempt: これまでの再試行回数
+            error: 発生したエラー
+
+        Returns:
+            待機時間（秒）。再試行しない場合None
+        """
+        if attempt >= self.max_retries or not self.is_retryable(error):
+            return None
+        with self._lock:
+            if self.retries >= self.retry_budget:
+                return None
+            self.retries += 1
+            # フルジッター: 0〜min(上限, base×2^attempt) の一様乱数
+            return self._random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class TranscriptionPipeline:
+    """
+    キャプチャループとLLM文字起こしを並行処理するワーカープール
+
+    キャプチャ側は submit() でスクリーンショットを投入するだけで次のページへ進めます。
+    キューが満杯の場合は submit() がブロックし、文字起こしが追いつくまで待機します（バックプレッシャー）。
+    ワーカー数が0の場合は submit() の中で同期的に文字起こしします。
+    いずれの場合もKindlePDFの ocr_batch_size ページずつまとめて文字起こしします。
+    """
+
+    def __init__(self, kindle_pdf: 'KindlePDF', num_workers: int = 2, queue_size: int = 4):
+        """
+        初期化
+
+        Args:
+            kindle_pdf: 文字起こしとテキスト保存を行うKindlePDFインスタンス
+            num_workers: 文字起こしワーカースレッド数（0の場合は同期処理）
+            queue_size: 文字起こし待ちキューの最大長
+        """
+        self.kindle_pdf = kindle_pdf
+        self.num_workers = max(0, num_workers)
+        self.batch_size = max(1, kindle_pdf.ocr_batch_size)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        # AsyncTranscriptionEngine と共通の属性（ワーカースレッドの文字起こしは取り消さない）
+        self.cancelled_pages: List[int] = []
+        self.interrupted: Optional[KeyboardInterrupt] = None
+        self.text_paths: Dict[int, Path] = {}
+        self.failed_pages: List[int] = []
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self._pending: List[Tuple[int, 'Frame']] = []
+
+    def start(self):
+        """ワーカースレッドを起動する"""
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker, name=f"ocr-worker-{i + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        if self._workers:
+            print(f"✅ 文字起こしワーカーを{self.num_workers}個起動しました（キュー長: {self.queue.maxsize}）")
+
+    def submit(self, page_number: int, frame: 'Frame'):
+        """
+        ページの画面を文字起こしキューに投入する（キューが満杯の場合はブロック）
+
+        Args:
+            page_number: ページ番号
+            frame: ページの画面（スクリーンショットのパスも可）
+        """
+        frame = Frame.of(frame)
+        if not self._workers:
+            # 同期処理: バッチがそろった時点で文字起こしする
+            self._pending.append((page_number, frame))
+            if len(self._pending) >= self.batch_size:
+                self._process(self._pending)
+                self._pending = []
+            return
+        if self.queue.full():
+            print(f"  ⏳ 文字起こしキューが満杯です。空きを待機中...")
+        self.queue.put((page_number, frame))
+        print(f"  📥 ページ {page_number} を文字起こしキューに追加しました")
+
+    def _process(self, batch: List[Tuple[int, 'Frame']]):
+        """バッチを文字起こしして結果を記録する"""
+        try:
+            results = self.kindle_pdf.transcribe_pages(batch)
+        except Exception as e:
+            print(f"  ❌ 文字起こしワーカーエラー: {e}")
+            results = {}
+        with self._lock:
+            for page_number, _ in batch:
+                text_path = results.get(page_number)
+                if text_path:
+                    self.text_paths[page_number] = text_path
+                else:
+                    self.failed_pages.append(page_number)
+
+    def _worker(self):
+        """キューからスクリーンショットをバッチ単位で取り出して文字起こし・保存する"""
+        while True:
+            batch = []
+            stop = False
+            while len(batch) < self.batch_size:
+                item = self.queue.get()
+                self.queue.task_done()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._process(batch)
+            if stop:
+                return
+
+    def close(self) -> Dict[int, Path]:
+        """
+        残りのキューを処理し終えてからワーカーを停止する
+
+        Returns:
+            ページ番号とテキストファイルパスの対応（ページ順）
+        """
+        if self._pending:
+            self._process(self._pending)
+            self._pending = []
+        if self._workers:
+            print(f"\n⏳ 残りの文字起こし（{self.queue.qsize()}件）の完了を待機中...")
+        for _ in self._workers:
+            self.queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        return dict(sorted(self.text_paths.items()))
+
+
+class AsyncTranscriptionEngine:
+    """
+    asyncioで複数のLLMリクエストを同時に送信する文字起こしエンジン
+
+    TranscriptionPipeline と同じく submit() でページを投入し、close() で完了を待ちます。
+    イベントループは専用のスレッドで動かし、同時に送信中のリクエストはセマフォで concurrency 件までに制限します。
+    完了していないリクエストが concurrency + queue_size 件に達すると submit() がブロックします（バックプレッシャー）。
+    cancel() は送信中・待機中のリクエストを取り消しますが、保存済みのページの結果は残します。
+    """
+
+    def __init__(self, kindle_pdf: 'KindlePDF', concurrency: int = 4, queue_size: int = 4,
+                 timeout: Optional[float] = None):
+        """
+        初期化
+
+        Args:
+            kindle_pdf: 文字起こしとテキスト保存を行うKindlePDFインスタンス
+            concurrency: 同時に送信するリクエスト数の上限
+            queue_size: 送信待ちにできるリクエスト数
+            timeout: 1回のリクエストのタイムアウト（秒、Noneの場合は無制限）
+        """
+        self.kindle_pdf = kindle_pdf
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.batch_size = max(1, kindle_pdf.ocr_batch_size)
+        self.text_paths: Dict[int, Path] = {}
+        self.failed_pages: List[int] = []
+        self.cancelled_pages: List[int] = []
+        # close() の待機中に中断された場合の例外（呼び出し側が結果ファイルを作成してから再送出する）
+        self.interrupted: Optional[KeyboardInterrupt] = None
+        self._slots = threading.Semaphore(self.concurrency + max(0, queue_size))
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._futures = set()
+        self._pending: List[Tuple[int, 'Frame']] = []
+
+    def start(self):
+        """イベントループのスレッドを起動する"""
+        self._loop = asyncio.new_event_loop()
+        # 画像の準備など、ブロックする処理を実行するスレッド
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ocr-async-io")
+        self._loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(target=self._run_loop, name="ocr-async", daemon=True)
+        self._thread.start()
+        print(f"✅ 非同期文字起こしを開始しました（同時リクエスト: {self.concurrency}件"
+              + (f"、タイムアウト: {self.timeout}秒" if self.timeout else "") + "）")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        # スレッドで実行中の処理（画像の準備など）の終了を待ってからループを閉じる
+        self._executor.shutdown(wait=True)
+        self._loop.close()
+
+    def submit(self, page_number: int, frame: 'Frame'):
+        """
+        ページの画面を文字起こしに投入する（未完了のリクエストが上限に達している場合はブロック）
+
+        Args:
+            page_number: ページ番号
+            frame: ページの画面（スクリーンショットのパスも可）
+        """
+        self._pending.append((page_number, Frame.of(frame)))
+        if len(self._pending) >= self.batch_size:
+            self._dispatch(self._pending)
+            self._pending = []
+
+    def _dispatch(self, batch: List[Tuple[int, 'Frame']]):
+        """バッチをイベントループに投入する"""
+        if not self._slots.acquire(blocking=False):
+            print(f"  ⏳ 文字起こしの待ちが上限に達しました。空きを待機中...")
+            self._slots.acquire()
+        future = asyncio.run_coroutine_threadsafe(self._transcribe(batch), self._loop)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        pages = ', '.join(str(page_number) for page_number, _ in batch)
+        print(f"  📥 ページ {pages} を文字起こしに投入しました")
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+        self._slots.release()
+
+    async def _transcribe(self, batch: List[Tuple[int, 'Frame']]):
+        """セマフォの枠を確保してバッチを文字起こしし、保存したページから順に結果を記録する"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        remaining = [page_number for page_number, _ in batch]
+        try:
+            async with self._semaphore:
+                async for page_number, text_path in self.kindle_pdf.transcribe_pages_async(batch, self.timeout):
+                    remaining.remove(page_number)
+                    with self._lock:
+                        if text_path:
+                            self.text_paths[page_number] = text_path
+                        else:
+                            self.failed_pages.append(page_number)
+        except asyncio.CancelledError:
+            with self._lock:
+                self.cancelled_pages.extend(remaining)
+            raise
+        except Exception as e:
+            print(f"  ❌ 文字起こしエラー: {e}")
+            with self._lock:
+                self.failed_pages.extend(remaining)
+
+    async def _cancel_all(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cancel(self):
+        """送信中・待機中のリクエストを取り消す（保存済みのページの結果は残る）"""
+        self._pending = []
+        if self._loop is None or not self._futures:
+            return
+        print(f"\n🛑 文字起こしのリクエスト（{len(self._futures)}件）を取り消します")
+        asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result()
+
+    def close(self) -> Dict[int, Path]:
+        """
+        残りのリクエストの完了を待ってからイベントループを停止する
+
+        待機中に中断（Ctrl-C）された場合は残りのリクエストを取り消し、中断の例外を interrupted に保存します
+        （例外は送出しないため、呼び出し側は保存済みのページで結果ファイルを作成してから interrupted を再送出します）。
+
+        Returns:
+            ページ番号とテキストファイルパスの対応（ページ順）
+        """
+        if self._loop is None:
+            return dict(sorted(self.text_paths.items()))
+        if self._pending:
+            self._dispatch(self._pending)
+            self._pending = []
+        with self._lock:
+            futures = list(self._futures)
+        if futures:
+            print(f"\n⏳ 残りの文字起こし（{len(futures)}件）の完了を待機中...")
+        try:
+            wait_futures(futures)
+        except KeyboardInterrupt as e:
+            print(f"\n⚠️ 文字起こしの完了待ちが中断されました")
+            self.interrupted = e
+            self.cancel()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+        if self.cancelled_pages:
+            print(f"  ⚠️ 文字起こしを取り消したページ: {len(self.cancelled_pages)}ページ")
+        return dict(sorted(self.text_paths.items()))
+
+
+def parse_batch_response(text: str, num_pages: int) -> Dict[int, str]:
+    """
+    複数ページをまとめて文字起こししたLLMの応答（JSON）を解析する
+
+    Args:
+        text: LLMの応答テキスト
+        num_pages: 送信したページ数
+
+    Returns:
+        ページの順番（1始まり）と文字起こし結果の対応（解析できたページのみ）
+    """
+    text = text.strip()
+    # ```json ... ``` で囲まれている場合は中身を取り出す
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    if isinstance(data, dict):
+        data = data.get('pages', [])
+    if not isinstance(data, list):
+        return {}
+
+    pages = {}
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get('page')
+        page_text = entry.get('text')
+        if isinstance(index, int) and 1 <= index <= num_pages and isinstance(page_text, str) and page_text.strip():
+            pages[index] = page_text.strip()
+    return pages
+
+
+def convert_to_rgb(img: 'Image.Image') -> 'Image.Image':
+    """
+    画像をPDF埋め込み用のRGB画像に変換する
+
+    RGBAの場合は白背景にアルファチャンネルをマスクとして合成します。
+
+    Args:
+        img: 変換する画像
+
+    Returns:
+        RGBモードの画像
+    """
+    if img.mode in ('RGBA', 'P'):
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'RGBA':
+            rgb_img.paste(img, mask=img.split()[3])  # アルファチャンネルをマスクとして使用
+        else:
+            rgb_img.paste(img)
+        return rgb_img
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def png_idat(png_data: bytes) -> bytes:
+    """
+    PNGファイルからIDATチャンクの中身（PNG予測付きのzlibストリーム）を取り出す
+
+    PDFの FlateDecode（/Predictor 15）はこのストリームをそのまま扱えるため、
+    Pillowの高速なPNGエンコーダで画素の圧縮を行えます。
+
+    Args:
+        png_data: PNGファイルの内容
+
+    Returns:
+        連結したIDATチャンクのデータ
+    """
+    chunks = []
+    pos = 8
+    while pos < len(png_data):
+        length, chunk_type = struct.unpack('>I4s', png_data[pos:pos + 8])
+        if chunk_type == b'IDAT':
+            chunks.append(png_data[pos + 8:pos + 8 + length])
+        elif chunk_type == b'IEND':
+            break
+        pos += 12 + length
+    return b''.join(chunks)
+
+
+class EncodedPage(NamedTuple):
+    """PDFに埋め込むために圧縮したページ画像"""
+    width: int
+    height: int
+    resolution: float
+    profile: str
+    image_params: str
+    data: bytes
+
+
+class PDFPageEncoder:
+    """
+    ページ画像を出力プロファイルに応じた形式に圧縮するエンコーダ
+
+    ファイルの状態を持たないため、別プロセスに渡して並列にエンコードできます。
+
+    出力プロファイル:
+        jpeg: カラーのJPEG（DCTDecode）。挿絵や写真のあるページ向け
+        gray: 可逆圧縮のグレースケール（FlateDecode）
+        bilevel: 白黒2値のCCITT G4（CCITTFaxDecode）。文字だけのページ向け
+        auto: ページごとに色の有無と中間調の割合から上記を選択
+    """
+
+    PROFILES = ('auto', 'jpeg', 'gray', 'bilevel')
+
+    # auto で色付きとみなす彩度・明度と、色付き画素の割合の下限
+    COLOR_LEVEL = 48
+    COLOR_RATIO = 0.025
+    # auto で白黒2値にする中間調（明度48〜207）の割合の上限と、写真とみなしてJPEGにする下限
+    BILEVEL_MIDTONE_RATIO = 0.06
+    PHOTO_MIDTONE_RATIO = 0.3
+
+    def __init__(self, resolution: Optional[float] = 100.0, jpeg_quality: int = 75, profile: str = 'jpeg',
+                 bilevel_threshold: int = 128):
+        """
+        初期化
+
+        Args:
+            resolution: 画像の解像度（DPI）。Noneの場合は画像に記録された解像度、記録がなければ100
+            jpeg_quality: ページ画像のJPEG品質
+            profile: 出力プロファイル（auto / jpeg / gray / bilevel）
+            bilevel_threshold: 白黒2値にするときの明度のしきい値
+        """
+        if profile not in self.PROFILES:
+            raise ValueError(f"不明なPDF出力プロファイルです: {profile}")
+        self.resolution = resolution
+        self.jpeg_quality = jpeg_quality
+        self.profile = profile
+        self.bilevel_threshold = bilevel_threshold
+
+    def choose_profile(self, img: 'Image.Image', gray: 'Image.Image') -> str:
+        """
+        auto プロファイルでページに使う形式を選ぶ
+
+        Args:
+            img: RGBのページ画像
+            gray: グレースケールのページ画像
+
+        Returns:
+            jpeg / gray / bilevel のいずれか
+        """
+        profile = self.classify(img, gray)
+        if profile == 'bilevel' and not features.check('libtiff'):
+            return 'gray'
+        return profile
+
+    @classmethod
+    def classify(cls, img: 'Image.Image', gray: 'Image.Image') -> str:
+        """
+        色の有無と中間調の割合からページの種類を判定する（LLMへのアップロード画像の選択にも使用）
+
+        Args:
+            img: RGBのページ画像
+            gray: グレースケールのページ画像
+
+        Returns:
+            jpeg（色付き・写真）/ gray / bilevel（文字だけ）のいずれか
+        """
+        # 色の判定は縮小画像で十分（中間調は縮小で増えるため元の解像度で数える）
+        small = img.reduce(4) if min(img.size) >= 64 else img
+        _, saturation, value = small.convert('HSV').split()
+        color_mask = ImageChops.multiply(
+            saturation.point(lambda v: 255 if v > cls.COLOR_LEVEL else 0),
+            value.point(lambda v: 255 if v > cls.COLOR_LEVEL else 0)
+        )
+        if color_mask.histogram()[255] > cls.COLOR_RATIO * small.width * small.height:
+            return 'jpeg'
+
+        histogram = gray.histogram()
+        midtone_ratio = sum(histogram[48:208]) / (gray.width * gray.height)
+        if midtone_ratio > cls.PHOTO_MIDTONE_RATIO:
+            return 'jpeg'
+        if midtone_ratio <= cls.BILEVEL_MIDTONE_RATIO:
+            return 'bilevel'
+        return 'gray'
+
+    def _encode_jpeg(self, img: 'Image.Image') -> Tuple[str, bytes]:
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=self.jpeg_quality)
+        return '/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode', buffer.getvalue()
+
+    def _encode_gray(self, gray: 'Image.Image') -> Tuple[str, bytes]:
+        buffer = io.BytesIO()
+        gray.save(buffer, format='PNG', compress_level=6)
+        return (f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode '
+                f'/DecodeParms << /Predictor 15 /Colors 1 /BitsPerComponent 8 /Columns {gray.width} >>',
+                png_idat(buffer.getvalue()))
+
+    def _encode_bilevel(self, gray: 'Image.Image') -> Tuple[str, bytes]:
+        threshold = self.bilevel_threshold
+        bilevel = gray.point(lambda v: 255 if v >= threshold else 0, '1')
+        buffer = io.BytesIO()
+        # 1ストリップにまとめて保存し、G4の符号化データだけを取り出す
+        bilevel.save(buffer, format='TIFF', compression='group4', tiffinfo={278: bilevel.height})
+        with Image.open(io.BytesIO(buffer.getvalue())) as tiff:
+            offset = tiff.tag_v2[273][0]
+            length = tiff.tag_v2[279][0]
+            # Photometric=1（0が黒）の場合、黒の画素は符号上「白」の連として書かれている
+            black_is_1 = 'true' if tiff.tag_v2.get(262, 0) == 1 else 'false'
+        return (f'/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /CCITTFaxDecode '
+                f'/DecodeParms << /K -1 /Columns {bilevel.width} /Rows {bilevel.height} /BlackIs1 {black_is_1} >>',
+                buffer.getvalue()[offset:offset + length])
+
+    def encode(self, img: 'Image.Image') -> EncodedPage:
+        """
+        ページ画像を圧縮する
+
+        Args:
+            img: ページ画像（RGB以外はRGBに変換されます）
+
+        Returns:
+            圧縮したページ画像
+        """
+        resolution = self.resolution
+        if resolution is None:
+            resolution = float(img.info.get('dpi', (100.0, 100.0))[0]) or 100.0
+        img = convert_to_rgb(img)
+
+        profile = self.profile
+        gray = None
+        if profile != 'jpeg':
+            gray = img.convert('L')
+        if profile == 'auto':
+            profile = self.choose_profile(img, gray)
+        if profile == 'bilevel' and not features.check('libtiff'):
+            # G4の符号化にはlibtiff付きのPillowが必要
+            profile = 'gray'
+
+        if profile == 'jpeg':
+            image_params, image_data = self._encode_jpeg(img)
+        elif profile == 'gray':
+            image_params, image_data = self._encode_gray(gray)
+        else:
+            image_params, image_data = self._encode_bilevel(gray)
+        return EncodedPage(img.width, img.height, resolution, profile, image_params, image_data)
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Geminiが画像1枚に使う入力トークン数の目安を計算する
+
+    縦横とも384ピクセル以下の画像は258トークン、それより大きい画像は768ピクセル四方のタイルごとに258トークンです。
+
+    Args:
+        width: 画像の幅
+        height: 画像の高さ
+
+    Returns:
+        トークン数
+    """
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * max(1, -(-width // 768)) * max(1, -(-height // 768))
+
+
+class UploadPayload(NamedTuple):
+    """LLMにアップロードするために圧縮したページ画像"""
+    mime_type: str
+    data: bytes
+    width: int
+    height: int
+    profile: str
+
+    def part(self) -> dict:
+        """LLMバックエンドに渡す画像のパーツ"""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+class UploadEncoder:
+    """
+    文字起こし用にLLMへアップロードするページ画像を作るエンコーダ
+
+    文字だけのページは色も中間調もほとんど使わないため、グレースケールや白黒2値にして
+    解像度を下げてもLLMの文字起こしの精度はほとんど変わらず、アップロードするデータ量と画像のトークン数を減らせます。
+    ファイルの状態を持たないため、別プロセスに渡して並列にエンコードできます。
+
+    アップロードプロファイル:
+        jpeg: カラーのJPEG（従来の形式）
+        gray: グレースケールのJPEG
+        bilevel: 白黒2値のPNG。文字だけのページ向け
+        auto: ページごとに PDFPageEncoder.classify() の判定で上記を選択
+    """
+
+    PROFILES = ('auto', 'jpeg', 'gray', 'bilevel')
+
+    # 長辺の最大ピクセル数の既定値（カラーのページは挿絵や写真の細部を残すため大きめにする）
+    DEFAULT_MAX_SIZE = {'jpeg': 2048, 'gray': 1600, 'bilevel': 1600}
+
+    def __init__(self, profile: str = 'jpeg', max_size: Optional[int] = None, jpeg_quality: int = 90,
+                 bilevel_threshold: int = 160):
+        """
+        初期化
+
+        Args:
+            profile: アップロードプロファイル（auto / jpeg / gray / bilevel）
+            max_size: 長辺の最大ピクセル数（超える場合は縮小。指定しない場合はプロファイルごとの既定値）
+            jpeg_quality: JPEGの品質
+            bilevel_threshold: 白黒2値にするときの明度のしきい値（縮小後の画像に適用するため、細い線が消えないよう高めにする）
+        """
+        if profile not in self.PROFILES:
+            raise ValueError(f"不明なアップロードプロファイルです: {profile}")
+        self.profile = profile
+        self.max_size = max_size
+        self.jpeg_quality = jpeg_quality
+        self.bilevel_threshold = bilevel_threshold
+
+    @property
+    def key(self) -> tuple:
+        """エンコード結果をフレームにキャッシュするためのキー"""
+        return ('upload', self.profile, self.max_size, self.jpeg_quality, self.bilevel_threshold)
+
+    @property
+    def label(self) -> str:
+        """表示用の設定名（例: gray@1600）"""
+        return f"{self.profile}@{self.max_size}" if self.max_size else self.profile
+
+    @staticmethod
+    def resize(img: 'Image.Image', max_size: int) -> 'Image.Image':
+        """長辺が max_size を超える場合に縮小した別の画像を返す（共有している画像は変更しない）"""
+        if max(img.size) <= max_size:
+            return img
+        scale = max_size / max(img.size)
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    def encode(self, img: 'Image.Image') -> UploadPayload:
+        """
+        ページ画像をアップロード用に圧縮する
+
+        Args:
+            img: RGBのページ画像
+
+        Returns:
+            圧縮したページ画像
+        """
+        profile = self.profile
+        gray = None
+        if profile != 'jpeg':
+            gray = img.convert('L')
+        if profile == 'auto':
+            # 中間調は縮小で増えるため、判定は縮小前の画像で行う
+            profile = PDFPageEncoder.classify(img, gray)
+        max_size = self.max_size or self.DEFAULT_MAX_SIZE[profile]
+
+        buffer = io.BytesIO()
+        if profile == 'jpeg':
+            page = self.resize(img, max_size)
+            page.save(buffer, format='JPEG', quality=self.jpeg_quality)
+            mime_type = 'image/jpeg'
+        elif profile == 'gray':
+            page = self.resize(gray, max_size)
+            page.save(buffer, format='JPEG', quality=self.jpeg_quality)
+            mime_type = 'image/jpeg'
+        else:
+            # 縮小してから2値にすると、縮小で細くなった文字の線が途切れにくい
+            threshold = self.bilevel_threshold
+            page = self.resize(gray, max_size).point(lambda v: 255 if v >= threshold else 0, '1')
+            page.save(buffer, format='PNG', optimize=True)
+            mime_type = 'image/png'
+        return UploadPayload(mime_type, buffer.getvalue(), page.width, page.height, profile)
+
+
+class StreamingPDFWriter:
+    """
+    ページを1枚ずつ追記していくPDFライター
+
+    画像は追加された時点で出力プロファイルに応じた形式に圧縮してファイルへ書き出すため、
+    メモリ上に保持するデコード済み画像は常に1枚だけです。
+    別プロセスで圧縮済みのページは add_encoded_page() で追記できます。
+    ページツリーとxref/trailerは close() で最後に書き込みます。
+    書き込み中は「.part」付きの一時ファイルに出力し、close() で本来のファイル名に変更します。
+
+    append=True の場合は既存のPDFの末尾に増分更新（新しいページのオブジェクト・ページツリー・xref）を追加します。
+    既存のページは読み直しも再圧縮もしないため、追記にかかる時間は新しいページ数だけで決まります。
+    増分は一時ファイルに書き込み、close() で既存のPDFの末尾に連結します。
+    """
+
+    PROFILES = PDFPageEncoder.PROFILES
+
+    def __init__(self, pdf_path: Path, resolution: Optional[float] = 100.0, jpeg_quality: int = 75,
+                 profile: str = 'jpeg', bilevel_threshold: int = 128, append: bool = False):
+        """
+        初期化
+
+        Args:
+            pdf_path: 出力PDFファイルのパス
+            resolution: 画像の解像度（DPI）。ページサイズ（pt）= ピクセル数 × 72 / resolution
+                        （Noneの場合は画像に記録された解像度、記録がなければ100）
+            jpeg_quality: ページ画像のJPEG品質
+            profile: 出力プロファイル（auto / jpeg / gray / bilevel、PDFPageEncoder を参照）
+            bilevel_threshold: 白黒2値にするときの明度のしきい値
+            append: 既存のPDF（pdf_path）にページを追記するかどうか
+        """
+        self.encoder = PDFPageEncoder(resolution, jpeg_quality, profile, bilevel_threshold)
+        self.pdf_path = Path(pdf_path)
+        self.resolution = resolution
+        self.jpeg_quality = jpeg_quality
+        self.profile = profile
+        self.page_count = 0
+        self.image_bytes = 0
+        # 最後に追加したページに使った解像度（resolution がNoneの場合は画像ごとに決まる）
+        self.page_resolution = resolution
+        self.profile_counts = {name: 0 for name in self.PROFILES if name != 'auto'}
+        self._part_path = self.pdf_path.with_name(self.pdf_path.name + '.part')
+        self._offsets: Dict[int, int] = {}
+        self._page_refs: List[int] = []
+        # 追記する場合の既存のPDFの状態（サイズ・最後のxrefの位置・ページ数・壊れた末尾から切り詰めたバイト数）
+        self._base_offset = 0
+        self._prev_xref: Optional[int] = None
+        # 前回の trailer から引き継ぐ項目（/Info・/ID）と、既存のPDFが改行で終わっていない場合に増分の前に入れる改行
+        self._trailer_extra = b''
+        self._separator = b''
+        self.existing_pages = 0
+        self.recovered_bytes = 0
+        # close() で書き込んだバイト数（追記の場合は増分のサイズ）
+        self.written_bytes = 0
+        # 1: カタログ、2: ページツリー（ページツリーは最後に書き込む）
+        self._root_obj = 1
+        self._pages_obj = 2
+        self._next_obj = 3
+        if append:
+            self._load_existing()
+        self._file = open(self._part_path, 'wb')
+        self._file.write(self._separator)
+        if not append:
+            self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+            self._write_obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    def __enter__(self) -> 'StreamingPDFWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _load_existing(self):
+        """
+        追記する既存のPDFの最後の更新（xref・trailer・ページツリー）を読み込む
+
+        前回の追記が中断されて最後の %%EOF の後ろに書きかけのデータが残っている場合は切り詰めます。
+        このアプリで作成したPDF（相互参照表が xref ストリームでないもの）だけに対応します。
+        """
+        with open(self.pdf_path, 'r+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            # 最後の %%EOF を後ろから探す
+            while end > 0:
+                start = max(0, end - 65536)
+                f.seek(start)
+                chunk = f.read(min(end + 5, size) - start)
+                pos = chunk.rfind(b'%%EOF')
+                if pos >= 0:
+                    end = start + pos + 5
+                    break
+                end = start
+            if end <= 0:
+                raise ValueError(f"PDFの終わり（%%EOF）が見つかりません: {self.pdf_path}")
+            f.seek(end)
+            eol = f.read(2)
+            if eol.startswith(b'\r\n'):
+                end += 2
+            elif eol[:1] in (b'\r', b'\n'):
+                end += 1
+            else:
+                # PillowなどはPDFを %%EOF で終えるため、増分の最初のオブジェクトとの間に改行を入れる
+                self._separator = b'\n'
+            if end < size:
+                f.truncate(end)
+                self.recovered_bytes = size - end
+
+            f.seek(max(0, end - 1024))
+            match = re.search(rb'startxref\s+(\d+)\s+%%EOF\s*$', f.read())
+            if not match:
+                raise ValueError(f"PDFの startxref が見つかりません: {self.pdf_path}")
+            self._prev_xref = int(match.group(1))
+
+            offsets: Dict[int, int] = {}
+            trailer = None
+            extra: Dict[bytes, bytes] = {}
+            xref_offset: Optional[int] = self._prev_xref
+            while xref_offset is not None:
+                section_trailer = self._read_xref_section(f, xref_offset, offsets)
+                trailer = trailer or section_trailer
+                # 文書情報（/Info）とファイルの識別子（/ID）は最も新しい trailer のものを引き継ぐ
+                for key, pattern in ((b'/Info', rb'/Info\s+\d+\s+\d+\s+R'), (b'/ID', rb'/ID\s*\[[^\]]*\]')):
+                    match = re.search(pattern, section_trailer)
+                    if match and key not in extra:
+                        extra[key] = match.group(0)
+                prev = re.search(rb'/Prev\s+(\d+)', section_trailer)
+                xref_offset = int(prev.group(1)) if prev else None
+            size_match = re.search(rb'/Size\s+(\d+)', trailer)
+            root_match = re.search(rb'/Root\s+(\d+)\s+0\s+R', trailer)
+            if not size_match or not root_match:
+                raise ValueError(f"PDFの trailer を読み込めません: {self.pdf_path}")
+            self._next_obj = int(size_match.group(1))
+            self._root_obj = int(root_match.group(1))
+
+            pages_match = re.search(rb'/Pages\s+(\d+)\s+0\s+R', self._read_object(f, offsets, self._root_obj))
+            if not pages_match:
+                raise ValueError(f"PDFのページツリーが見つかりません: {self.pdf_path}")
+            self._pages_obj = int(pages_match.group(1))
+            page_tree = self._read_object(f, offsets, self._pages_obj)
+            kids = re.search(rb'/Kids\s*\[([^\]]*)\]', page_tree)
+            if b'/Type /Pages' not in page_tree or not kids:
+                raise ValueError(f"PDFのページツリーを読み込めません: {self.pdf_path}")
+            self._page_refs = [int(ref) for ref in re.findall(rb'(\d+)\s+0\s+R', kids.group(1))]
+            # 入れ子のページツリー（このアプリでは作らない）には追記できない
+            if self._page_refs and b'/Type /Pages' in self._read_object(f, offsets, self._page_refs[0]):
+                raise ValueError(f"入れ子のページツリーを持つPDFには追記できません: {self.pdf_path}")
+            self.existing_pages = len(self._page_refs)
+            self._base_offset = end
+            self._trailer_extra = b''.join(b' ' + value for value in extra.values())
+
+    @staticmethod
+    def _read_xref_section(f, offset: int, offsets: Dict[int, int]) -> bytes:
+        """xrefの1つの区間を読み込み、まだ読み込んでいないオブジェクトの位置を offsets に加えて trailer を返す"""
+        f.seek(offset)
+        if f.readline().strip() != b'xref':
+            raise ValueError("xref ストリームを使ったPDFには追記できません")
+        while True:
+            line = f.readline().strip()
+            if line.startswith(b'trailer'):
+                break
+            first, count = (int(value) for value in line.split())
+            for obj_num in range(first, first + count):
+                entry = f.readline().split()
+                if entry[2] == b'n':
+                    offsets.setdefault(obj_num, int(entry[0]))
+        trailer = line
+        while b'startxref' not in trailer:
+            chunk = f.readline()
+            if not chunk:
+                break
+            trailer += chunk
+        return trailer
+
+    @staticmethod
+    def _read_object(f, offsets: Dict[int, int], obj_num: int) -> bytes:
+        """オブジェクトの先頭から endobj（ストリームを持つ場合は stream）までを読み込む"""
+        if obj_num not in offsets:
+            raise ValueError(f"PDFのオブジェクト {obj_num} が見つかりません")
+        f.seek(offsets[obj_num])
+        data = b''
+        while True:
+            chunk = f.read(65536)
+            data += chunk
+            ends = [pos for pos in (data.find(b'endobj'), data.find(b'stream')) if pos >= 0]
+            if ends:
+                return data[:min(ends)]
+            if not chunk:
+                return data
+
+    def _alloc_obj(self) -> int:
+        obj_num = self._next_obj
+        self._next_obj += 1
+        return obj_num
+
+    def _write_obj(self, obj_num: int, body: bytes, stream: Optional[bytes] = None):
+        self._offsets[obj_num] = self._base_offset + self._file.tell()
+        self._file.write(f'{obj_num} 0 obj\n'.encode('ascii'))
+        self._file.write(body)
+        if stream is not None:
+            self._file.write(b'\nstream\n')
+            self._file.write(stream)
+            self._file.write(b'\nendstream')
+        self._file.write(b'\nendobj\n')
+
+    def add_page(self, img: 'Image.Image'):
+        """
+        1ページ追加する
+
+        Args:
+            img: ページ画像（RGB以外はRGBに変換されます）
+        """
+        self.add_encoded_page(self.encoder.encode(img))
+
+    def add_encoded_page(self, page: EncodedPage):
+        """
+        圧縮済みのページを1ページ追加する
+
+        Args:
+            page: PDFPageEncoder.encode() の結果
+        """
+        page_width = page.width * 72.0 / page.resolution
+        page_height = page.height * 72.0 / page.resolution
+        self.page_resolution = page.resolution
+
+        image_obj = self._alloc_obj()
+        self._write_obj(
+            image_obj,
+            (f'<< /Type /XObject /Subtype /Image /Width {page.width} /Height {page.height} '
+             f'{page.image_params} /Length {len(page.data)} >>').encode('ascii'),
+            page.data
+        )
+
+        content = f'q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q'.encode('ascii')
+        content_obj = self._alloc_obj()
+        self._write_obj(content_obj, f'<< /Length {len(content)} >>'.encode('ascii'), content)
+
+        page_obj = self._alloc_obj()
+        self._write_obj(
+            page_obj,
+            (f'<< /Type /Page /Parent {self._pages_obj} 0 R /MediaBox [0 0 {page_width:.4f} {page_height:.4f}] '
+             f'/Resources << /ProcSet [/PDF /ImageB /ImageC] /XObject << /Im0 {image_obj} 0 R >> >> '
+             f'/Contents {content_obj} 0 R >>').encode('ascii')
+        )
+        self._page_refs.append(page_obj)
+        self.page_count += 1
+        self.image_bytes += len(page.data)
+        self.profile_counts[page.profile] += 1
+
+    def close(self) -> Path:
+        """
+        ページツリーとxref/trailerを書き込んでPDFを完成させる
+
+        追記の場合は、書き込んだ増分（新しいオブジェクトと前回のxrefを /Prev で参照するxref）を
+        既存のPDFの末尾に連結します。
+
+        Returns:
+            完成したPDFファイルのパス
+        """
+        kids = ' '.join(f'{ref} 0 R' for ref in self._page_refs)
+        self._write_obj(
+            self._pages_obj,
+            f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_refs)} >>'.encode('ascii')
+        )
+
+        xref_offset = self._base_offset + self._file.tell()
+        size = self._next_obj
+        # 新規作成の場合は0番（空き）から全オブジェクト、追記の場合は0番と書き込んだオブジェクトだけを連続する区間ごとに並べる
+        obj_nums = [0] + sorted(self._offsets) if self._prev_xref is not None else list(range(size))
+        lines = ['xref\n']
+        section_start = 0
+        for i in range(1, len(obj_nums) + 1):
+            if i < len(obj_nums) and obj_nums[i] == obj_nums[i - 1] + 1:
+                continue
+            section = obj_nums[section_start:i]
+            lines.append(f'{section[0]} {len(section)}\n')
+            for obj_num in section:
+                lines.append('0000000000 65535 f \n' if obj_num == 0 else f'{self._offsets[obj_num]:010d} 00000 n \n')
+            section_start = i
+        prev = f' /Prev {self._prev_xref}' if self._prev_xref is not None else ''
+        extra = self._trailer_extra.decode('latin-1')
+        lines.append(f'trailer\n<< /Size {size} /Root {self._root_obj} 0 R{extra}{prev} >>\nstartxref\n{xref_offset}\n%%EOF\n')
+        self._file.write(''.join(lines).encode('latin-1'))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.written_bytes = self._file.tell()
+        self._file.close()
+        if self._prev_xref is None:
+            os.replace(self._part_path, self.pdf_path)
+            return self.pdf_path
+
+        with open(self.pdf_path, 'r+b') as pdf_file:
+            if pdf_file.seek(0, os.SEEK_END) != self._base_offset:
+                raise ValueError(f"追記中にPDFが変更されました: {self.pdf_path}")
+            with open(self._part_path, 'rb') as part_file:
+                shutil.copyfileobj(part_file, pdf_file, 1024 * 1024)
+            pdf_file.flush()
+            os.fsync(pdf_file.fileno())
+        self._part_path.unlink()
+        return self.pdf_path
+
+    def abort(self):
+        """書き込み途中のPDFを破棄する"""
+        if not self._file.closed:
+            self._file.close()
+        if self._part_path.exists():
+            self._part_path.unlink()
+
+
+class PageSettleDetector:
+    """
+    ページめくり後の描画完了（画面の静止）を検出する
+
+    低解像度のグレースケール縮小フレームを短い間隔で取得し、
+    ページめくり前のフレームから変化した後、連続するフレームの差分がなくなった時点で
+    描画完了とみなします。一定時間内に静止しない場合はタイムアウトします。
+    """
+
+    # 比較用に縮小するフレームのサイズ
+    FINGERPRINT_SIZE = (64, 64)
+
+    def __init__(self, frame_source: Callable[[], 'Image.Image'], poll_interval: float = 0.1,
+                 stable_frames: int = 2, timeout: float = 5.0, threshold: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        初期化
+
+        Args:
+            frame_source: 現在の画面を返す関数
+            poll_interval: フレームを取得する間隔（秒）
+            stable_frames: 描画完了とみなすのに必要な、変化のない連続フレーム比較の回数
+            timeout: 描画完了を待つ最大時間（秒）
+            threshold: フレームが変化したとみなす平均画素差（0〜255）
+            clock: 経過時間の計測に使う関数
+            sleep: 待機に使う関数
+        """
+        self.frame_source = frame_source
+        self.poll_interval = poll_interval
+        self.stable_frames = max(1, stable_frames)
+        self.timeout = timeout
+        self.threshold = threshold
+        self.clock = clock
+        self.sleep = sleep
+
+    @classmethod
+    def fingerprint(cls, img: 'Image.Image') -> 'Image.Image':
+        """比較用の低解像度グレースケール画像を作る"""
+        return img.convert('L').resize(cls.FINGERPRINT_SIZE, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    @staticmethod
+    def difference(a: 'Image.Image', b: 'Image.Image') -> float:
+        """2つの縮小フレームの平均画素差を返す"""
+        return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
+
+    def snapshot(self) -> 'Image.Image':
+        """現在の画面の縮小フレームを取得する"""
+        return self.fingerprint(self.frame_source())
+
+    def wait(self, reference: Optional['Image.Image'] = None) -> Tuple[float, bool]:
+        """
+        画面が静止するまで待機する
+
+        Args:
+            reference: ページめくり前の縮小フレーム。指定した場合は、まずこのフレームから
+                変化するのを待ってから静止を判定します
+
+        Returns:
+            (経過時間（秒）, タイムアウトした場合True)
+        """
+        start = self.clock()
+        changed = reference is None
+        previous = None
+        stable = 0
+        while True:
+            self.sleep(self.poll_interval)
+            frame = self.snapshot()
+            elapsed = self.clock() - start
+
+            if not changed and self.difference(frame, reference) > self.threshold:
+                changed = True
+            elif changed and previous is not None:
+                if self.difference(frame, previous) <= self.threshold:
+                    stable += 1
+                else:
+                    stable = 0
+                if stable >= self.stable_frames:
+                    return elapsed, False
+
+            if elapsed >= self.timeout:
+                return elapsed, True
+            previous = frame
+
+
+class LowResFrameSource:
+    """
+    画面の静止検出用に、画面の中央部分を低解像度で取得するフレームソース
+
+    画面全体をRetinaの解像度でキャプチャしてから縮小すると、1フレームに数百ミリ秒かかり、
+    0.1秒間隔の比較に間に合いません。ページの描画の変化は画面の中央部分だけで判定できるため、
+    Quartz（CGWindowListCreateImage）で中央部分を論理解像度（Retinaの1/2）のままメモリ上に取得します。
+    Quartzを読み込めない場合は screencapture の範囲指定（-R）で中央部分だけを小さなJPEGに保存して読み込みます。
+    """
+
+    def __init__(self, region_ratio: float = 0.5, screen_size: Optional[Callable[[], Tuple[int, int]]] = None,
+                 runner: Callable = subprocess.run, use_quartz: Optional[bool] = None):
+        """
+        初期化
+
+        Args:
+            region_ratio: 取得する中央部分の幅・高さの画面に対する割合（0〜1）
+            screen_size: 画面の論理サイズ（ポイント）を返す関数（指定しない場合は pyautogui.size()）
+            runner: screencapture の実行に使う関数（subprocess.run と同じ引数）
+            use_quartz: Quartzを使うかどうか（指定しない場合は読み込めれば使う）
+        """
+        self.region_ratio = min(1.0, max(0.05, region_ratio))
+        self.screen_size = screen_size or (lambda: tuple(pyautogui.size()))
+        self.runner = runner
+        self.use_quartz = use_quartz
+        self._region: Optional[Tuple[int, int, int, int]] = None
+        self._temp_path = Path(tempfile.gettempdir()) / f"kindle_ocr_settle_{os.getpid()}.jpg"
+
+    @property
+    def region(self) -> Tuple[int, int, int, int]:
+        """取得する範囲（x, y, 幅, 高さ、ポイント単位）。初回に画面のサイズから計算する"""
+        if self._region is None:
+            width, height = self.screen_size()
+            region_width = max(1, int(width * self.region_ratio))
+            region_height = max(1, int(height * self.region_ratio))
+            self._region = ((width - region_width) // 2, (height - region_height) // 2, region_width, region_height)
+        return self._region
+
+    def __call__(self) -> 'Image.Image':
+        if self.use_quartz is None:
+            self.use_quartz = Quartz.available()
+        if self.use_quartz:
+            return self._grab_quartz()
+        return self._grab_screencapture()
+
+    def _grab_quartz(self) -> 'Image.Image':
+        x, y, width, height = self.region
+        image = Quartz.CGWindowListCreateImage(
+            Quartz.CGRectMake(x, y, width, height),
+            Quartz.kCGWindowListOptionOnScreenOnly,
+            Quartz.kCGNullWindowID,
+            Quartz.kCGWindowImageNominalResolution
+        )
+        if image is None:
+            raise RuntimeError("画面を取得できません（画面収録の許可を確認してください）")
+        data = Quartz.CGDataProviderCopyData(Quartz.CGImageGetDataProvider(image))
+        size = (Quartz.CGImageGetWidth(image), Quartz.CGImageGetHeight(image))
+        return Image.frombuffer('RGBA', size, bytes(data), 'raw', 'BGRA', Quartz.CGImageGetBytesPerRow(image), 1)
+
+    def _grab_screencapture(self) -> 'Image.Image':
+        x, y, width, height = self.region
+        self.runner(
+            ['screencapture', '-x', '-t', 'jpg', f'-R{x},{y},{width},{height}', str(self._temp_path)],
+            check=True,
+            capture_output=True
+        )
+        try:
+            with Image.open(self._temp_path) as img:
+                img.draft('L', (width // 4, height // 4))
+                return img.convert('L')
+        finally:
+            try:
+                self._temp_path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class AppleScriptHost:
+    """
+    常駐させた1つのosascript（JavaScript for Automation）プロセスにコマンドを送るホスト
+
+    呼び出しのたびにosascriptを起動する代わりに、標準入力から1行ずつコマンドを受け取り
+    「ok 結果」または「error 内容」の1行を返すスクリプトを常駐させます。
+    プロセスが終了・応答しなくなった場合は次の呼び出しで再起動します。
+    """
+
+    SCRIPT = r'''
+ObjC.import('Foundation');
+var stdin = $.NSFileHandle.fileHandleWithStandardInput;
+var stdout = $.NSFileHandle.fileHandleWithStandardOutput;
+var systemEvents = Application('System Events');
+function reply(text) {
+    stdout.writeData($(text + '\n').dataUsingEncoding($.NSUTF8StringEncoding));
+}
+var buffer = '';
+while (true) {
+    var data = stdin.availableData;
+    if (data.length == 0) break;
+    buffer += $.NSString.alloc.initWithDataEncoding(data, $.NSUTF8StringEncoding).js;
+    var index;
+    while ((index = buffer.indexOf('\n')) >= 0) {
+        var line = buffer.slice(0, index);
+        buffer = buffer.slice(index + 1);
+        try {
+            if (line == 'frontmost') {
+                reply('ok ' + systemEvents.applicationProcesses.whose({frontmost: true})[0].name());
+            } else if (line.indexOf('activate ') == 0) {
+                Application(line.slice(9)).activate();
+                reply('ok');
+            } else if (line.indexOf('raise ') == 0) {
+                systemEvents.processes.byName(line.slice(6)).frontmost = true;
+                reply('ok');
+            } else {
+                reply('error unknown command: ' + line);
+            }
+        } catch (e) {
+            reply('error ' + e);
+        }
+    }
+}
+'''
+
+    def __init__(self):
+        self._process: Optional[subprocess.Popen] = None
+        self._lines: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            ['osascript', '-l', 'JavaScript', '-e', self.SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_lines, args=(self._process, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _read_lines(process: subprocess.Popen, lines: queue.Queue):
+        for line in process.stdout:
+            lines.put(line.rstrip('\n'))
+        lines.put(None)
+
+    def call(self, command: str, timeout: float = 5.0) -> str:
+        """
+        コマンドを送信して結果を返す
+
+        Args:
+            command: 「frontmost」「activate アプリ名」「raise プロセス名」のいずれか
+            timeout: 応答を待つ最大時間（秒）
+
+        Returns:
+            コマンドの結果
+
+        Raises:
+            RuntimeError: コマンドが失敗した場合、またはホストが応答しない場合
+        """
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            try:
+                self._process.stdin.write(command + '\n')
+                self._process.stdin.flush()
+                line = self._lines.get(timeout=timeout)
+            except (OSError, queue.Empty) as e:
+                self._stop()
+                raise RuntimeError(f"スクリプトホストが応答しません: {e or 'タイムアウト'}")
+            if line is None:
+                self._stop()
+                raise RuntimeError("スクリプトホストが終了しました")
+            status, _, result = line.partition(' ')
+            if status != 'ok':
+                raise RuntimeError(result)
+            return result
+
+    def _stop(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+        self._process = None
+
+    def close(self):
+        """スクリプトホストを終了する"""
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                try:
+                    self._process.stdin.close()
+                    self._process.wait(timeout=2)
+                except (OSError, subprocess.TimeoutExpired):
+                    pass
+            self._stop()
+
+
+class FocusManager(ABC):
+    """
+    Kindleアプリの前面表示を管理するインターフェース
+
+    ensure_focus() は前面のアプリを確認し、フォーカスが失われている場合のみ activate() を呼びます。
+    直前にフォーカスを確認してから cache_ttl 秒以内の呼び出しは確認自体を省略します。
+    サブクラスは frontmost_app() と activate() を実装します（テストでは偽の実装に差し替え可能）。
+    """
+
+    def __init__(self, cache_ttl: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        """
+        初期化
+
+        Args:
+            cache_ttl: フォーカス確認結果を再利用する時間（秒）
+            clock: 経過時間の計測に使う関数
+        """
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+        self.activations = 0
+        self.skipped = 0
+        self.checks = 0
+        self._focused_at: Optional[float] = None
+
+    @abstractmethod
+    def frontmost_app(self) -> Optional[str]:
+        """前面のアプリ名を返す（取得できない場合None）"""
+
+    @abstractmethod
+    def activate(self) -> bool:
+        """Kindleアプリを前面に表示する"""
+
+    @staticmethod
+    def is_kindle(app_name: Optional[str]) -> bool:
+        return bool(app_name) and 'Kindle' in app_name
+
+    def ensure_focus(self) -> bool:
+        """
+        Kindleアプリが前面にあることを保証する
+
+        Returns:
+            Kindleアプリが前面にある（または前面に表示できた）場合True
+        """
+        now = self.clock()
+        if self._focused_at is not None and now - self._focused_at < self.cache_ttl:
+            self.skipped += 1
+            return True
+
+        self.checks += 1
+        if self.is_kindle(self.frontmost_app()):
+            self.skipped += 1
+            self._focused_at = self.clock()
+            return True
+
+        self.activations += 1
+        activated = self.activate()
+        self._focused_at = self.clock() if activated else None
+        return activated
+
+    def invalidate(self):
+        """キャッシュしたフォーカス状態を破棄する"""
+        self._focused_at = None
+
+    def stats(self) -> Dict[str, int]:
+        """前面表示の統計を返す"""
+        return {
+            'activations': self.activations,
+            'skipped_activations': self.skipped,
+            'focus_checks': self.checks
+        }
+
+    def close(self):
+        """使用しているリソースを解放する"""
+        pass
+
+
+class FakeFocusManager(FocusManager):
+    """
+    osascriptを使わない偽のFocusManager（テスト用）
+
+    前面のアプリ名を保持し、activate() で Kindle に切り替えます。
+    lose_focus() で他のアプリに切り替えて、フォーカスが失われた状態を再現できます。
+    """
+
+    def __init__(self, frontmost: Optional[str] = 'Kindle', activate_succeeds: bool = True, **kwargs):
+        """
+        初期化
+
+        Args:
+            frontmost: 最初に前面にあるアプリ名
+            activate_succeeds: activate() が成功するかどうか
+        """
+        super().__init__(**kwargs)
+        self.frontmost = frontmost
+        self.activate_succeeds = activate_succeeds
+        self.activate_calls = 0
+
+    def frontmost_app(self) -> Optional[str]:
+        return self.frontmost
+
+    def activate(self) -> bool:
+        self.activate_calls += 1
+        if self.activate_succeeds:
+            self.frontmost = 'Kindle'
+        return self.activate_succeeds
+
+    def lose_focus(self, app_name: str = 'Finder'):
+        """他のアプリを前面にする"""
+        self.frontmost = app_name
+
+
+class AppleScriptFocusManager(FocusManager):
+    """常駐スクリプトホスト経由でKindleアプリの前面表示を行うFocusManager"""
+
+    def __init__(self, app_names: Tuple[str, ...] = ("Kindle", "Amazon Kindle"), activate_wait: float = 1.5,
+                 host: Optional[AppleScriptHost] = None, **kwargs):
+        """
+        初期化
+
+        Args:
+            app_names: 試行するKindleアプリ名
+            activate_wait: activate後にKindleアプリが前面に来るのを待つ最大時間（秒）
+            host: 使用するスクリプトホスト（指定しない場合は新規に起動）
+        """
+        super().__init__(**kwargs)
+        self.app_names = app_names
+        self.activate_wait = activate_wait
+        self.host = host or AppleScriptHost()
+
+    def frontmost_app(self) -> Optional[str]:
+        try:
+            return self.host.call('frontmost', timeout=3)
+        except RuntimeError as e:
+            print(f"  ⚠️ アクティブアプリの確認に失敗: {e}")
+            return None
+
+    def activate(self) -> bool:
+        activated = False
+        for app_name in self.app_names:
+            try:
+                self.host.call(f'activate {app_name}')
+                print(f"  ✅ {app_name}をactivateしました")
+                activated = True
+                break
+            except RuntimeError as e:
+                print(f"  ⚠️ {app_name}のactivateに失敗: {e}")
+
+        try:
+            self.host.call('raise Kindle')
+            activated = True
+        except RuntimeError as e:
+            print(f"  ⚠️ System Eventsでの前面表示に失敗: {e}")
+
+        # 固定時間待つ代わりに、Kindleが前面に来るまで短い間隔で確認する
+        deadline = self.clock() + self.activate_wait
+        while True:
+            active_app = self.frontmost_app()
+            if self.is_kindle(active_app):
+                print(f"  ✅ Kindleアプリがアクティブです")
+                return activated
+            if self.clock() >= deadline:
+                print(f"  ⚠️ 警告: Kindleアプリがアクティブではありません（現在: {active_app}）")
+                return False
+            time.sleep(0.1)
+
+    def close(self):
+        self.host.close()
+
+
+def _longest_run(values: bytes, threshold: int) -> Tuple[int, int]:
+    """threshold以上の値が連続する最長区間 [start, end) を返す"""
+    best = (0, 0)
+    start = None
+    for i, value in enumerate(list(values) + [0]):
+        if value >= threshold and start is None:
+            start = i
+        elif value < threshold and start is not None:
+            if i - start > best[1] - best[0]:
+                best = (start, i)
+            start = None
+    return best
+
+
+class PageRegionDetector:
+    """
+    スクリーンショットから本のページ領域を検出する
+
+    縮小したグレースケール画像で、背景色（ダークモードでは黒、通常は白）が大半を占める
+    最長の行の帯をKindleの表示領域とみなし、メニューバー・ツールバー・Dockなどを除外します。
+    さらに表示領域内で背景色以外の画素の外接矩形に余白を加えた範囲をページ領域とします。
+
+    検出したページ領域は次のページ以降も再利用し、表示領域が変わった（ウィンドウの移動・リサイズ）場合のみ
+    検出し直します。ページ領域の外に内容があるページが現れた場合は、そのページを含むように領域を広げます。
+    """
+
+    # 検出に使う縮小率
+    SCALE = 4
+    # 内容の検出から除外する表示領域の縁の幅（%）
+    EDGE_INSET = 4
+
+    def __init__(self, tolerance: int = 12, margin: int = 16, min_area_ratio: float = 0.1):
+        """
+        初期化
+
+        Args:
+            tolerance: 背景色とみなす明るさの差（0〜255）
+            margin: 内容の外接矩形に加える余白（ピクセル）
+            min_area_ratio: 表示領域として認める画面に対する最小の面積比
+        """
+        self.tolerance = tolerance
+        self.margin = margin
+        self.min_area_ratio = min_area_ratio
+        self.region: Optional[Tuple[int, int, int, int]] = None
+        self.reading_area: Optional[Tuple[int, int, int, int]] = None
+        self.detections = 0
+
+    def _analyze(self, img: 'Image.Image'):
+        """縮小画像・背景マスク・表示領域（縮小座標）を求める"""
+        small = img.convert('L').reduce(self.SCALE)
+        width, height = small.size
+
+        # 画面中央の帯で最も多い明るさ（±tolerance）を背景色とする
+        histogram = small.crop((0, height // 5, width, height * 4 // 5)).histogram()
+        tol = self.tolerance
+        background = max(range(256), key=lambda v: sum(histogram[max(0, v - tol):v + tol + 1]))
+        lut = [255 if abs(v - background) <= tol else 0 for v in range(256)]
+        mask = small.point(lut)
+
+        # 背景が半分以上を占める最長の行の帯を表示領域の上下とする
+        rows = mask.resize((1, height), Image.Resampling.BOX).tobytes()
+        top, bottom = _longest_run(rows, 128)
+        if bottom - top < 4:
+            return small, mask, None
+        # 表示領域の上端付近（ページ内容が始まる前の余白）で背景色が続く範囲を左右とする
+        strip = mask.crop((0, top, width, min(bottom, top + 4)))
+        columns = [i for i, value in enumerate(strip.resize((width, 1), Image.Resampling.BOX).tobytes()) if value >= 128]
+        if not columns:
+            return small, mask, None
+        left, right = columns[0], columns[-1] + 1
+
+        area = (left, top, right, bottom)
+        if (right - left) * (bottom - top) < self.min_area_ratio * width * height:
+            return small, mask, None
+        return small, mask, area
+
+    def _content_box(self, mask: 'Image.Image', area: Tuple[int, int, int, int]) -> Optional[Tuple[int, int, int, int]]:
+        """表示領域内で背景色以外の画素の外接矩形（縮小座標）を返す"""
+        left, top, right, bottom = area
+        # 表示領域の縁（ページめくりの矢印や進捗バー）は除外する
+        inset_x = max(2, (right - left) * self.EDGE_INSET // 100)
+        inset_y = max(2, (bottom - top) * self.EDGE_INSET // 100)
+        inner = (left + inset_x, top + inset_y, right - inset_x, bottom - inset_y)
+        box = ImageChops.invert(mask.crop(inner)).getbbox()
+        if box is None:
+            return None
+        return (inner[0] + box[0], inner[1] + box[1], inner[0] + box[2], inner[1] + box[3])
+
+    def _to_region(self, box: Tuple[int, int, int, int], area: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+        """縮小座標の矩形に余白を加え、表示領域内に収めて元の解像度の座標に変換する"""
+        pad = self.margin // self.SCALE
+        left = max(area[0], box[0] - pad)
+        top = max(area[1], box[1] - pad)
+        right = min(area[2], box[2] + pad)
+        bottom = min(area[3], box[3] + pad)
+        return (left * self.SCALE, top * self.SCALE, right * self.SCALE, bottom * self.SCALE)
+
+    def detect(self, img: 'Image.Image') -> Optional[Tuple[int, int, int, int]]:
+        """
+        キャッシュを使わずにページ領域を検出する
+
+        Args:
+            img: スクリーンショット
+
+        Returns:
+            ページ領域 (left, top, right, bottom)（検出できない場合None）
+        """
+        _, mask, area = self._analyze(img)
+        if area is None:
+            return None
+        content = self._content_box(mask, area) or area
+        return self._to_region(content, area)
+
+    def region_for(self, img: 'Image.Image') -> Optional[Tuple[int, int, int, int]]:
+        """
+        前回のページ領域を再利用しつつ、このスクリーンショットのページ領域を返す
+
+        Args:
+            img: スクリーンショット
+
+        Returns:
+            ページ領域 (left, top, right, bottom)（一度も検出できていない場合None）
+        """
+        _, mask, area = self._analyze(img)
+        if area is None:
+            # 他のウィンドウが重なっている場合などは前回の領域を使う
+            return self.region
+
+        if self.reading_area is None or any(abs(a - b) > 2 for a, b in zip(area, self.reading_area)):
+            # 表示領域が変わった（初回・ウィンドウの移動やリサイズ）ので検出し直す
+            self.reading_area = area
+            content = self._content_box(mask, area) or area
+            self.region = self._to_region(content, area)
+            self.detections += 1
+            return self.region
+
+        # ページ領域の外に内容がある場合は領域を広げる
+        content = self._content_box(mask, area)
+        if content:
+            region = self._to_region(content, area)
+            merged = (min(region[0], self.region[0]), min(region[1], self.region[1]),
+                      max(region[2], self.region[2]), max(region[3], self.region[3]))
+            if merged != self.region:
+                self.region = merged
+                self.detections += 1
+        return self.region
+
+
+def perceptual_hash(img: 'Image.Image', hash_size: int = 16) -> int:
+    """
+    画像の知覚ハッシュ（dHash）を計算する
+
+    グレースケールに縮小した画像の隣接画素の明暗から hash_size×hash_size ビットのハッシュを作ります。
+    メニューバーの時計などのわずかな変化ではハッシュはほとんど変わらず、ページが変わると大きく変わります。
+
+    Args:
+        img: 画像
+        hash_size: ハッシュの一辺のビット数
+
+    Returns:
+        ハッシュ値
+    """
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つのハッシュ値の異なるビット数を返す"""
+    return bin(a ^ b).count('1')
+
+
+def image_cache_key(img: 'Image.Image', model_name: str, upload_key: tuple = (),
+                    prompt_version: int = PROMPT_VERSION) -> str:
+    """
+    文字起こしキャッシュのキーを計算する
+
+    PNGのエンコード結果やファイル名ではなく、RGBに正規化した画素データから計算するため、
+    同じ画面を撮り直したスクリーンショットは同じキーになります。
+    アップロード画像の設定もキーに含め、縮小・減色した画像の文字起こし結果を別の設定で再利用しないようにします。
+
+    Args:
+        img: RGBに正規化済みの画像
+        model_name: 文字起こしに使用するモデル名
+        upload_key: アップロード画像の設定（UploadEncoder.key）
+        prompt_version: 文字起こしプロンプトのバージョン
+
+    Returns:
+        16進数のSHA-256ハッシュ
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{model_name}\n{prompt_version}\n{upload_key!r}\n{img.mode}\n{img.size[0]}x{img.size[1]}\n'
+                  .encode('utf-8'))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def image_content_key(img: 'Image.Image') -> str:
+    """
+    フレームストアのキーを計算する（RGBに正規化した画素データのSHA-256）
+
+    Args:
+        img: RGBに正規化済みの画像
+
+    Returns:
+        16進数のSHA-256ハッシュ
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{img.mode}\n{img.size[0]}x{img.size[1]}\n'.encode('utf-8'))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+class Frame:
+    """
+    1ページ分の画面
+
+    画像のデコードとRGBへの変換は最初に使われたときに1回だけ行い、知覚ハッシュ・キャッシュキー・
+    アップロード用の画像などの派生データもフレームにキャッシュします。
+    キャプチャループ・PDFの書き込み・文字起こしワーカーが同じフレームを共有するため、
+    1ページの画像を何度もファイルから読み直す必要がありません。
+    """
+
+    def __init__(self, path: Optional[Path] = None, image: Optional['Image.Image'] = None,
+                 derived: Optional[dict] = None):
+        """
+        初期化
+
+        Args:
+            path: 画像ファイルのパス（imageを指定しない場合は最初に使われたときに読み込む）
+            image: デコード済みの画像
+            derived: 別プロセスで計算済みの派生データ（derived_data() の結果）
+        """
+        if path is None and image is None:
+            raise ValueError("path か image のどちらかを指定してください")
+        self.path = Path(path) if path is not None else None
+        self._image = convert_to_rgb(image) if image is not None else None
+        self._derived: dict = dict(derived or {})
+        self._lock = threading.RLock()
+        # 画像がファイルの内容から変更されている（保存が必要な）場合True
+        self.dirty = image is not None
+
+    @classmethod
+    def of(cls, source) -> 'Frame':
+        """パスまたはフレームからフレームを返す"""
+        return source if isinstance(source, Frame) else cls(path=source)
+
+    @property
+    def name(self) -> str:
+        """ログ表示用の名前"""
+        return self.path.name if self.path else 'memory'
+
+    @property
+    def image(self) -> 'Image.Image':
+        """RGBに変換済みの画像（読み取り専用として扱うこと）"""
+        with self._lock:
+            if self._image is None:
+                with Image.open(self.path) as img:
+                    img.load()
+                    dpi = img.info.get('dpi')
+                    rgb = convert_to_rgb(img)
+                if dpi:
+                    rgb.info['dpi'] = dpi
+                self._image = rgb
+            return self._image
+
+    def replace_image(self, image: 'Image.Image'):
+        """
+        画像を置き換え、派生データのキャッシュを破棄する（切り抜きなど）
+
+        Args:
+            image: 新しい画像
+        """
+        with self._lock:
+            dpi = self._image.info.get('dpi') if self._image is not None else None
+            self._image = convert_to_rgb(image)
+            if dpi and 'dpi' not in self._image.info:
+                self._image.info['dpi'] = dpi
+            self._derived.clear()
+            self.dirty = True
+
+    def derived(self, key, factory: Callable[[], object]):
+        """
+        派生データを初回のみ計算してキャッシュする
+
+        Args:
+            key: 派生データのキー
+            factory: 派生データを計算する関数
+
+        Returns:
+            派生データ
+        """
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = factory()
+            return self._derived[key]
+
+    def derived_data(self) -> dict:
+        """計算済みの派生データ（別プロセスから返すためのコピー）"""
+        with self._lock:
+            return dict(self._derived)
+
+    def perceptual_hash(self) -> int:
+        """知覚ハッシュ"""
+        return self.derived('phash', lambda: perceptual_hash(self.image))
+
+    def cache_key(self, model_name: str, encoder: UploadEncoder) -> str:
+        """文字起こしキャッシュのキー（アップロード画像の設定ごと）"""
+        return self.derived(('cache_key', model_name) + encoder.key,
+                            lambda: image_cache_key(self.image, model_name, encoder.key))
+
+    def content_key(self) -> str:
+        """フレームストアのキー"""
+        return self.derived('content_key', lambda: image_content_key(self.image))
+
+    def upload_payload(self, encoder: UploadEncoder) -> UploadPayload:
+        """
+        LLMにアップロードする画像データ
+
+        Args:
+            encoder: アップロード用のエンコーダ
+
+        Returns:
+            圧縮したページ画像
+        """
+        return self.derived(encoder.key, lambda: encoder.encode(self.image))
+
+    def save_png(self, path: Path) -> int:
+        """
+        画像をPNGで保存する（一時ファイルに書き込んでから置き換える）
+
+        Args:
+            path: 保存先のパス
+
+        Returns:
+            保存したファイルのバイト数
+        """
+        path = Path(path)
+        part_path = path.with_name(path.name + '.part')
+        self.image.save(part_path, format='PNG')
+        os.replace(part_path, path)
+        self.path = path
+        self.dirty = False
+        return path.stat().st_size
+
+
+class BackgroundWriter:
+    """
+    ファイルの書き込み（スクリーンショットの保存・PDFへのページ追記）を
+    キャプチャループとは別のスレッドで投入順に実行するライター
+
+    キューが満杯の場合は submit() がブロックします（バックプレッシャー）。
+    """
+
+    def __init__(self, queue_size: int = 8, tracer: Optional['StageTracer'] = None):
+        """
+        初期化
+
+        Args:
+            queue_size: 書き込み待ちキューの最大長
+            tracer: 投入元のページ番号を書き込みスレッドのスパンに引き継ぐトレーサー
+        """
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.tracer = tracer
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'BackgroundWriter':
+        """書き込みスレッドを起動する"""
+        self._thread = threading.Thread(target=self._run, name="background-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, func: Callable, *args):
+        """
+        書き込み処理を投入する
+
+        Args:
+            func: 実行する関数
+            *args: 関数の引数
+        """
+        if self._thread is None:
+            func(*args)
+            return
+        page = self.tracer.current_page() if self.tracer else None
+        self.queue.put((func, args, page))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            func, args, page = item
+            if self.tracer:
+                self.tracer.set_page(page)
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"  ❌ 書き込みエラー: {e}")
+
+    def close(self):
+        """投入済みの書き込みを全て完了させてからスレッドを停止する"""
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+
+def convert_page(path: str, encoder: PDFPageEncoder, crop_to: Optional[str] = None,
+                 model_name: Optional[str] = None, upload: Optional[UploadEncoder] = None) -> dict:
+    """
+    1ページ分の画像を変換する（ParallelPageConverter のワーカープロセスで実行）
+
+    画像のデコードはワーカー内で1回だけ行い、親プロセスには圧縮済みのデータだけを返します。
+
+    Args:
+        path: スクリーンショットのパス
+        encoder: PDF用のエンコーダ
+        crop_to: 本のページ領域に切り抜いて保存するパス（Noneの場合は切り抜かない）
+        model_name: 文字起こしキャッシュのキーを計算する場合のモデル名（upload も指定する）
+        upload: LLMにアップロードする画像を作る場合のエンコーダ
+
+    Returns:
+        pdf（EncodedPage）, derived（Frameの派生データ）, path（以降に使う画像のパス）,
+        region, original_bytes, cropped_bytes, started, seconds を持つ辞書（失敗した場合は error のみ）
+    """
+    started = time.perf_counter()
+    try:
+        frame = Frame(path=path)
+        img = frame.image
+        result = {'path': path, 'region': None, 'original_bytes': 0, 'cropped_bytes': 0}
+        if crop_to:
+            region = PageRegionDetector().detect(img)
+            if region is not None and region != (0, 0) + img.size:
+                frame.replace_image(img.crop(region))
+                result['region'] = region
+                result['original_bytes'] = os.path.getsize(path)
+                result['cropped_bytes'] = frame.save_png(Path(crop_to))
+            else:
+                shutil.copy2(path, crop_to)
+            result['path'] = crop_to
+        result['pdf'] = encoder.encode(frame.image)
+        if model_name is not None and upload is not None:
+            frame.cache_key(model_name, upload)
+        if upload is not None:
+            frame.upload_payload(upload)
+        result['derived'] = frame.derived_data()
+        result['started'] = started
+        result['seconds'] = time.perf_counter() - started
+        return result
+    except Exception as e:
+        return {'error': f"{Path(path).name}: {e}"}
+
+
+class ParallelPageConverter:
+    """
+    ページ画像の変換を複数のプロセスで並列に行い、投入した順に結果を返す
+
+    同時に処理中（デコード済み）のページ数は max_in_flight 以下に抑えられます。
+    ワーカー数が0の場合は呼び出し元のプロセスで順に変換します。
+    """
+
+    def __init__(self, workers: int = 0, max_in_flight: Optional[int] = None):
+        """
+        初期化
+
+        Args:
+            workers: ワーカープロセス数（0の場合は並列化しない）
+            max_in_flight: 同時に処理中にするページ数の上限（指定しない場合はワーカー数の2倍）
+        """
+        self.workers = max(0, workers)
+        self.max_in_flight = max(1, max_in_flight or self.workers * 2)
+
+    def map(self, func: Callable[..., dict], items) -> Iterator[dict]:
+        """
+        各引数のタプルに関数を適用した結果を、投入した順に返す
+
+        Args:
+            func: ワーカープロセスで実行する関数（モジュールの最上位で定義されたもの）
+            items: 関数の引数のタプルの列
+
+        Returns:
+            結果のイテレータ
+        """
+        if self.workers == 0:
+            for args in items:
+                yield func(*args)
+            return
+
+        # 文字起こしのスレッドやイベントループが動いている状態でforkするとデッドロックすることがあるため、spawnで起動する
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+        pending = deque()
+        try:
+            for args in items:
+                if len(pending) >= self.max_in_flight:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(func, *args))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+
+class TranscriptionCache:
+    """
+    スクリーンショットの画素ハッシュをキーにした文字起こし結果のディスクキャッシュ
+
+    1件1ファイルで保存し、キャッシュヒット時にファイルの更新日時を更新します。
+    使用順は起動時にファイルの更新日時から復元してメモリ上で管理し、
+    合計サイズが上限を超えた場合は最も長く使われていないものから削除します（LRU）。
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 100 * 1024 * 1024):
+        """
+        初期化
+
+        Args:
+            cache_dir: キャッシュディレクトリ
+            max_bytes: キャッシュの合計サイズの上限（バイト）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # キー → サイズ（古く使われた順）
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        stats = [(path.stat(), path.stem) for path in self.cache_dir.glob('*/*.txt')]
+        for stat, key in sorted(stats, key=lambda item: item[0].st_mtime):
+            self._entries[key] = stat.st_size
+        self._total_bytes = sum(self._entries.values())
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f'{key}.txt'
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        キャッシュから文字起こし結果を取得する
+
+        Args:
+            key: image_cache_key() で計算したキー
+
+        Returns:
+            文字起こし結果（キャッシュにない場合None）
+        """
+        path = self._path(key)
+        with self._lock:
+            try:
+                text = path.read_text(encoding='utf-8')
+                os.utime(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: str, text: str):
+        """
+        文字起こし結果をキャッシュに保存する
+
+        Args:
+            key: image_cache_key() で計算したキー
+            text: 文字起こし結果
+        """
+        path = self._path(key)
+        data = text.encode('utf-8')
+        with self._lock:
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """キャッシュの統計を返す"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size_bytes': self._total_bytes
+        }
+
+
+class FrameStore:
+    """
+    画素データのハッシュをキーにしたスクリーンショットの保存先
+
+    同じ画面は何回キャプチャしても1つのファイルだけを保存します。
+    ファイルは objects/<キーの先頭2文字>/<キー>.<拡張子> に保存し、ページと画像の対応は本ごとの索引
+    （screenshots/frames.json）に記録します。複数の本で共有でき、索引を登録した本（books.json）の
+    最新の索引から参照されていない画像は collect() で削除できます。
+
+    保存形式（いずれも可逆圧縮）:
+        png: 標準のPNG（速い）
+        png-optimized: 圧縮率を優先したPNG
+        webp: 可逆圧縮のWebP（PNGの半分程度。libwebp付きのPillowが必要）
+
+    保持方針:
+        all: 保存した画像を削除しない
+        latest: 本の処理が終わるたびに、最新の索引から参照されていない画像を削除する
+    """
+
+    CODECS = {'png': '.png', 'png-optimized': '.png', 'webp': '.webp'}
+    RETENTIONS = ('all', 'latest')
+    # 可逆圧縮のWebPは quality が圧縮の努力量を表す（大きくしてもサイズはほとんど変わらず遅くなる）
+    WEBP_OPTIONS = {'lossless': True, 'quality': 50, 'method': 2}
+
+    def __init__(self, root: Path, codec: str = 'webp', retention: str = 'latest'):
+        """
+        初期化
+
+        Args:
+            root: 保存先のディレクトリ
+            codec: 新しく保存する画像の形式（png / png-optimized / webp）
+            retention: 保持方針（all / latest）
+        """
+        if codec not in self.CODECS:
+            raise ValueError(f"不明な保存形式です: {codec}")
+        if retention not in self.RETENTIONS:
+            raise ValueError(f"不明な保持方針です: {retention}")
+        self.retention = retention
+        if codec == 'webp' and not features.check('webp'):
+            print("⚠️ PillowがWebPに対応していないため、png-optimized で保存します")
+            codec = 'png-optimized'
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.books_path = self.root / "books.json"
+        self.codec = codec
+        # この実行で保存・再利用した画像は collect() で削除しない（索引を書く前の本の画像を守るため）
+        self.opened_at = time.time()
+        self._lock = threading.Lock()
+
+    def find(self, key: str) -> Optional[Path]:
+        """保存済みの画像のパスを返す（どの形式でもよい、ない場合None）"""
+        for suffix in dict.fromkeys(self.CODECS.values()):
+            path = self.objects_dir / key[:2] / f'{key}{suffix}'
+            if path.exists():
+                return path
+        return None
+
+    def path_for(self, key: str) -> Path:
+        """画像の保存先のパス（保存済みの場合はそのパス）"""
+        return self.find(key) or self.objects_dir / key[:2] / f'{key}{self.CODECS[self.codec]}'
+
+    def put(self, key: str, image: 'Image.Image') -> Tuple[Path, int]:
+        """
+        画像を保存する（同じキーの画像が保存済みの場合は更新日時だけを更新する）
+
+        Args:
+            key: image_content_key() で計算したキー
+            image: RGBの画像
+
+        Returns:
+            (画像のパス, 新しく書き込んだバイト数（保存済みの場合0）)
+        """
+        path = self.find(key)
+        if path:
+            try:
+                os.utime(path)
+                return path, 0
+            except FileNotFoundError:
+                # collect() と重なった場合は保存し直す
+                pass
+        path = self.objects_dir / key[:2] / f'{key}{self.CODECS[self.codec]}'
+        path.parent.mkdir(exist_ok=True)
+        # 複数のスレッド（本）が同じ画像を同時に保存しても壊れないよう、一時ファイルの名前を分ける
+        part_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.part')
+        if self.codec == 'webp':
+            image.save(part_path, format='WEBP', **self.WEBP_OPTIONS)
+        else:
+            image.save(part_path, format='PNG', optimize=self.codec == 'png-optimized')
+        os.replace(part_path, path)
+        return path, path.stat().st_size
+
+    def register(self, index_path: Path):
+        """
+        本の索引を登録する（collect() で参照されている画像を調べる対象になる）
+
+        Args:
+            index_path: 本の索引（frames.json）のパス
+        """
+        index_path = str(Path(index_path).resolve())
+        with self._lock:
+            books = self._load_books()
+            if index_path not in books:
+                books.append(index_path)
+                self._save_books(books)
+
+    def _load_books(self) -> List[str]:
+        if not self.books_path.exists():
+            return []
+        with open(self.books_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_books(self, books: List[str]):
+        tmp_path = self.books_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(books, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.books_path)
+
+    def referenced_keys(self) -> set:
+        """登録された本の最新の索引から参照されている画像のキー（索引がなくなった本は登録を外す）"""
+        keys = set()
+        with self._lock:
+            books = self._load_books()
+            existing = []
+            for index_path in books:
+                index = load_frame_index(Path(index_path).parent)
+                if index is None:
+                    continue
+                existing.append(index_path)
+                keys.update(entry['key'] for entry in index['pages'].values())
+            if existing != books:
+                self._save_books(existing)
+        return keys
+
+    def collect(self) -> Tuple[int, int]:
+        """
+        どの本の最新の索引からも参照されていない画像を削除する
+
+        この実行で保存・再利用した画像は、索引に記録される前でも削除しません。
+
+        Returns:
+            (削除したファイル数, 削除したバイト数)
+        """
+        keys = self.referenced_keys()
+        files = 0
+        removed_bytes = 0
+        for path in self.objects_dir.glob('*/*'):
+            if path.name.endswith('.part') or path.name.split('.')[0] in keys:
+                continue
+            try:
+                stat = path.stat()
+                if stat.st_mtime >= self.opened_at:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            files += 1
+            removed_bytes += stat.st_size
+        return files, removed_bytes
+
+    def apply_retention(self) -> Tuple[int, int]:
+        """
+        保持方針に従って不要な画像を削除する
+
+        Returns:
+            (削除したファイル数, 削除したバイト数)
+        """
+        if self.retention == 'latest':
+            return self.collect()
+        return 0, 0
+
+    def stats(self) -> Dict[str, int]:
+        """保存されている画像の数と合計サイズ"""
+        sizes = [path.stat().st_size for path in self.objects_dir.glob('*/*') if not path.name.endswith('.part')]
+        return {'objects': len(sizes), 'size_bytes': sum(sizes)}
+
+
+def load_frame_index(screenshots_dir: Path) -> Optional[dict]:
+    """
+    本の索引（screenshots/frames.json）を読み込む
+
+    Args:
+        screenshots_dir: スクリーンショットのディレクトリ
+
+    Returns:
+        store, codec, pages（ページ番号の文字列→key, file, captured, dpi）を持つ辞書（ない場合None）
+    """
+    index_path = Path(screenshots_dir) / FRAME_INDEX_NAME
+    if not index_path.exists():
+        return None
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_frame_index(screenshots_dir: Path, store: FrameStore, pages: Dict[int, dict]) -> Path:
+    """
+    本の索引（screenshots/frames.json）を書き込み、フレームストアに登録する
+
+    Args:
+        screenshots_dir: スクリーンショットのディレクトリ
+        store: 画像を保存したフレームストア
+        pages: ページ番号→key, file, captured, dpi
+
+    Returns:
+        索引のパス
+    """
+    index_path = Path(screenshots_dir) / FRAME_INDEX_NAME
+    index = {
+        'store': str(store.root.resolve()),
+        'codec': store.codec,
+        'pages': {str(page): pages[page] for page in sorted(pages)}
+    }
+    tmp_path = index_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, index_path)
+    store.register(index_path)
+    return index_path
+
+
+class PageJournal:
+    """
+    ページごとの処理状況を1行1レコード（JSON Lines）で追記するジャーナル
+
+    レコードは追記のたびにfsyncするため、クラッシュや強制終了の直前までの状況が残ります。
+    load() は最後の行が書きかけで壊れていても、それ以前のレコードから状態を復元します。
+    """
+
+    def __init__(self, path: Path):
+        """
+        初期化
+
+        Args:
+            path: ジャーナルファイルのパス
+        """
+        self.path = Path(path)
+        self._file = None
+        self._lock = threading.Lock()
+
+    def open(self, fresh: bool):
+        """
+        ジャーナルを追記用に開く
+
+        Args:
+            fresh: 新しい実行として開くかどうか（既存のジャーナルは .bak に退避）
+        """
+        if fresh and self.path.exists():
+            os.replace(self.path, self.path.with_name(self.path.name + '.bak'))
+        torn = False
+        if not fresh and self.path.exists() and self.path.stat().st_size:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b'\n'
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if torn:
+            # 書きかけで中断された最後の行に次のレコードがつながらないよう改行で区切る
+            self._file.write('\n')
+
+    def append(self, event: str, **fields):
+        """
+        レコードを1件追記してディスクに書き込む
+
+        Args:
+            event: レコードの種類（run_start, capture, ocr, turn など）
+            **fields: レコードの内容
+        """
+        if self._file is None:
+            return
+        record = {'event': event, 'time': datetime.now().isoformat(timespec='seconds'), **fields}
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """ジャーナルを閉じる"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def load(path: Path) -> Optional[dict]:
+        """
+        ジャーナルを読み込んで前回の実行状態を復元する
+
+        Args:
+            path: ジャーナルファイルのパス
+
+        Returns:
+            start_page, end_page, captures（ページ→captureレコード）, ocr（ページ→ocrレコード）,
+            last_turned（最後にめくったページ番号）, completed を持つ辞書（ジャーナルがない場合None）
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+        state = {'start_page': 1, 'end_page': 1, 'captures': {}, 'ocr': {}, 'last_turned': None, 'completed': False}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で中断された行は無視
+                    continue
+                event = record.get('event')
+                if event == 'run_start':
+                    state['start_page'] = record['start_page']
+                    state['end_page'] = record['end_page']
+                elif event == 'capture':
+                    state['captures'][record['page']] = record
+                elif event == 'ocr':
+                    state['ocr'][record['page']] = record
+                elif event == 'turn':
+                    state['last_turned'] = record['page']
+                elif event == 'run_end':
+                    state['completed'] = True
+        return state
+
+
+class SearchHit(NamedTuple):
+    """全文検索の1件の結果"""
+    book: str
+    page: int
+    snippet: str
+    screenshot: Optional[str]
+    text_file: Optional[str]
+    score: float
+
+
+class TextIndex:
+    """
+    文字起こし結果のSQLite全文検索インデックス（FTS5）
+
+    本（出力ディレクトリ）とページ番号ごとに1行を保持し、同じページを保存し直した場合は置き換えます。
+    日本語は単語の区切りがないため、FTS5のtrigramトークナイザで部分一致を検索します
+    （3文字未満の語は本文のLIKEで検索します）。
+    複数のスレッドから add() を呼び出せます。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pages (
+        id INTEGER PRIMARY KEY,
+        book_dir TEXT NOT NULL,
+        book TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        text_file TEXT,
+        screenshot TEXT,
+        mtime REAL,
+        indexed_at TEXT,
+        UNIQUE (book_dir, page)
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+        text, content='pages', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS pages_ai AFTER INSERT ON pages BEGIN
+        INSERT INTO pages_fts(rowid, text) VALUES (new.id, new.text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS pages_ad AFTER DELETE ON pages BEGIN
+        INSERT INTO pages_fts(pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS pages_au AFTER UPDATE ON pages BEGIN
+        INSERT INTO pages_fts(pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO pages_fts(rowid, text) VALUES (new.id, new.text);
+    END;
+    """
+
+    # trigramトークナイザで検索できる最短の語の長さ
+    MIN_MATCH_CHARS = 3
+
+    def __init__(self, db_path: Path):
+        """
+        初期化
+
+        Args:
+            db_path: データベースファイルのパス
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        try:
+            self._conn.executescript(self.SCHEMA)
+        except sqlite3.OperationalError as e:
+            self._conn.close()
+            raise RuntimeError(f"SQLiteがFTS5のtrigramトークナイザに対応していません（SQLite 3.34以降が必要です）: {e}")
+
+    @staticmethod
+    def book_key(book_dir: Path) -> str:
+        """本を識別するキー（出力ディレクトリの絶対パス）"""
+        return str(Path(book_dir).resolve())
+
+    def _upsert(self, book_dir: Path, book: str, page: int, text: str, text_file: Optional[Path],
+                screenshot: Optional[Path], mtime: Optional[float]):
+        self._conn.execute(
+            """
+            INSERT INTO pages (book_dir, book, page, text, text_file, screenshot, mtime, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (book_dir, page) DO UPDATE SET
+                book = excluded.book, text = excluded.text, text_file = excluded.text_file,
+                screenshot = COALESCE(excluded.screenshot, pages.screenshot),
+                mtime = excluded.mtime, indexed_at = excluded.indexed_at
+            """,
+            (self.book_key(book_dir), book, page, text, str(Path(text_file).resolve()) if text_file else None,
+             str(Path(screenshot).resolve()) if screenshot else None, mtime, datetime.now().isoformat(timespec='seconds'))
+        )
+
+    def add(self, book_dir: Path, book: str, page: int, text: str, text_file: Optional[Path] = None,
+            screenshot: Optional[Path] = None):
+        """
+        1ページ分の文字起こし結果を追加する（既にある場合は置き換える）
+
+        Args:
+            book_dir: 本の出力ディレクトリ
+            book: 本のタイトル
+            page: ページ番号
+            text: 文字起こし結果
+            text_file: テキストファイルのパス
+            screenshot: スクリーンショットのパス
+        """
+        mtime = text_file.stat().st_mtime if text_file and text_file.exists() else None
+        with self._lock:
+            self._upsert(book_dir, book, page, text, text_file, screenshot, mtime)
+            self._conn.commit()
+
+    def index_book(self, book_dir: Path, book: Optional[str] = None) -> Tuple[int, int]:
+        """
+        出力ディレクトリの texts/ にある既存の文字起こし結果をまとめて登録する
+
+        前回登録したときから更新されていないテキストファイルは読み込みません。
+
+        Args:
+            book_dir: 本の出力ディレクトリ（texts/ を含むディレクトリ）
+            book: 本のタイトル（省略した場合は manifest.json のタイトル、なければディレクトリ名）
+
+        Returns:
+            (登録・更新したページ数, 変更がなかったページ数)
+        """
+        book_dir = Path(book_dir)
+        if book is None:
+            book = book_dir.resolve().name
+            manifest_path = book_dir / "manifest.json"
+            if manifest_path.exists():
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    book = json.load(f).get('title') or book
+        screenshots = find_screenshots(book_dir / "screenshots") if (book_dir / "screenshots").is_dir() else {}
+        with self._lock:
+            known = dict(self._conn.execute(
+                'SELECT page, mtime FROM pages WHERE book_dir = ?', (self.book_key(book_dir),)
+            ).fetchall())
+            added = unchanged = 0
+            for text_file in sorted((book_dir / "texts").glob("page_*.txt")):
+                match = re.fullmatch(r'page_(\d+)\.txt', text_file.name)
+                if not match:
+                    continue
+                page = int(match.group(1))
+                mtime = text_file.stat().st_mtime
+                if known.get(page) == mtime:
+                    unchanged += 1
+                    continue
+                text = text_file.read_text(encoding='utf-8')
+                self._upsert(book_dir, book, page, text, text_file, screenshots.get(page), mtime)
+                added += 1
+            self._conn.commit()
+        return added, unchanged
+
+    @staticmethod
+    def _make_snippet(text: str, term: str, width: int = 32) -> str:
+        """語の前後を切り出した抜粋を作る（LIKEで検索した場合用）"""
+        position = text.find(term)
+        if position < 0:
+            return text[:width * 2].replace('\n', ' ')
+        start = max(0, position - width)
+        end = min(len(text), position + len(term) + width)
+        snippet = text[start:position] + '[' + term + ']' + text[position + len(term):end]
+        return ('…' if start > 0 else '') + snippet.replace('\n', ' ') + ('…' if end < len(text) else '')
+
+    def search(self, query: str, limit: int = 20, book: Optional[str] = None) -> List[SearchHit]:
+        """
+        全文検索する
+
+        空白で区切った語をすべて含むページを、関連度（BM25）の高い順に返します。
+
+        Args:
+            query: 検索する語（空白区切りでAND検索）
+            limit: 返す件数の上限
+            book: 本のタイトルで絞り込む場合のタイトル
+
+        Returns:
+            検索結果のリスト
+        """
+        terms = [term for term in query.split() if term]
+        if not terms:
+            return []
+        long_terms = [term for term in terms if len(term) >= self.MIN_MATCH_CHARS]
+        short_terms = [term for term in terms if len(term) < self.MIN_MATCH_CHARS]
+
+        conditions = []
+        params: list = []
+        for term in short_terms:
+            conditions.append("pages.text LIKE ? ESCAPE '\\'")
+            params.append('%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if book is not None:
+            conditions.append('pages.book = ?')
+            params.append(book)
+
+        if long_terms:
+            # 各語をフレーズとして扱い、FTS5の構文として解釈されないようにする
+            match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in long_terms)
+            sql = (
+                "SELECT pages.book, pages.page, snippet(pages_fts, 0, '[', ']', '…', 16), pages.screenshot, "
+                "pages.text_file, bm25(pages_fts) AS score "
+                "FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid WHERE pages_fts MATCH ?"
+            )
+            params.insert(0, match)
+            sql += ''.join(' AND ' + condition for condition in conditions)
+            sql += ' ORDER BY score LIMIT ?'
+        else:
+            sql = (
+                "SELECT pages.book, pages.page, pages.text, pages.screenshot, pages.text_file, 0.0 "
+                "FROM pages WHERE " + ' AND '.join(conditions) + ' ORDER BY pages.book, pages.page LIMIT ?'
+            )
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        hits = []
+        for book_title, page, snippet, screenshot, text_file, score in rows:
+            if not long_terms:
+                snippet = self._make_snippet(snippet, short_terms[0])
+            hits.append(SearchHit(book_title, page, snippet, screenshot, text_file, score))
+        return hits
+
+    def stats(self) -> Dict[str, int]:
+        """登録済みの本とページの数を返す"""
+        with self._lock:
+            books, pages = self._conn.execute('SELECT COUNT(DISTINCT book_dir), COUNT(*) FROM pages').fetchone()
+        return {'books': books, 'pages': pages}
+
+    def close(self):
+        """データベースを閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+def find_book_dirs(paths: List[Path]) -> List[Path]:
+    """
+    指定したディレクトリ以下から文字起こし結果（texts/）を持つ本の出力ディレクトリを探す
+
+    Args:
+        paths: 探すディレクトリのリスト
+
+    Returns:
+        本の出力ディレクトリのリスト
+    """
+    book_dirs = []
+    for path in paths:
+        path = Path(path)
+        candidates = [path / "texts"] if (path / "texts").is_dir() else sorted(path.glob("**/texts"))
+        for texts_dir in candidates:
+            if texts_dir.is_dir() and texts_dir.parent not in book_dirs:
+                book_dirs.append(texts_dir.parent)
+    return book_dirs
+
+
+def percentile(sorted_values: List[float], ratio: float) -> float:
+    """ソート済みの値から最近傍順位法でパーセンタイルを求める"""
+    if not sorted_values:
+        return 0.0
+    # 最近傍順位法: 順位（1始まり）は ceil(ratio × n)。0.07 × 100 = 7.000000000000001 のような誤差は丸めてから切り上げる
+    index = max(0, min(len(sorted_values) - 1, math.ceil(round(ratio * len(sorted_values), 9)) - 1))
+    return sorted_values[index]
+
+
+class StageTracer:
+    """
+    処理段階ごとの所要時間（スパン）を記録するトレーサー
+
+    スパンは1行1レコード（JSON Lines）でトレースファイルに追記し、実行の終わりに
+    段階ごとのp50/p95/最大値と、意図的な待機（sleep.*）と実処理の合計時間を集計します。
+    ページ番号はスレッド（asyncioのタスク）ごとに set_page() で設定したものがスパンに付きます。
+    """
+
+    # この接頭辞で始まる段階は意図的な待機として集計する
+    SLEEP_PREFIX = 'sleep.'
+
+    def __init__(self, path: Path, clock: Callable[[], float] = time.perf_counter,
+                 sleeper: Callable[[float], None] = time.sleep):
+        """
+        初期化
+
+        Args:
+            path: トレースファイルのパス
+            clock: 経過時間の計測に使う関数
+            sleeper: 意図的な待機に使う関数
+        """
+        self.path = Path(path)
+        self.clock = clock
+        self.sleeper = sleeper
+        self._epoch = clock()
+        self._file = None
+        self._durations: Dict[str, List[float]] = {}
+        # スレッドとasyncioのタスクのどちらでもそれぞれのページ番号を持てるようにContextVarで保持する
+        self._page = contextvars.ContextVar(f'trace_page_{id(self)}', default=None)
+        self._lock = threading.Lock()
+
+    def open(self, fresh: bool):
+        """
+        トレースファイルを追記用に開き、集計をリセットする
+
+        Args:
+            fresh: 既存のトレースファイルを空にするかどうか
+        """
+        self.close()
+        self._file = open(self.path, 'w' if fresh else 'a', encoding='utf-8')
+        self._epoch = self.clock()
+        with self._lock:
+            self._durations = {}
+
+    def close(self):
+        """トレースファイルを閉じる"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def set_page(self, page):
+        """このスレッド（タスク）で以降に記録するスパンのページ番号（複数ページの場合はリスト）を設定する"""
+        self._page.set(page)
+
+    def current_page(self):
+        """このスレッド（タスク）で設定されているページ番号を返す"""
+        return self._page.get()
+
+    @contextmanager
+    def span(self, stage: str, page=None):
+        """
+        with文の中の処理時間を1つのスパンとして記録する
+
+        Args:
+            stage: 処理段階の名前（capture, pdf.page, ocr.request など）
+            page: ページ番号（省略した場合は set_page() で設定したもの）
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(stage, start, self.clock() - start, page)
+
+    def sleep(self, stage: str, seconds: float):
+        """
+        意図的な待機を行い、スパンとして記録する
+
+        Args:
+            stage: 処理段階の名前（sleep. で始まるもの）
+            seconds: 待機時間（秒）
+        """
+        with self.span(stage):
+            self.sleeper(seconds)
+
+    def record(self, stage: str, start: float, seconds: float, page=None):
+        """
+        スパンを1件記録する
+
+        Args:
+            stage: 処理段階の名前
+            start: 開始時刻（clockの値）
+            seconds: 所要時間（秒）
+            page: ページ番号（省略した場合は set_page() で設定したもの）
+        """
+        if page is None:
+            page = self.current_page()
+        record = {
+            'stage': stage,
+            'page': page,
+            'start': round(start - self._epoch, 6),
+            'seconds': round(seconds, 6),
+            'thread': threading.current_thread().name
+        }
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._durations.setdefault(stage, []).append(seconds)
+            if self._file is not None:
+                self._file.write(line)
+
+    def summary(self) -> dict:
+        """
+        段階ごとの集計を返す
+
+        Returns:
+            stages（段階→回数・合計・p50・p95・最大）, sleep_seconds, work_seconds, wall_seconds を持つ辞書
+            （文字起こしワーカーの処理は並行して行われるため、work_seconds は wall_seconds を超えることがあります）
+        """
+        with self._lock:
+            durations = {stage: sorted(values) for stage, values in self._durations.items()}
+        stages = {}
+        sleep_seconds = work_seconds = 0.0
+        for stage in sorted(durations):
+            values = durations[stage]
+            total = sum(values)
+            stages[stage] = {
+                'count': len(values),
+                'total': round(total, 3),
+                'p50': round(percentile(values, 0.50), 3),
+                'p95': round(percentile(values, 0.95), 3),
+                'max': round(values[-1], 3)
+            }
+            if stage.startswith(self.SLEEP_PREFIX):
+                sleep_seconds += total
+            else:
+                work_seconds += total
+        return {
+            'stages': stages,
+            'sleep_seconds': round(sleep_seconds, 3),
+            'work_seconds': round(work_seconds, 3),
+            'wall_seconds': round(self.clock() - self._epoch, 3)
+        }
+
+
+SCREENSHOT_NAME_PATTERN = re.compile(r'^page_(\d+)_(\d{8}_\d{6})\.png$')
+
+
+def find_screenshots(screenshots_dir: Path) -> Dict[int, Path]:
+    """
+    スクリーンショットのディレクトリからページごとの画像を集める
+
+    ファイル名（page_NNNN_YYYYMMDD_HHMMSS.png）からページ番号を読み取り、
+    同じページを複数回キャプチャしている場合は最も新しいものを使います。
+    フレームストアの索引（frames.json）がある場合は、索引に記録された画像も同じように扱います。
+
+    Args:
+        screenshots_dir: スクリーンショットのディレクトリ
+
+    Returns:
+        ページ番号→スクリーンショットのパス（ページ順）
+    """
+    newest: Dict[int, Tuple[str, Path]] = {}
+    index = load_frame_index(screenshots_dir)
+    if index:
+        for page, entry in index['pages'].items():
+            path = Path(entry['file'])
+            if path.exists():
+                newest[int(page)] = (entry['captured'], path)
+    for path in Path(screenshots_dir).iterdir():
+        match = SCREENSHOT_NAME_PATTERN.match(path.name)
+        if not match:
+            continue
+        page, timestamp = int(match.group(1)), match.group(2)
+        if page not in newest or (timestamp, path.name) > (newest[page][0], newest[page][1].name):
+            newest[page] = (timestamp, path)
+    return {page: newest[page][1] for page in sorted(newest)}
+
+
+def compact_screenshots(screenshots_dir: Path, store: FrameStore, prune: bool = False) -> Dict[str, int]:
+    """
+    既存のスクリーンショットのディレクトリをフレームストアに移す
+
+    ページごとに最も新しいスクリーンショットをフレームストアに保存して索引（frames.json）を書き込みます。
+    元のPNGファイル（同じページの古いキャプチャを含む）は prune を指定した場合だけ削除します。
+
+    Args:
+        screenshots_dir: スクリーンショットのディレクトリ
+        store: 保存先のフレームストア
+        prune: 索引に記録したページの元のPNGファイルを削除するかどうか
+
+    Returns:
+        pages, new, duplicates, original_bytes, stored_bytes, pruned_files を持つ辞書
+    """
+    screenshots_dir = Path(screenshots_dir)
+    previous = load_frame_index(screenshots_dir)
+    pages = {int(page): entry for page, entry in previous['pages'].items()} if previous else {}
+    stats = {'pages': 0, 'new': 0, 'duplicates': 0, 'original_bytes': 0, 'stored_bytes': 0, 'pruned_files': 0}
+    for page, path in find_screenshots(screenshots_dir).items():
+        match = SCREENSHOT_NAME_PATTERN.match(path.name)
+        if not match:
+            # 索引に記録済みのページ
+            continue
+        frame = Frame.of(path)
+        key = frame.content_key()
+        dpi = frame.image.info.get('dpi')
+        stored_path, written = store.put(key, frame.image)
+        pages[page] = {
+            'key': key,
+            'file': str(stored_path.resolve()),
+            'captured': match.group(2),
+            'dpi': [float(value) for value in dpi] if dpi else None
+        }
+        stats['pages'] += 1
+        stats['new' if written else 'duplicates'] += 1
+        stats['stored_bytes'] += written
+    if stats['pages']:
+        write_frame_index(screenshots_dir, store, pages)
+    for path in list(screenshots_dir.iterdir()):
+        match = SCREENSHOT_NAME_PATTERN.match(path.name)
+        if not match or int(match.group(1)) not in pages:
+            continue
+        stats['original_bytes'] += path.stat().st_size
+        if prune:
+            path.unlink()
+            stats['pruned_files'] += 1
+    return stats
+
+
+def page_ranges(pages: List[int]) -> List[List[int]]:
+    """ページ番号の並びを連続する区間（[最初, 最後]）のリストにまとめる"""
+    ranges: List[List[int]] = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ranges
+
+
+def expand_page_ranges(ranges: List[List[int]]) -> List[int]:
+    """page_ranges() でまとめた区間をページ番号の並びに戻す"""
+    return [page for first, last in ranges for page in range(first, last + 1)]
+
+
+def results_pdf_pages(results: dict) -> Optional[List[int]]:
+    """
+    結果ファイルの内容から、PDFに含まれるページの番号（PDFのページ順）を求める
+
+    pdf_pages がない以前の結果ファイルは、スクリーンショットのファイル名からページ番号を読み取ります。
+
+    Args:
+        results: results.json の内容
+
+    Returns:
+        ページ番号のリスト（求められない場合None）
+    """
+    if 'pdf_pages' in results:
+        return expand_page_ranges(results['pdf_pages'])
+    pages = []
+    for path in results.get('screenshots', []):
+        match = SCREENSHOT_NAME_PATTERN.match(Path(path).name)
+        if not match:
+            return None
+        pages.append(int(match.group(1)))
+    return pages or None
+
+
+def results_screenshots(results: dict) -> Dict[int, Path]:
+    """
+    結果ファイルの内容から、記録されたスクリーンショットのパスをページ番号ごとに求める
+
+    --replay の結果ファイルは出力ディレクトリの外のスクリーンショットを記録しているため、
+    出力ディレクトリの screenshots/ にないページはこちらから探します。
+    ファイル名からページ番号を読み取れない場合（フレームストアの画像）は pdf_pages の順に対応させます。
+
+    Args:
+        results: results.json の内容
+
+    Returns:
+        ページ番号→スクリーンショットのパス（存在するものだけ）
+    """
+    paths = [Path(path) for path in results.get('screenshots', [])]
+    matches = [SCREENSHOT_NAME_PATTERN.match(path.name) for path in paths]
+    if all(matches):
+        pages = [int(match.group(1)) for match in matches]
+    else:
+        pages = results_pdf_pages(results) or []
+        if len(pages) != len(paths):
+            return {}
+    return {page: path for page, path in zip(pages, paths) if path.exists()}
+
+
+def merge_results(previous: dict, current: dict) -> dict:
+    """
+    既存のPDFに追記した実行の結果を、前回までの結果ファイルの内容とまとめる
+
+    ページごとの一覧（スクリーンショット・テキストファイル・PDFのページ番号・ローカルOCRの振り分け）は
+    前回までのページに今回のページを加え、それ以外の項目は今回の実行の値を使います。
+
+    Args:
+        previous: 前回までの results.json の内容
+        current: 今回の実行の結果
+
+    Returns:
+        まとめた結果
+    """
+    merged = dict(current)
+    # 今回PDFに追加できたページがない場合は前回のPDFのまま
+    if not merged.get('pdf_file'):
+        merged['pdf_file'] = previous.get('pdf_file')
+        if 'pdf' in previous:
+            merged['pdf'] = previous['pdf']
+    for field in ('screenshots', 'text_files'):
+        if field in previous or field in current:
+            merged[field] = previous.get(field, []) + current.get(field, [])
+    merged['total_pages'] = len(merged['screenshots'])
+    previous_pages = results_pdf_pages(previous) or []
+    merged['pdf_pages'] = page_ranges(previous_pages + expand_page_ranges(current.get('pdf_pages', [])))
+
+    if 'ocr_routing' in previous and 'ocr_routing' in current:
+        routing = dict(current['ocr_routing'])
+        routing['pages'] = {**previous['ocr_routing']['pages'], **current['ocr_routing']['pages']}
+        for field in ('engine', 'reason'):
+            counts: Dict[str, int] = {}
+            for route in routing['pages'].values():
+                counts[route[field]] = counts.get(route[field], 0) + 1
+            routing[field + 's'] = counts
+        merged['ocr_routing'] = routing
+
+    runs = previous.get('append_runs') or [{
+        'pdf_pages': page_ranges(previous_pages),
+        'written_bytes': previous.get('pdf', {}).get('bytes')
+    }]
+    merged['append_runs'] = runs + [{
+        'pdf_pages': current.get('pdf_pages', []),
+        'written_bytes': current.get('pdf', {}).get('written_bytes')
+    }]
+    return merged
+
+
+class CaptureSession:
+    """
+    KindlePDF.capture_pages() でキャプチャした1冊分の状態
+
+    文字起こしとPDFへの追記はキャプチャ後もバックグラウンドで続いており、
+    KindlePDF.finish_pages() に渡すと完了を待って結果ファイルを作成します。
+    """
+
+    def __init__(self, num_pages: int, screenshot_paths: Dict[int, Path], text_paths: Dict[int, Path],
+                 pipeline, pdf_writer: StreamingPDFWriter):
+        self.num_pages = num_pages
+        self.screenshot_paths = screenshot_paths
+        self.text_paths = text_paths
+        self.pipeline = pipeline
+        self.pdf_writer = pdf_writer
+        self.settle_times: List[dict] = []
+        self.resume_state: Optional[dict] = None
+        # 再開時に、キャプチャ済みとして記録されているが画像が見つからなかったページ
+        self.missing_pages: List[int] = []
+        self.interrupted: Optional[BaseException] = None
+        self.duplicate_count = 0
+        self.end_of_book = False
+        self.capture_seconds = 0.0
+
+
+class KindlePDF:
+    """Kindleアプリの自動ページめくりとスクリーンショット取得＋PDF化・LLM文字起こし処理クラス"""
+    
+    def __init__(self, output_dir: str = "kindle_pdf_output", api_key: Optional[str] = None, enable_ocr: bool = False,
+                 adaptive_settle: bool = False, settle_timeout: float = 5.0,
+                 focus_manager: Optional[FocusManager] = None,
+                 cache_dir: Optional[str] = None, cache_max_mb: float = 100.0, use_cache: bool = True,
+                 detect_duplicates: bool = False, end_after: int = 3, hash_threshold: int = 6,
+                 auto_crop: bool = False, ocr_batch_size: int = 1,
+                 backend: Optional[TranscriptionBackend] = None, rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 pdf_profile: str = 'jpeg', pdf_dpi: Optional[float] = None, pdf_jpeg_quality: int = 75,
+                 convert_workers: int = 0, max_in_flight: Optional[int] = None,
+                 ocr_concurrency: int = 0, ocr_timeout: Optional[float] = None,
+                 transcription_cache: Optional['TranscriptionCache'] = None,
+                 text_index: Optional[TextIndex] = None, book_title: Optional[str] = None,
+                 ocr_router: Optional[OCRRouter] = None, frame_store: Optional[FrameStore] = None,
+                 append_pdf: bool = False, work_queue: Optional['WorkQueue'] = None, queue_ocr: bool = False,
+                 upload_profile: str = 'jpeg', upload_max_size: Optional[int] = None):
+        """
+        初期化
+        
+        Args:
+            output_dir: 出力ディレクトリ
+            api_key: Gemini APIキー（LLM文字起こしを使用する場合）
+            enable_ocr: LLM文字起こしを有効にするかどうか
+            adaptive_settle: 固定の待機時間の代わりに画面の静止を検出してからキャプチャするかどうか
+            settle_timeout: 画面の静止を待つ最大時間（秒）
+            focus_manager: Kindleアプリの前面表示を管理するFocusManager（指定しない場合はAppleScriptFocusManager）
+            cache_dir: 文字起こしキャッシュのディレクトリ（指定しない場合は ~/.cache/kindle_ocr/transcriptions）
+            cache_max_mb: 文字起こしキャッシュの最大サイズ（MB）
+            use_cache: 文字起こしキャッシュを使用するかどうか
+            detect_duplicates: 直前のページと同じ画面を検出して、ページめくりの再試行と本の終わりの判定を行うかどうか
+            end_after: 同じ画面が何回続いたら本の終わりとみなすか
+            hash_threshold: 同じ画面とみなす知覚ハッシュの最大ハミング距離（256ビット中）
+            auto_crop: スクリーンショットを本のページ領域に切り抜いてから保存するかどうか
+            ocr_batch_size: 1回のLLMリクエストでまとめて文字起こしするページ数
+            backend: 文字起こしに使うLLMバックエンド（指定しない場合はGeminiBackend）
+            rate_limiter: LLMリクエストのレート制限（指定しない場合は制限なし）
+            retry_policy: 一時的なエラーの再試行方法（指定しない場合は既定のRetryPolicy）
+            pdf_profile: PDFの出力プロファイル（auto / jpeg / gray / bilevel）
+            pdf_dpi: PDFのページサイズの計算に使う解像度（指定しない場合は画像に記録された解像度、なければ100）
+            pdf_jpeg_quality: PDFにJPEGで埋め込むページの品質
+            convert_workers: PDF作成・再処理で画像を並列に変換するプロセス数（0の場合は並列化しない）
+            max_in_flight: 並列変換で同時に処理中にするページ数の上限（指定しない場合はプロセス数の2倍）
+            ocr_concurrency: 非同期に同時送信するLLMリクエスト数（0の場合はワーカースレッドで文字起こしする）
+            ocr_timeout: 非同期文字起こしの1回のリクエストのタイムアウト（秒）
+            transcription_cache: 他のインスタンスと共有する文字起こしキャッシュ（指定した場合は cache_dir より優先）
+            text_index: 文字起こし結果を保存するたびに登録する全文検索インデックス
+            book_title: 全文検索インデックスに登録する本のタイトル（指定しない場合は出力ディレクトリ名）
+            ocr_router: 先にローカルOCRで文字起こしし、難しいページだけをLLMに回す振り分け（指定しない場合は全ページLLM）
+            frame_store: キャプチャした画面を重複を除いて保存するフレームストア（指定しない場合は screenshots/ にPNGで保存）
+            append_pdf: 前回の結果ファイル（results.json）のPDFに今回のページを追記し、結果ファイルをまとめるかどうか
+            work_queue: キャプチャしたページをPDF化・文字起こしせずに登録する作業キュー（処理はワーカーが行う）
+            queue_ocr: 作業キューに登録したページをワーカーに文字起こしさせるかどうか
+            upload_profile: LLMにアップロードする画像のプロファイル（auto / jpeg / gray / bilevel）
+            upload_max_size: LLMにアップロードする画像の長辺の最大ピクセル数（指定しない場合はプロファイルごとの既定値）
+        """
+        # LLM文字起こしの設定
+        self.enable_ocr = enable_ocr
+        self.backend = backend
+        if self.enable_ocr:
+            if self.backend is None:
+                # APIキーの設定
+                self.api_key = api_key or os.getenv('GEMINI_API_KEY')
+                if not self.api_key:
+                    raise ValueError(
+                        "LLM文字起こしを有効にするには、Gemini APIキーが必要です。\n"
+                        "環境変数 GEMINI_API_KEY を設定するか、--api-key オプションで指定してください。"
+                    )
+                self.backend = GeminiBackend(self.api_key)
+            self.model_name = self.backend.model_name
+            print(f"✅ LLM文字起こし機能を有効にしました（{self.model_name}）")
+        
+        # LLMリクエストのレート制限と再試行
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        
+        # 複数ページをまとめて文字起こしする設定と、LLMの使用量の集計
+        self.ocr_batch_size = max(1, ocr_batch_size)
+        self.ocr_concurrency = max(0, ocr_concurrency)
+        self.ocr_timeout = ocr_timeout
+        self.llm_usage = {
+            'requests': 0, 'pages': 0, 'prompt_tokens': 0, 'output_tokens': 0, 'total_tokens': 0,
+            'retries': 0, 'failed_requests': 0, 'upload_bytes': 0
+        }
+        self._usage_lock = threading.Lock()
+        
+        # LLMにアップロードする画像の形式と、ページごとに選んだプロファイルの集計
+        self.upload_encoder = UploadEncoder(upload_profile, upload_max_size)
+        self.upload_profiles: Dict[str, int] = {}
+        
+        # 文字起こしキャッシュの設定（同じ画面の再文字起こしを省略）
+        self.transcription_cache = transcription_cache if self.enable_ocr and use_cache else None
+        if self.enable_ocr and use_cache and self.transcription_cache is None:
+            cache_path = Path(cache_dir) if cache_dir else Path.home() / '.cache' / 'kindle_ocr' / 'transcriptions'
+            self.transcription_cache = TranscriptionCache(cache_path, max_bytes=int(cache_max_mb * 1024 * 1024))
+            print(f"✅ 文字起こしキャッシュ: {cache_path}")
+        
+        # ローカルOCRとLLMの振り分けと、ページごとに使ったエンジンの記録
+        self.ocr_router = ocr_router if self.enable_ocr else None
+        self.page_routes: Dict[int, dict] = {}
+        if self.ocr_router:
+            print(f"✅ ローカルOCRを先に使用します（{self.ocr_router.engine.name}、"
+                  f"信頼度 {self.ocr_router.min_confidence:g} 未満や図・表のページはLLM）")
+        
+        # 出力ディレクトリの設定
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+        
+        # スクリーンショット保存用ディレクトリ
+        self.screenshots_dir = self.output_dir / "screenshots"
+        self.screenshots_dir.mkdir(exist_ok=True)
+        
+        # フレームストアを使う場合、キャプチャした画面はストアに保存し、ページと画像の対応を索引に記録する
+        self.frame_store = frame_store
+        self.frame_pages: Dict[int, dict] = {}
+        self.frame_bytes = {'frames': 0, 'new': 0, 'duplicates': 0, 'original': 0, 'stored': 0}
+        self.frame_collected = (0, 0)
+        
+        # PDFに追加したページの番号（PDFのページ順）と、追記する場合の前回の結果ファイルの内容
+        self.pdf_pages: List[int] = []
+        self.append_pdf = append_pdf
+        self.append_results: Optional[dict] = None
+        
+        # 作業キューを使う場合、PDF用の変換と文字起こしはワーカー（QueueWorker）が行う
+        self.work_queue = work_queue
+        self.queue_ocr = queue_ocr
+        self.queued_pages: List[int] = []
+        
+        # LLM文字起こし結果保存用ディレクトリ（有効な場合のみ）
+        if self.enable_ocr:
+            self.texts_dir = self.output_dir / "texts"
+            self.texts_dir.mkdir(exist_ok=True)
+        
+        # 文字起こし結果の全文検索インデックス
+        self.text_index = text_index if self.enable_ocr else None
+        self.book_title = book_title or self.output_dir.resolve().name
+        
+        # ページめくり後の待機方法の設定
+        self.adaptive_settle = adaptive_settle
+        self.frame_source = LowResFrameSource()
+        self.settle_detector = PageSettleDetector(self.capture_frame, timeout=settle_timeout)
+        self.last_settle: Optional[Tuple[float, bool]] = None
+        # Kindleアプリの前面表示（フォーカスが失われた場合のみ再activateする）
+        self.focus_manager = focus_manager or AppleScriptFocusManager()
+        
+        # ページごとの処理状況を記録するジャーナルと、処理段階ごとの所要時間のトレース
+        self.journal = PageJournal(self.output_dir / "journal.jsonl")
+        self.tracer = StageTracer(self.output_dir / "trace.jsonl")
+        
+        # 重複ページ（ページめくり失敗・本の終わり）の検出設定
+        self.detect_duplicates = detect_duplicates
+        self.end_after = max(1, end_after)
+        self.hash_threshold = hash_threshold
+        
+        # ページ領域の自動切り抜きの設定
+        self.auto_crop = auto_crop
+        self.region_detector = PageRegionDetector()
+        self.crop_bytes = {'original': 0, 'cropped': 0}
+        
+        # ファイルの書き込み（処理中のみ別スレッドで実行）
+        self.writer = BackgroundWriter(tracer=self.tracer)
+        
+        # PDFの出力設定と、最後に作成したPDFの統計
+        if pdf_profile not in StreamingPDFWriter.PROFILES:
+            raise ValueError(f"不明なPDF出力プロファイルです: {pdf_profile}")
+        self.pdf_profile = pdf_profile
+        self.pdf_dpi = pdf_dpi
+        self.pdf_jpeg_quality = pdf_jpeg_quality
+        self.pdf_stats: Optional[dict] = None
+        
+        # 取得済みの画像をまとめて変換する場合の並列化の設定
+        self.converter = ParallelPageConverter(convert_workers, max_in_flight)
+        
+        mode_text = "PDF化" if not self.enable_ocr else "PDF化＋LLM文字起こし"
+        print(f"✅ Kindle {mode_text}アプリを初期化しました")
+        print(f"   出力ディレクトリ: {self.output_dir.absolute()}")
+    
+    def open_kindle_app(self) -> bool:
+        """
+        Kindleアプリを開く
+        
+        Returns:
+            成功した場合True
+        """
+        print("\n📚 Kindleアプリを開いています...")
+        
+        try:
+            # AppleScriptでKindleアプリを開く（複数のアプリ名を試す）
+            app_names = ["Kindle", "Amazon Kindle"]
+            opened = False
+            
+            for app_name in app_names:
+                try:
+                    script = f'''
+                    tell application "{app_name}"
+                        activate
+                    end tell
+                    '''
+                    subprocess.run(['osascript', '-e', script], check=True, capture_output=True)
+                    print(f"✅ Kindleアプリ（{app_name}）を開きました")
+                    opened = True
+                    break
+                except subprocess.CalledProcessError:
+                    continue
+            
+            if not opened:
+                # アプリが既に実行中の場合はactivateのみ試す
+                try:
+                    subprocess.run(['osascript', '-e', 'tell application "System Events" to set frontmost of process "Kindle" to true'], 
+                                 check=True, capture_output=True)
+                    print("✅ Kindleアプリを前面に表示しました")
+                    opened = True
+                except:
+                    pass
+            
+            if opened:
+                # アプリが起動するまで待機
+                time.sleep(3)
+                return True
+            else:
+                print("❌ Kindleアプリを開けませんでした")
+                print("   Kindleアプリがインストールされているか確認してください")
+                print("   または、--skip-open オプションを使用して手動でKindleアプリを開いてください")
+                return False
+            
+        except Exception as e:
+            print(f"❌ エラー: {e}")
+            print("   --skip-open オプションを使用して手動でKindleアプリを開いてください")
+            return False
+        except Exception as e:
+            print(f"❌ エラー: {e}")
+            return False
+    
+    def activate_kindle_app(self) -> bool:
+        """
+        Kindleアプリを前面に表示する
+        
+        既に前面にある場合はactivateを省略します。
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            with self.tracer.span('activate'):
+                return self.focus_manager.ensure_focus()
+        except Exception as e:
+            print(f"  ⚠️ Kindleアプリを前面に表示できませんでした: {e}")
+            self.focus_manager.invalidate()
+            return False
+    
+    def close(self):
+        """常駐プロセスなどのリソースを解放する"""
+        self.focus_manager.close()
+    
+    def take_screenshot(self, page_number: int) -> Optional[Path]:
+        """
+        スクリーンショットを取得
+        
+        Args:
+            page_number: ページ番号
+            
+        Returns:
+            保存されたスクリーンショットのパス
+        """
+        # スクリーンショット取得前にKindleアプリを前面に表示
+        self.activate_kindle_app()
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"page_{page_number:04d}_{timestamp}.png"
+        screenshot_path = self.screenshots_dir / filename
+        
+        try:
+            # macOSのscreencaptureコマンドを使用
+            with self.tracer.span('capture'):
+                subprocess.run(
+                    ['screencapture', '-x', str(screenshot_path)],
+                    check=True,
+                    capture_output=True
+                )
+            print(f"  📸 スクリーンショット保存: {filename}")
+            return screenshot_path
+            
+        except subprocess.CalledProcessError as e:
+            print(f"  ❌ スクリーンショット取得エラー: {e}")
+            return None
+        except Exception as e:
+            print(f"  ❌ エラー: {e}")
+            return None
+    
+    def capture_page(self, page_number: int) -> Optional[Frame]:
+        """
+        スクリーンショットを取得し、デコード済みのフレームとして返す
+        
+        auto_crop が有効な場合はメモリ上で切り抜きます（frame.dirty がTrueになり、
+        切り抜いた画像の保存は呼び出し側が archive_frame() で行います）。
+        
+        Args:
+            page_number: ページ番号
+            
+        Returns:
+            ページの画面（取得に失敗した場合None）
+        """
+        screenshot_path = self.take_screenshot(page_number)
+        if not screenshot_path:
+            return None
+        frame = Frame(path=screenshot_path)
+        try:
+            with self.tracer.span('decode'):
+                frame.image
+        except Exception as e:
+            print(f"  ❌ スクリーンショットの読み込みエラー: {e}")
+            return None
+        if self.auto_crop:
+            with self.tracer.span('crop'):
+                self.crop_frame(frame)
+        return frame
+    
+    def crop_frame(self, frame: Frame) -> bool:
+        """
+        フレームの画像を本のページ領域に切り抜く（ファイルは変更しない）
+        
+        ページ領域は前回の検出結果を再利用し、Kindleの表示領域が変わった場合のみ検出し直します。
+        
+        Args:
+            frame: ページの画面
+            
+        Returns:
+            切り抜いた場合True（ページ領域を検出できない場合は元の画像のまま）
+        """
+        img = frame.image
+        detections = self.region_detector.detections
+        region = self.region_detector.region_for(img)
+        if region is None or region == (0, 0) + img.size:
+            print(f"  ⚠️ ページ領域を検出できなかったため切り抜きをスキップします")
+            return False
+        if self.region_detector.detections != detections:
+            print(f"  ✂️ ページ領域を検出しました: {region}")
+        frame.replace_image(img.crop(region))
+        return True
+    
+    def archive_frame(self, frame: Frame, path: Path, original_size: Optional[int] = None):
+        """
+        切り抜いたフレームをスクリーンショットとして保存する（書き込みスレッドで実行）
+        
+        Args:
+            frame: ページの画面
+            path: 保存先のパス
+            original_size: 切り抜く前のファイルのバイト数（省略した場合は上書きする前の保存先のサイズ）
+        """
+        if original_size is None:
+            original_size = path.stat().st_size if path.exists() else 0
+        with self.tracer.span('archive'):
+            cropped_size = frame.save_png(path)
+        self.crop_bytes['original'] += original_size
+        self.crop_bytes['cropped'] += cropped_size
+    
+    def store_frame(self, page_number: int, frame: Frame) -> Path:
+        """
+        フレームをフレームストアに保存する（画像の書き込みと元のスクリーンショットの削除は書き込みスレッドで行う）
+        
+        Args:
+            page_number: ページ番号
+            frame: ページの画面（切り抜き済みの場合は切り抜いた画像を保存）
+            
+        Returns:
+            フレームストアでの画像のパス
+        """
+        with self.tracer.span('store.key'):
+            key = frame.content_key()
+        path = self.frame_store.path_for(key).resolve()
+        dpi = frame.image.info.get('dpi')
+        self.frame_pages[page_number] = {
+            'key': key,
+            'file': str(path),
+            'captured': datetime.now().strftime("%Y%m%d_%H%M%S"),
+            'dpi': [float(value) for value in dpi] if dpi else None
+        }
+        self.writer.submit(self._write_stored_frame, frame, key, frame.path)
+        frame.path = path
+        return path
+    
+    def _write_stored_frame(self, frame: Frame, key: str, original_path: Path):
+        """フレームストアに画像を書き込み、screencaptureで保存したファイルを削除する（書き込みスレッドで実行）"""
+        with self.tracer.span('archive'):
+            path, written = self.frame_store.put(key, frame.image)
+        frame.dirty = False
+        self.frame_bytes['frames'] += 1
+        if written:
+            self.frame_bytes['new'] += 1
+            self.frame_bytes['stored'] += written
+        else:
+            self.frame_bytes['duplicates'] += 1
+        if original_path and original_path.resolve() != path.resolve():
+            try:
+                self.frame_bytes['original'] += original_path.stat().st_size
+                original_path.unlink()
+            except FileNotFoundError:
+                pass
+    
+    def save_frame_index(self, screenshot_paths: Dict[int, Path]) -> Optional[Path]:
+        """
+        ページと画像の対応を本の索引（screenshots/frames.json）に書き込み、保持方針を適用する
+        
+        以前の索引にあって今回キャプチャしていないページはそのまま残し、
+        キャプチャし直したページは新しい画像に置き換えます。
+        
+        Args:
+            screenshot_paths: ページ番号→スクリーンショットのパス
+            
+        Returns:
+            索引のパス（フレームストアを使わない場合None）
+        """
+        if not self.frame_store:
+            return None
+        previous = load_frame_index(self.screenshots_dir)
+        pages = {int(page): entry for page, entry in previous['pages'].items()} if previous else {}
+        objects_dir = self.frame_store.objects_dir.resolve()
+        for page, path in screenshot_paths.items():
+            if page in self.frame_pages:
+                pages[page] = self.frame_pages[page]
+            elif (page not in pages or Path(pages[page]['file']) != path) and path.parent.parent.resolve() == objects_dir \
+                    and path.exists():
+                # 強制終了した実行でキャプチャしたページ（ジャーナルのパスから復元）
+                pages[page] = {
+                    'key': path.name.split('.')[0],
+                    'file': str(path),
+                    'captured': datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y%m%d_%H%M%S"),
+                    'dpi': None
+                }
+        index_path = write_frame_index(self.screenshots_dir, self.frame_store, pages)
+        self.frame_collected = self.frame_store.apply_retention()
+        return index_path
+    
+    def capture_frame(self) -> 'Image.Image':
+        """
+        ページの描画完了検出用に、現在の画面の中央部分を低解像度で取得
+        
+        Returns:
+            画面の中央部分の画像
+        """
+        # pyautoguiがない場合は MissingDependencyError（RuntimeError）
+        return self.frame_source()
+    
+    def prepare_image(self, image) -> Tuple[Optional[str], Optional[str], Optional[UploadPayload]]:
+        """
+        文字起こし用に画像のキャッシュの確認とアップロード用の画像への変換を行う
+        
+        デコード済みの画像・キャッシュキー・アップロード用の画像はフレームにキャッシュされたものを使います。
+        
+        Args:
+            image: ページの画面（画像ファイルのパスも可）
+            
+        Returns:
+            (キャッシュキー, キャッシュ済みの文字起こし結果, アップロード用の画像)
+            キャッシュにある場合はアップロード用の画像はNone
+        """
+        frame = Frame.of(image)
+        with self.tracer.span('ocr.prepare'):
+            # 同じ画素の画像は以前の文字起こし結果を再利用
+            cache_key = None
+            if self.transcription_cache:
+                cache_key = frame.cache_key(self.model_name, self.upload_encoder)
+                cached_text = self.transcription_cache.get(cache_key)
+                if cached_text is not None:
+                    return cache_key, cached_text, None
+            
+            # アップロードプロファイルに応じて縮小・減色（LLMの処理能力と画像のトークン数を考慮）
+            payload = frame.upload_payload(self.upload_encoder)
+            with self._usage_lock:
+                self.llm_usage['upload_bytes'] += len(payload.data)
+                self.upload_profiles[payload.profile] = self.upload_profiles.get(payload.profile, 0) + 1
+            return cache_key, None, payload
+    
+    def estimate_tokens(self, num_pages: int) -> int:
+        """
+        レート制限用に、これまでの実績からリクエストのトークン数を見積もる
+        
+        Args:
+            num_pages: リクエストに含まれるページ数
+            
+        Returns:
+            見積もりトークン数
+        """
+        with self._usage_lock:
+            pages = self.llm_usage['pages']
+            per_page = self.llm_usage['total_tokens'] / pages if pages else 1500
+        return int(per_page * num_pages)
+    
+    def generate_content(self, parts: list, num_pages: int) -> BackendResponse:
+        """
+        LLMにリクエストを送信し、使用量を集計する
+        
+        送信前にレート制限の枠を確保し、一時的なエラー（429・5xx・タイムアウト）の場合は
+        ジッター付き指数バックオフで再試行します。
+        
+        Args:
+            parts: プロンプトと画像のリスト
+            num_pages: リクエストに含まれるページ数
+            
+        Returns:
+            LLMの応答
+        """
+        estimated_tokens = self.estimate_tokens(num_pages)
+        attempt = 0
+        while True:
+            with self.tracer.span('sleep.throttle'):
+                self.rate_limiter.acquire(estimated_tokens)
+            try:
+                with self.tracer.span('ocr.request'):
+                    response = self.backend.generate(parts)
+                break
+            except Exception as e:
+                delay = self.retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                self.tracer.sleep('sleep.retry', delay)
+        
+        self.record_usage(estimated_tokens, response, num_pages)
+        return response
+    
+    async def generate_content_async(self, parts: list, num_pages: int, timeout: Optional[float] = None) -> BackendResponse:
+        """
+        generate_content() の非同期版
+        
+        レート制限と再試行の待機はイベントループをブロックせずに行います。
+        timeout 秒以内に応答がない場合はタイムアウト（再試行の対象）として扱います。
+        
+        Args:
+            parts: プロンプトと画像のリスト
+            num_pages: リクエストに含まれるページ数
+            timeout: 1回のリクエストのタイムアウト（秒、Noneの場合は無制限）
+            
+        Returns:
+            LLMの応答
+        """
+        estimated_tokens = self.estimate_tokens(num_pages)
+        attempt = 0
+        while True:
+            with self.tracer.span('sleep.throttle'):
+                await self.rate_limiter.acquire_async(estimated_tokens)
+            try:
+                with self.tracer.span('ocr.request'):
+                    try:
+                        response = await asyncio.wait_for(self.backend.generate_async(parts), timeout)
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(f"{timeout}秒以内に応答がありませんでした")
+                break
+            except Exception as e:
+                delay = self.retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                with self.tracer.span('sleep.retry'):
+                    await asyncio.sleep(delay)
+        
+        self.record_usage(estimated_tokens, response, num_pages)
+        return response
+    
+    def retry_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """
+        失敗したリクエストを再試行するまでの待機時間を決め、再試行・失敗の回数を集計する
+        
+        Args:
+            attempt: これまでの再試行回数
+            error: 発生したエラー
+            
+        Returns:
+            待機時間（秒）。再試行しない場合None
+        """
+        delay = self.retry_policy.next_delay(attempt, error)
+        with self._usage_lock:
+            self.llm_usage['failed_requests' if delay is None else 'retries'] += 1
+        if delay is not None:
+            print(f"  🔁 一時的なエラーのため{delay:.1f}秒後に再試行します（{attempt + 1}/{self.retry_policy.max_retries}）: {error}")
+        return delay
+    
+    def record_usage(self, estimated_tokens: int, response: BackendResponse, num_pages: int):
+        """
+        成功したリクエストのトークン使用量を集計し、レート制限の見積もりとの差を精算する
+        
+        Args:
+            estimated_tokens: 送信前の見積もりトークン数
+            response: LLMの応答
+            num_pages: リクエストに含まれるページ数
+        """
+        self.rate_limiter.settle(estimated_tokens, response.total_tokens)
+        with self._usage_lock:
+            self.llm_usage['requests'] += 1
+            self.llm_usage['pages'] += num_pages
+            self.llm_usage['prompt_tokens'] += response.prompt_tokens
+            self.llm_usage['output_tokens'] += response.output_tokens
+            self.llm_usage['total_tokens'] += response.total_tokens
+    
+    def extract_text_from_image(self, image) -> Optional[str]:
+        """
+        LLM（Gemini）を使って画像からテキストを文字起こし
+        
+        OCRではなく、LLMの文脈理解能力を使って自然な文章として文字起こしします。
+        
+        Args:
+            image: ページの画面（画像ファイルのパスも可）
+            
+        Returns:
+            文字起こしされたテキスト
+        """
+        if not self.enable_ocr:
+            return None
+        
+        print(f"  🤖 LLMで文字起こし中...")
+        
+        try:
+            # 画像を読み込んで準備
+            cache_key, cached_text, payload = self.prepare_image(image)
+            if cached_text is not None:
+                print(f"  ♻️ キャッシュから文字起こし結果を取得しました（{len(cached_text)}文字）")
+                return cached_text
+            
+            response = self.generate_content(
+                [TRANSCRIPTION_PROMPT, payload.part()],
+                num_pages=1
+            )
+            return self._finish_text(cache_key, response.text)
+            
+        except Exception as e:
+            print(f"  ❌ 文字起こしエラー: {e}")
+            return None
+    
+    async def extract_text_async(self, image, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        extract_text_from_image() の非同期版（画像の準備とキャッシュへの保存はスレッドで行う）
+        
+        Args:
+            image: ページの画面（画像ファイルのパスも可）
+            timeout: 1回のリクエストのタイムアウト（秒）
+            
+        Returns:
+            文字起こしされたテキスト
+        """
+        if not self.enable_ocr:
+            return None
+        
+        print(f"  🤖 LLMで文字起こし中...")
+        
+        try:
+            cache_key, cached_text, payload = await run_in_thread(self.prepare_image, image)
+            if cached_text is not None:
+                print(f"  ♻️ キャッシュから文字起こし結果を取得しました（{len(cached_text)}文字）")
+                return cached_text
+            
+            response = await self.generate_content_async(
+                [TRANSCRIPTION_PROMPT, payload.part()],
+                num_pages=1,
+                timeout=timeout
+            )
+            return await run_in_thread(self._finish_text, cache_key, response.text)
+            
+        except Exception as e:
+            print(f"  ❌ 文字起こしエラー: {e}")
+            return None
+    
+    def _finish_text(self, cache_key: Optional[str], text: str) -> str:
+        """1ページ分の応答を整えてキャッシュに保存する"""
+        transcribed_text = text.strip()
+        print(f"  ✅ 文字起こし完了（{len(transcribed_text)}文字）")
+        if cache_key and transcribed_text:
+            self.transcription_cache.put(cache_key, transcribed_text)
+        return transcribed_text
+    
+    def extract_texts_from_images(self, images: list) -> List[Optional[str]]:
+        """
+        複数ページの画像を1回のLLMリクエストでまとめて文字起こし
+        
+        プロンプトは1回だけ送信し、ページごとの結果をJSONで受け取ります。
+        
+        Args:
+            images: ページの画面（画像ファイルのパスも可）のリスト
+            
+        Returns:
+            ページごとの文字起こし結果（応答から取り出せなかったページはNone）
+        """
+        texts, pending = self._prepare_batch(images)
+        if not pending:
+            return texts
+        
+        print(f"  🤖 LLMで{len(pending)}ページをまとめて文字起こし中...")
+        try:
+            response = self.generate_content(self._batch_parts(pending), num_pages=len(pending))
+            parsed = parse_batch_response(response.text, len(pending))
+        except Exception as e:
+            print(f"  ❌ 文字起こしエラー: {e}")
+            parsed = {}
+        return self._apply_batch(texts, pending, parsed)
+    
+    async def extract_texts_async(self, images: list, timeout: Optional[float] = None) -> List[Optional[str]]:
+        """
+        extract_texts_from_images() の非同期版（画像の準備とキャッシュへの保存はスレッドで行う）
+        
+        Args:
+            images: ページの画面（画像ファイルのパスも可）のリスト
+            timeout: 1回のリクエストのタイムアウト（秒）
+            
+        Returns:
+            ページごとの文字起こし結果（応答から取り出せなかったページはNone）
+        """
+        texts, pending = await run_in_thread(self._prepare_batch, images)
+        if not pending:
+            return texts
+        
+        print(f"  🤖 LLMで{len(pending)}ページをまとめて文字起こし中...")
+        try:
+            response = await self.generate_content_async(self._batch_parts(pending), len(pending), timeout)
+            parsed = parse_batch_response(response.text, len(pending))
+        except Exception as e:
+            print(f"  ❌ 文字起こしエラー: {e}")
+            parsed = {}
+        return await run_in_thread(self._apply_batch, texts, pending, parsed)
+    
+    def _prepare_batch(self, images: list) -> Tuple[List[Optional[str]], list]:
+        """
+        まとめて文字起こしするページのキャッシュを確認し、送信が必要なページの画像を準備する
+        
+        Returns:
+            (キャッシュから取得した文字起こし結果のリスト, (位置, キャッシュキー, アップロード用の画像) のリスト)
+        """
+        frames = [Frame.of(image) for image in images]
+        texts: List[Optional[str]] = [None] * len(frames)
+        pending = []
+        for i, frame in enumerate(frames):
+            try:
+                cache_key, cached_text, payload = self.prepare_image(frame)
+            except Exception as e:
+                print(f"  ❌ 画像読み込みエラー ({frame.name}): {e}")
+                continue
+            if cached_text is not None:
+                texts[i] = cached_text
+            else:
+                pending.append((i, cache_key, payload))
+        
+        if len(frames) > len(pending):
+            print(f"  ♻️ {len(frames) - len(pending)}ページの文字起こし結果をキャッシュから取得しました")
+        return texts, pending
+    
+    @staticmethod
+    def _batch_parts(pending: list) -> list:
+        """まとめて文字起こしするリクエストのプロンプトと画像のリストを作る"""
+        parts = [TRANSCRIPTION_PROMPT + BATCH_TRANSCRIPTION_PROMPT.format(num_pages=len(pending))]
+        for n, (_, _, payload) in enumerate(pending, 1):
+            parts.append(f"ページ{n}:")
+            parts.append(payload.part())
+        return parts
+    
+    def _apply_batch(self, texts: List[Optional[str]], pending: list, parsed: Dict[int, str]) -> List[Optional[str]]:
+        """
+        まとめて文字起こしした応答をページごとの結果に振り分け、キャッシュに保存する
+        
+        取り出せたページ数が送信したページ数と一致しない場合は、ページの結合やずれで
+        別のページの文字起こし結果が混ざっている可能性があるため、応答をすべて破棄します
+        （すべてのページがNoneのままになり、呼び出し側で1ページずつ文字起こしし直します）。
+        """
+        if len(parsed) != len(pending):
+            print(f"  ⚠️ 応答から取り出せたページ数が一致しないため、応答を破棄します（{len(parsed)}/{len(pending)}）")
+            return texts
+        print(f"  ✅ {len(pending)}ページの文字起こし完了")
+        
+        for n, (i, cache_key, _) in enumerate(pending, 1):
+            text = parsed.get(n)
+            if text:
+                texts[i] = text
+                if cache_key:
+                    self.transcription_cache.put(cache_key, text)
+        return texts
+    
+    def save_text(self, text: str, page_number: int) -> Optional[Path]:
+        """
+        抽出したテキストをファイルに保存
+        
+        Args:
+            text: 抽出されたテキスト
+            page_number: ページ番号
+            
+        Returns:
+            保存されたファイルのパス
+        """
+        if not self.enable_ocr:
+            return None
+        
+        filename = f"page_{page_number:04d}.txt"
+        text_path = self.texts_dir / filename
+        
+        with self.tracer.span('ocr.write'), open(text_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        
+        return text_path
+    
+    def record_text(self, page_number: int, text: Optional[str], elapsed: float,
+                    screenshot: Optional[Path] = None, engine: str = 'llm') -> Optional[Path]:
+        """
+        文字起こし結果を保存し、ジャーナルと全文検索インデックスに記録する
+        
+        Args:
+            page_number: ページ番号
+            text: 文字起こし結果（失敗した場合None）
+            elapsed: 文字起こしにかかった時間（秒）
+            screenshot: 文字起こししたスクリーンショットのパス
+            engine: 文字起こしに使ったエンジン（local / llm）
+            
+        Returns:
+            保存されたテキストファイルのパス（失敗した場合None）
+        """
+        text_path = self.save_text(text, page_number) if text else None
+        if text_path:
+            print(f"  💾 テキスト保存: {text_path.name}")
+            if self.text_index:
+                try:
+                    with self.tracer.span('ocr.index'):
+                        self.text_index.add(self.output_dir, self.book_title, page_number, text, text_path, screenshot)
+                except sqlite3.Error as e:
+                    print(f"  ⚠️ 全文検索インデックスに登録できませんでした: {e}")
+        route = self.page_routes.get(page_number)
+        self.journal.append(
+            'ocr',
+            page=page_number,
+            status='ok' if text_path else 'failed',
+            text_file=str(text_path) if text_path else None,
+            engine=engine,
+            route=route['reason'] if route else None,
+            timings={'ocr': round(elapsed, 3)}
+        )
+        return text_path
+    
+    def route_pages(self, pages: list) -> Tuple[Dict[int, Optional[Path]], list]:
+        """
+        ローカルOCRで文字起こしできるページを保存し、LLMに回すページを返す
+        
+        Args:
+            pages: (ページ番号, ページの画面またはスクリーンショットのパス) のリスト
+            
+        Returns:
+            (ページ番号→保存されたテキストファイルのパス, LLMに回す (ページ番号, 画面) のリスト)
+        """
+        if not self.ocr_router:
+            return {}, pages
+        
+        results = {}
+        escalated = []
+        for page_number, image in pages:
+            self.tracer.set_page(page_number)
+            frame = Frame.of(image)
+            ocr_start = time.monotonic()
+            try:
+                with self.tracer.span('ocr.local'):
+                    decision = self.ocr_router.route(frame)
+            except Exception as e:
+                print(f"  ⚠️ ページ {page_number} のローカルOCRの判定エラー: {e}")
+                decision = RouteDecision('llm', 'local_error', None, None)
+            self.page_routes[page_number] = {
+                'engine': decision.engine, 'reason': decision.reason, 'confidence': decision.confidence
+            }
+            if decision.engine == 'local':
+                print(f"  🔎 ページ {page_number}: ローカルOCRで文字起こし（信頼度 {decision.confidence:g}、{len(decision.text)}文字）")
+                results[page_number] = self.record_text(
+                    page_number, decision.text, time.monotonic() - ocr_start, frame.path, engine='local'
+                )
+            else:
+                print(f"  🔎 ページ {page_number}: LLMで文字起こしします（{decision.reason}）")
+                escalated.append((page_number, image))
+        return results, escalated
+    
+    def transcribe_page(self, page_number: int, image) -> Optional[Path]:
+        """
+        1ページ分の文字起こしとテキスト保存を行う
+
+        Args:
+            page_number: ページ番号
+            image: ページの画面（スクリーンショットのパスも可）
+
+        Returns:
+            保存されたテキストファイルのパス（失敗した場合None）
+        """
+        self.tracer.set_page(page_number)
+        ocr_start = time.monotonic()
+        transcribed_text = self.extract_text_from_image(image)
+        return self.record_text(page_number, transcribed_text, time.monotonic() - ocr_start, Frame.of(image).path)
+    
+    def transcribe_pages(self, pages: list) -> Dict[int, Optional[Path]]:
+        """
+        複数ページの文字起こしとテキスト保存を行う
+        
+        ローカルOCRの振り分けがある場合は先にローカルOCRで文字起こしし、残りのページだけをLLMに送ります。
+        ocr_batch_size が2以上の場合はまとめて文字起こしし、
+        応答から取り出せなかったページは1ページずつ文字起こしし直します。
+        
+        Args:
+            pages: (ページ番号, ページの画面またはスクリーンショットのパス) のリスト
+            
+        Returns:
+            ページ番号と保存されたテキストファイルのパス（失敗した場合None）の対応
+        """
+        results, pages = self.route_pages(pages)
+        if self.ocr_batch_size <= 1 or len(pages) <= 1:
+            for page_number, image in pages:
+                results[page_number] = self.transcribe_page(page_number, image)
+            return results
+        
+        self.tracer.set_page([page_number for page_number, _ in pages])
+        ocr_start = time.monotonic()
+        texts = self.extract_texts_from_images([image for _, image in pages])
+        elapsed = (time.monotonic() - ocr_start) / len(pages)
+        
+        for (page_number, image), text in zip(pages, texts):
+            if text is None:
+                print(f"  🔁 ページ {page_number} を1ページずつ文字起こしし直します")
+                results[page_number] = self.transcribe_page(page_number, image)
+            else:
+                results[page_number] = self.record_text(page_number, text, elapsed, Frame.of(image).path)
+        return results
+    
+    async def transcribe_page_async(self, page_number: int, image, timeout: Optional[float] = None) -> Optional[Path]:
+        """
+        transcribe_page() の非同期版
+        
+        Args:
+            page_number: ページ番号
+            image: ページの画面（スクリーンショットのパスも可）
+            timeout: 1回のリクエストのタイムアウト（秒）
+            
+        Returns:
+            保存されたテキストファイルのパス（失敗した場合None）
+        """
+        self.tracer.set_page(page_number)
+        ocr_start = time.monotonic()
+        transcribed_text = await self.extract_text_async(image, timeout)
+        # テキストの保存・ジャーナルの fsync・全文検索インデックスへの登録はイベントループを止めないようスレッドで行う
+        return await run_in_thread(
+            self.record_text, page_number, transcribed_text, time.monotonic() - ocr_start, Frame.of(image).path
+        )
+    
+    async def transcribe_pages_async(self, pages: list, timeout: Optional[float] = None) -> AsyncIterator[Tuple[int, Optional[Path]]]:
+        """
+        transcribe_pages() の非同期版
+        
+        途中でキャンセルされた場合も保存済みのページを呼び出し元が受け取れるよう、
+        ページを保存するたびに (ページ番号, テキストファイルのパス) を返します。
+        
+        Args:
+            pages: (ページ番号, ページの画面またはスクリーンショットのパス) のリスト
+            timeout: 1回のリクエストのタイムアウト（秒）
+            
+        Returns:
+            (ページ番号, 保存されたテキストファイルのパス（失敗した場合None）) の非同期イテレータ
+        """
+        local_results, pages = await run_in_thread(self.route_pages, pages)
+        for page_number, text_path in local_results.items():
+            yield page_number, text_path
+        
+        if self.ocr_batch_size <= 1 or len(pages) <= 1:
+            for page_number, image in pages:
+                yield page_number, await self.transcribe_page_async(page_number, image, timeout)
+            return
+        
+        self.tracer.set_page([page_number for page_number, _ in pages])
+        ocr_start = time.monotonic()
+        texts = await self.extract_texts_async([image for _, image in pages], timeout)
+        elapsed = (time.monotonic() - ocr_start) / len(pages)
+        
+        for (page_number, image), text in zip(pages, texts):
+            if text is None:
+                print(f"  🔁 ページ {page_number} を1ページずつ文字起こしし直します")
+                yield page_number, await self.transcribe_page_async(page_number, image, timeout)
+            else:
+                yield page_number, await run_in_thread(self.record_text, page_number, text, elapsed, Frame.of(image).path)
+    
+    def turn_page(self, direction: str = "next") -> bool:
+        """
+        ページをめくる（シンプルにスペースキーを使用）
+        
+        Args:
+            direction: "next"（次へ）または "prev"（前へ）
+            
+        Returns:
+            成功した場合True
+        """
+        if not pyautogui.available():
+            print(f"  ❌ ページめくりには pyautogui が必要です: {pyautogui.error}")
+            return False
+        
+        # ページめくる前にKindleアプリを前面に表示
+        self.activate_kindle_app()
+        self.last_settle = None
+        
+        try:
+            if self.adaptive_settle:
+                # ページめくり前の画面を基準フレームとして記録
+                reference = self.settle_detector.snapshot()
+            else:
+                self.tracer.sleep('sleep.focus', 0.5)  # アプリが前面に来るまで少し待機
+            
+            if direction == "next":
                 # スペースキーで次ページへ
                 print(f"  🔄 スペースキーでページをめくります...")
-                pyautogui.press('space')
+                with self.tracer.span('turn'):
+                    pyautogui.press('space')
                 print(f"  ✅ スペースキーを送信しました")
-                time.sleep(2.0)  # ページが読み込まれるまで待機
-                return True
             else:
                 # 左矢印キーで前ページへ
                 print(f"  🔄 左矢印キーで前ページへ...")
-                pyautogui.press('left')
+                with self.tracer.span('turn'):
+                    pyautogui.press('left')
                 print(f"  ✅ 左矢印キーを送信しました")
-                time.sleep(2.0)
-                return True
             
+            if self.adaptive_settle:
+                # 画面が静止するまで待機
+                with self.tracer.span('sleep.settle'):
+                    self.last_settle = self.settle_detector.wait(reference)
+                settle_time, timed_out = self.last_settle
+                if timed_out:
+                    print(f"  ⚠️ {settle_time:.2f}秒以内に画面が静止しませんでした")
+                else:
+                    print(f"  ⏱️ ページの描画完了を検出しました（{settle_time:.2f}秒）")
+            else:
+                self.tracer.sleep('sleep.load', 2.0)  # ページが読み込まれるまで待機
+            return True
+            
+        except Exception as e:
+            print(f"  ❌ ページめくりエラー: {e}")
+            return False
+    
+    def start_transcription(self, ocr_workers: int = 0, ocr_queue_size: int = 4):
+        """
+        文字起こしの投入先を作成して開始する
+        
+        ocr_concurrency が1以上の場合は AsyncTranscriptionEngine、それ以外は TranscriptionPipeline を使います。
+        
+        Args:
+            ocr_workers: バックグラウンド文字起こしワーカー数（TranscriptionPipeline の場合）
+            ocr_queue_size: 文字起こし待ちの最大数
+            
+        Returns:
+            submit() と close() を持つ文字起こしの投入先
+        """
+        if self.ocr_concurrency:
+            pipeline = AsyncTranscriptionEngine(self, concurrency=self.ocr_concurrency, queue_size=ocr_queue_size,
+                                                timeout=self.ocr_timeout)
+        else:
+            pipeline = TranscriptionPipeline(self, num_workers=ocr_workers, queue_size=ocr_queue_size)
+        pipeline.start()
+        return pipeline
+    
+    def enqueue_page(self, page_number: int, path: Path, dpi: Optional[float] = None, crop_to: Optional[Path] = None):
+        """
+        ページのタスクを作業キューに登録する（キャプチャ中は画像の保存後に書き込みスレッドで実行）
+        
+        Args:
+            page_number: ページ番号
+            path: ページの画像のパス
+            dpi: pdf_dpi を指定していない場合に使う解像度（指定しない場合は画像に記録された解像度）
+            crop_to: ワーカーが本のページ領域に切り抜いて保存するパス（Noneの場合は切り抜かない）
+        """
+        task_id = self.work_queue.enqueue(
+            self.output_dir,
+            page_number,
+            path,
+            ocr=self.queue_ocr,
+            crop_to=str(crop_to) if crop_to else None,
+            pdf_profile=self.pdf_profile,
+            pdf_dpi=self.pdf_dpi if self.pdf_dpi is not None else dpi,
+            pdf_jpeg_quality=self.pdf_jpeg_quality
+        )
+        if task_id:
+            self.queued_pages.append(page_number)
+    
+    def open_pdf_writer(self, output_filename: str = None, default_dpi: Optional[float] = None) -> StreamingPDFWriter:
+        """
+        ページを逐次追記するPDFライターを開く
+        
+        Args:
+            output_filename: 出力PDFファイル名（指定しない場合は自動生成）
+            default_dpi: pdf_dpi を指定していない場合に使う解像度（指定しない場合は画像に記録された解像度）
+            
+        Returns:
+            PDFライター
+        """
+        # prepare_append() で追記先を決めている場合は既存のPDFに増分更新として追記する
+        append = output_filename is None and self.append_results is not None
+        if append:
+            pdf_path = Path(self.append_results['pdf_file'])
+        else:
+            if output_filename is None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                output_filename = f"kindle_pages_{timestamp}.pdf"
+            pdf_path = self.output_dir / output_filename
+        
+        writer = StreamingPDFWriter(
+            pdf_path,
+            resolution=self.pdf_dpi if self.pdf_dpi is not None else default_dpi,
+            jpeg_quality=self.pdf_jpeg_quality,
+            profile=self.pdf_profile,
+            append=append
+        )
+        if writer.recovered_bytes:
+            print(f"  ⚠️ 前回中断された追記の書きかけのデータ（{writer.recovered_bytes}バイト）をPDFから取り除きました")
+        return writer
+    
+    def prepare_append(self, new_pages: List[int]) -> bool:
+        """
+        前回の結果ファイルを読み込み、今回のページを既存のPDFに追記できるか確認する
+        
+        今回のページは既存のPDFの最後のページの次のページから始まり、重複や抜けなく連続している必要があります
+        （PDFにすでにあるページの取り直しや、間のページの抜けを防ぐため）。
+        前回の結果ファイルやPDFがない場合は、通常どおり新しいPDFを作成します。
+        
+        Args:
+            new_pages: 今回PDFに追加するページ番号のリスト（追加する順）
+            
+        Returns:
+            処理を続けられる場合True
+        """
+        results_path = self.output_dir / "results.json"
+        previous = None
+        if results_path.exists():
+            with open(results_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        if not previous or not previous.get('pdf_file') or not Path(previous['pdf_file']).exists():
+            print(f"   📄 追記先のPDFがないため、新しいPDFを作成します")
+            return True
+        
+        pdf_path = Path(previous['pdf_file'])
+        pages = results_pdf_pages(previous)
+        if not pages:
+            print(f"❌ 既存のPDFのページ番号がわかりません: {results_path}（--replay でPDFを作り直してください）")
+            return False
+        if len(set(pages)) != len(pages):
+            print(f"❌ 既存のPDFに同じページが重複しています: {pdf_path}")
+            return False
+        first_page = new_pages[0]
+        if first_page <= max(pages):
+            print(f"❌ ページ {first_page} は既存のPDF（{min(pages)}〜{max(pages)}ページ）と重複します"
+                  f"（--start-page {max(pages) + 1} を指定してください）")
+            return False
+        if first_page != max(pages) + 1:
+            print(f"❌ 既存のPDFは{max(pages)}ページまでのため、ページ {max(pages) + 1}〜{first_page - 1} が抜けます"
+                  f"（--start-page {max(pages) + 1} を指定してください）")
+            return False
+        duplicates = sorted({page for page in new_pages if new_pages.count(page) > 1})
+        if duplicates:
+            print(f"❌ 今回のページが重複しています: {', '.join(str(page) for page in duplicates)}")
+            return False
+        missing = sorted(set(range(first_page, max(new_pages) + 1)) - set(new_pages))
+        if missing:
+            print(f"❌ 今回のページはページ {', '.join(str(page) for page in missing)} が抜けているため、"
+                  f"既存のPDFに追記できません")
+            return False
+        
+        self.append_results = previous
+        print(f"   📎 既存のPDFに追記します: {pdf_path.name}（{min(pages)}〜{max(pages)}ページ、{len(pages)}ページ）")
+        return True
+    
+    def add_pdf_page(self, writer: StreamingPDFWriter, image, page_number: Optional[int] = None) -> bool:
+        """
+        1ページ分の画面をPDFライターに追記する
+        
+        Args:
+            writer: PDFライター
+            image: ページの画面（画像ファイルのパスも可）
+            page_number: ページ番号（結果ファイルの pdf_pages に記録）
+            
+        Returns:
+            成功した場合True
+        """
+        frame = Frame.of(image)
+        try:
+            with self.tracer.span('pdf.page'):
+                writer.add_page(frame.image)
+            if page_number is not None:
+                self.pdf_pages.append(page_number)
+            return True
+        except Exception as e:
+            print(f"  ⚠️ 画像読み込みエラー ({frame.name}): {e}")
+            return False
+    
+    def add_converted_page(self, writer: StreamingPDFWriter, result: dict, page_number: Optional[int] = None) -> bool:
+        """
+        convert_page() で変換済みのページをPDFライターに追記する
+        
+        Args:
+            writer: PDFライター
+            result: convert_page() の結果
+            page_number: ページ番号（結果ファイルの pdf_pages に記録）
+            
+        Returns:
+            成功した場合True
+        """
+        if 'error' in result:
+            print(f"  ⚠️ 画像読み込みエラー ({result['error']})")
+            return False
+        self.tracer.record('convert', result['started'], result['seconds'])
+        with self.tracer.span('pdf.page'):
+            writer.add_encoded_page(result['pdf'])
+        if page_number is not None:
+            self.pdf_pages.append(page_number)
+        return True
+    
+    def create_pdf_from_images(self, image_paths: List[Path], output_filename: str = None) -> Optional[Path]:
+        """
+        スクリーンショット画像をPDFファイルにまとめる
+        
+        画像は1枚ずつ読み込んでPDFに追記するため、ページ数に関わらずメモリ使用量は一定です。
+        convert_workers を指定した場合は複数のプロセスで並列に変換し、ページ順に追記します。
+        
+        Args:
+            image_paths: 画像ファイルのパスのリスト
+            output_filename: 出力PDFファイル名（指定しない場合は自動生成）
+            
+        Returns:
+            生成されたPDFファイルのパス
+        """
+        if not image_paths:
+            print("  ⚠️ PDF化する画像がありません")
+            return None
+        
+        print(f"  📄 {len(image_paths)}枚の画像をPDF化中...")
+        
+        writer = None
+        try:
+            writer = self.open_pdf_writer(output_filename)
+            items = ((str(img_path), writer.encoder) for img_path in sorted(image_paths))
+            for result in self.converter.map(convert_page, items):
+                self.add_converted_page(writer, result)
+            
+            return self.finish_pdf(writer)
+            
+        except Exception as e:
+            print(f"  ❌ PDF作成エラー: {e}")
+            import traceback
+            traceback.print_exc()
+            if writer:
+                writer.abort()
+            return None
+    
+    def finish_pdf(self, writer: StreamingPDFWriter) -> Optional[Path]:
+        """
+        PDFライターを閉じてPDFファイルを完成させる
+        
+        Args:
+            writer: PDFライター
+            
+        Returns:
+            生成されたPDFファイルのパス（ページがない場合None）
+        """
+        if writer.page_count == 0:
+            writer.abort()
+            print("  ❌ PDF化できる画像がありません")
+            return None
+        
+        with self.tracer.span('pdf.finish', page=writer.page_count):
+            pdf_path = writer.close()
+        pdf_bytes = pdf_path.stat().st_size
+        total_pages = writer.existing_pages + writer.page_count
+        self.pdf_stats = {
+            'profile': writer.profile,
+            'dpi': writer.resolution if writer.resolution is not None else writer.page_resolution,
+            'jpeg_quality': writer.jpeg_quality,
+            'pages': total_pages,
+            'bytes': pdf_bytes,
+            'bytes_per_page': pdf_bytes // total_pages,
+            'page_profiles': {name: count for name, count in writer.profile_counts.items() if count}
+        }
+        if writer.existing_pages:
+            # 追記の場合、page_profiles は今回追加したページの内訳
+            self.pdf_stats['appended_pages'] = writer.page_count
+            self.pdf_stats['written_bytes'] = writer.written_bytes
+            print(f"  ✅ PDFに追記しました: {pdf_path.name}（{writer.existing_pages}ページ + {writer.page_count}ページ、"
+                  f"書き込み {writer.written_bytes / 1024 / 1024:.1f}MB）")
+        else:
+            self.pdf_stats['written_bytes'] = pdf_bytes
+            print(f"  ✅ PDF作成完了: {pdf_path.name}")
+        print(f"     ページ数: {total_pages}（{pdf_bytes / 1024 / 1024:.1f}MB、1ページあたり {pdf_bytes // total_pages // 1024}KB）")
+        return pdf_path
+    
+    def advance_page(self, next_page_number: int, delay_between_pages: float, settle_times: List[dict]) -> bool:
+        """
+        次のページへめくり、ページが表示されるまで待機する
+        
+        Args:
+            next_page_number: めくった後のページ番号
+            delay_between_pages: ページ間の待機時間（秒、画面の静止検出を使う場合は無視）
+            settle_times: 画面の静止検出を使う場合に実測待機時間を追加するリスト
+            
+        Returns:
+            成功した場合True
+        """
+        self.tracer.set_page(next_page_number)
+        if not self.adaptive_settle:
+            print(f"\n  ⏳ {delay_between_pages}秒待機してから次のページへ...")
+            self.tracer.sleep('sleep.delay', delay_between_pages)
+        
+        # ページをめくる
+        print(f"\n  📖 ページをめくります...")
+        if not self.turn_page("next"):
+            return False
+        self.journal.append('turn', page=next_page_number)
+        
+        if self.adaptive_settle:
+            # 静止検出で描画完了を確認済みのため追加の待機は不要
+            settle_time, timed_out = self.last_settle
+            settle_times.append({
+                'page': next_page_number,
+                'seconds': round(settle_time, 3),
+                'timed_out': timed_out
+            })
+        else:
+            # ページが完全に読み込まれるまで追加で待機
+            print(f"  ⏳ ページの読み込みを待機中...")
+            self.tracer.sleep('sleep.load', 2.0)
+            
+            # Kindleアプリが確実に前面にあることを確認
+            self.focus_manager.invalidate()
+            self.activate_kindle_app()
+            self.tracer.sleep('sleep.focus', 1.0)
+        return True
+    
+    def build_results(self, screenshot_paths: Dict[int, Path], text_paths: Dict[int, Path],
+                      pdf_path: Optional[Path]) -> dict:
+        """
+        結果ファイル（results.json）の共通部分を作成
+        
+        Args:
+            screenshot_paths: ページ番号→スクリーンショットのパス
+            text_paths: ページ番号→テキストファイルのパス
+            pdf_path: 作成したPDFファイルのパス
+            
+        Returns:
+            結果の辞書
+        """
+        results = {
+            'total_pages': len(screenshot_paths),
+            'screenshots': [str(screenshot_paths[page]) for page in sorted(screenshot_paths)],
+            'pdf_file': str(pdf_path) if pdf_path else None,
+            'ocr_enabled': self.enable_ocr
+        }
+        
+        # PDFの出力設定とサイズ（ページごとに選ばれた形式の内訳を含む）と、PDFのページ順のページ番号
+        if pdf_path and self.pdf_stats:
+            results['pdf'] = self.pdf_stats
+        if pdf_path and self.pdf_pages:
+            results['pdf_pages'] = page_ranges(self.pdf_pages)
+        
+        # LLM文字起こしが有効な場合、テキストファイルの情報もページ順に追加
+        if self.enable_ocr:
+            results['text_files'] = [str(text_paths[page]) for page in sorted(text_paths)]
+        
+        # ページ領域の切り抜きの結果
+        if self.auto_crop:
+            results['crop'] = {
+                'region': list(self.region_detector.region) if self.region_detector.region else None,
+                'detections': self.region_detector.detections,
+                'original_bytes': self.crop_bytes['original'],
+                'cropped_bytes': self.crop_bytes['cropped']
+            }
+        
+        # LLMの使用量（バッチサイズごとの比較用）
+        if self.enable_ocr:
+            usage = dict(self.llm_usage)
+            usage['batch_size'] = self.ocr_batch_size
+            usage['backend'] = self.model_name
+            usage['throttled_seconds'] = round(self.rate_limiter.throttled_seconds, 3)
+            usage['tokens_per_page'] = round(usage['total_tokens'] / usage['pages'], 1) if usage['pages'] else None
+            usage['upload_profile'] = self.upload_encoder.label
+            usage['upload_profiles'] = dict(sorted(self.upload_profiles.items()))
+            results['llm_usage'] = usage
+        
+        # ローカルOCRとLLMの振り分け（ページごとに使ったエンジンと理由）
+        if self.ocr_router:
+            routes = {page: self.page_routes[page] for page in sorted(self.page_routes)}
+            results['ocr_routing'] = {
+                'local_engine': self.ocr_router.engine.name,
+                'min_confidence': self.ocr_router.min_confidence,
+                'engines': self.count_routes('engine'),
+                'reasons': self.count_routes('reason'),
+                'pages': {str(page): route for page, route in routes.items()}
+            }
+        
+        # 文字起こしキャッシュの統計
+        if self.transcription_cache:
+            results['transcription_cache'] = self.transcription_cache.stats()
+        
+        # フレームストアに保存した画像と、screencaptureのPNGのまま保存した場合と比べて削減したバイト数
+        if self.frame_store:
+            frame_bytes = self.frame_bytes
+            results['frame_store'] = {
+                'root': str(self.frame_store.root),
+                'codec': self.frame_store.codec,
+                'retention': self.frame_store.retention,
+                'frames': frame_bytes['frames'],
+                'new': frame_bytes['new'],
+                'duplicates': frame_bytes['duplicates'],
+                'original_bytes': frame_bytes['original'],
+                'stored_bytes': frame_bytes['stored'],
+                'saved_bytes': frame_bytes['original'] - frame_bytes['stored'],
+                'collected_files': self.frame_collected[0],
+                'collected_bytes': self.frame_collected[1]
+            }
+        
+        # 処理段階ごとの所要時間の集計（スパンの詳細は trace.jsonl）
+        results['timings'] = self.tracer.summary()
+        
+        return results
+    
+    def count_routes(self, field: str) -> Dict[str, int]:
+        """ローカルOCRとLLMの振り分けの結果を engine または reason ごとに数える"""
+        counts: Dict[str, int] = {}
+        for route in list(self.page_routes.values()):
+            counts[route[field]] = counts.get(route[field], 0) + 1
+        return counts
+    
+    def write_results(self, results: dict) -> Path:
+        """
+        結果ファイル（results.json）を保存（既存のPDFに追記した場合は results に前回までの結果をまとめる）
+        
+        Args:
+            results: 結果の辞書
+            
+        Returns:
+            保存したファイルのパス
+        """
+        # 既存のPDFに追記した場合は前回までの結果とまとめる
+        if self.append_results is not None:
+            results.update(merge_results(self.append_results, results))
+        results_path = self.output_dir / "results.json"
+        with open(results_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        return results_path
+    
+    def print_timing_summary(self, timings: dict):
+        """
+        処理段階ごとの所要時間の集計を表示
+        
+        Args:
+            timings: StageTracer.summary() の結果
+        """
+        if not timings['stages']:
+            return
+        print(f"\n⏱️ 処理段階ごとの所要時間（秒）")
+        # 全角文字は2桁分の幅で表示されるため、見出しは文字数を詰めて揃える
+        print(f"   {'段階':<14}{'回数':>4}{'p50':>9}{'p95':>9}{'最大':>7}{'合計':>8}")
+        for stage, stats in timings['stages'].items():
+            print(f"   {stage:<16}{stats['count']:>6}{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['max']:>9.3f}{stats['total']:>10.3f}")
+        print(f"   待機: {timings['sleep_seconds']:.1f}秒 / 処理: {timings['work_seconds']:.1f}秒 / 経過: {timings['wall_seconds']:.1f}秒")
+    
+    def print_frame_store_summary(self):
+        """フレームストアに保存した画像の概要を表示"""
+        frame_bytes = self.frame_bytes
+        original_mb = frame_bytes['original'] / 1024 / 1024
+        stored_mb = frame_bytes['stored'] / 1024 / 1024
+        ratio = (1 - frame_bytes['stored'] / frame_bytes['original']) * 100 if frame_bytes['original'] else 0
+        print(f"   フレームストア: {self.frame_store.root}（{self.frame_store.codec}、"
+              f"新規 {frame_bytes['new']}枚 / 重複 {frame_bytes['duplicates']}枚）")
+        print(f"     書き込み: {original_mb:.1f}MB → {stored_mb:.1f}MB（{ratio:.0f}%削減）")
+        if self.frame_collected[0]:
+            print(f"     削除した古い画像: {self.frame_collected[0]}枚（{self.frame_collected[1] / 1024 / 1024:.1f}MB）")
+    
+    def print_ocr_summary(self):
+        """文字起こし結果の概要を表示"""
+        if not self.enable_ocr:
+            return
+        print(f"   テキストファイル: {self.texts_dir}")
+        if self.ocr_router:
+            engines = self.count_routes('engine')
+            print(f"   ローカルOCR: {engines.get('local', 0)}ページ / LLM: {engines.get('llm', 0)}ページ")
+        print(f"   LLMリクエスト: {self.llm_usage['requests']}回（{self.llm_usage['pages']}ページ、{self.llm_usage['total_tokens']}トークン、再試行 {self.llm_usage['retries']}回）")
+        if self.transcription_cache:
+            cache_stats = self.transcription_cache.stats()
+            print(f"   文字起こしキャッシュ: ヒット {cache_stats['hits']}件 / ミス {cache_stats['misses']}件")
+    
+    def replay_screenshots(self, screenshots_dir: Path, num_pages: Optional[int] = None, start_page: Optional[int] = None,
+                           ocr_workers: int = 0, ocr_queue_size: int = 4) -> bool:
+        """
+        取得済みのスクリーンショットから文字起こし・PDF・結果ファイルを作り直す
+        
+        Kindleアプリを操作しないため、pyautoguiやディスプレイのない環境でも実行できます。
+        auto_crop が有効な場合は、元の画像を残したまま切り抜いた画像を出力ディレクトリに保存して使います。
+        
+        Args:
+            screenshots_dir: スクリーンショットのディレクトリ
+            num_pages: 処理するページ数（省略した場合は最後のページまで）
+            start_page: 開始ページ番号（省略した場合は最初のページから）
+            ocr_workers: バックグラウンド文字起こしワーカー数（0の場合はページごとに同期処理）
+            ocr_queue_size: 文字起こし待ちキューの最大長（ワーカー使用時）
+            
+        Returns:
+            再処理できた場合True（スクリーンショットがない場合や、既存のPDFに追記できない場合False）
+        """
+        screenshots_dir = Path(screenshots_dir)
+        if not screenshots_dir.is_dir():
+            print(f"❌ スクリーンショットのディレクトリが見つかりません: {screenshots_dir}")
+            return False
+        
+        screenshot_paths = find_screenshots(screenshots_dir)
+        if start_page is not None:
+            screenshot_paths = {page: path for page, path in screenshot_paths.items() if page >= start_page}
+        if num_pages is not None and screenshot_paths:
+            end_page = (start_page if start_page is not None else min(screenshot_paths)) + num_pages - 1
+            screenshot_paths = {page: path for page, path in screenshot_paths.items() if page <= end_page}
+        if not screenshot_paths:
+            print(f"❌ 再処理するスクリーンショットがありません: {screenshots_dir}")
+            return False
+        
+        print(f"\n♻️ 取得済みのスクリーンショットを再処理します: {screenshots_dir}")
+        print(f"   ページ: {min(screenshot_paths)}〜{max(screenshot_paths)}（{len(screenshot_paths)}枚）")
+        
+        # 作業キューを使う場合はタスクを登録するだけで、変換と文字起こしはワーカーが行う
+        if self.work_queue:
+            crop = self.auto_crop and screenshots_dir.resolve() != self.screenshots_dir.resolve()
+            index = load_frame_index(screenshots_dir)
+            for page, path in screenshot_paths.items():
+                entry = index['pages'].get(str(page)) if index else None
+                dpi = entry['dpi'][0] if entry and entry.get('dpi') else None
+                self.enqueue_page(page, path, dpi, self.screenshots_dir / self.crop_name(page, path) if crop else None)
+            print(f"📮 作業キューに{len(self.queued_pages)}ページを登録しました: {self.work_queue.root}"
+                  f"（処理済みの{len(screenshot_paths) - len(self.queued_pages)}ページを除く）")
+            return True
+        
+        if self.append_pdf and not self.prepare_append(sorted(screenshot_paths)):
+            return False
+        
+        self.tracer.open(fresh=True)
+        
+        # 元の画像は上書きせず、切り抜いた画像を出力ディレクトリに保存する
+        crop = self.auto_crop
+        if crop and screenshots_dir.resolve() == self.screenshots_dir.resolve():
+            print(f"  ⚠️ 元のスクリーンショットを上書きしないよう、切り抜きをスキップします（--output に別のディレクトリを指定してください）")
+            crop = False
+        
+        text_paths: Dict[int, Path] = {}
+        pipeline = None
+        if self.enable_ocr:
+            pipeline = self.start_transcription(ocr_workers, ocr_queue_size)
+        if self.converter.workers:
+            print(f"   画像の変換: {self.converter.workers}プロセスで並列処理（同時に最大{self.converter.max_in_flight}ページ）")
+        
+        # フレームストアの画像（WebPは解像度を記録できない）は索引に記録したキャプチャ時の解像度を使う
+        index = load_frame_index(screenshots_dir)
+        dpis = {tuple(entry['dpi']) for entry in index['pages'].values() if entry.get('dpi')} if index else set()
+        default_dpi = dpis.pop()[0] if len(dpis) == 1 else None
+        
+        # 各ページのデコード・切り抜き・PDF用の圧縮・アップロード用の画像の作成は1回の変換でまとめて行い、
+        # 文字起こしには変換済みのデータを持ったフレームを渡す
+        pdf_writer = self.open_pdf_writer(default_dpi=default_dpi)
+        model_name = self.model_name if self.transcription_cache else None
+        pages = list(screenshot_paths)
+        items = (
+            (str(screenshot_paths[page]), pdf_writer.encoder,
+             str(self.screenshots_dir / self.crop_name(page, screenshot_paths[page])) if crop else None,
+             model_name, self.upload_encoder if self.enable_ocr else None)
+            for page in pages
+        )
+        interrupted: Optional[BaseException] = None
+        converted: List[int] = []
+        try:
+            for page, result in zip(pages, self.converter.map(convert_page, items)):
+                self.tracer.set_page(page)
+                if not self.add_converted_page(pdf_writer, result, page):
+                    continue
+                converted.append(page)
+                if crop:
+                    screenshot_paths[page] = Path(result['path'])
+                    if result['region']:
+                        region = tuple(result['region'])
+                        if region != self.region_detector.region:
+                            print(f"  ✂️ ページ領域を検出しました: {region}")
+                            self.region_detector.detections += 1
+                            self.region_detector.region = region
+                        self.crop_bytes['original'] += result['original_bytes']
+                        self.crop_bytes['cropped'] += result['cropped_bytes']
+                    else:
+                        print(f"  ⚠️ ページ領域を検出できなかったため切り抜きをスキップします")
+                if pipeline:
+                    pipeline.submit(page, Frame(path=result['path'], derived=result['derived']))
+        except BaseException as e:
+            # 中断された場合もここまでのページでPDFと結果ファイルを作成してから再送出する
+            interrupted = e
+            print(f"\n⚠️ 再処理が中断されました。ここまでのページでPDFと結果ファイルを作成します")
+            if isinstance(e, KeyboardInterrupt) and isinstance(pipeline, AsyncTranscriptionEngine):
+                pipeline.cancel()
+            screenshot_paths = {page: screenshot_paths[page] for page in converted}
+        finally:
+            if pipeline:
+                text_paths.update(pipeline.close())
+        if pipeline and pipeline.interrupted and not interrupted:
+            interrupted = pipeline.interrupted
+        
+        print(f"\n{'='*60}")
+        print(f"📄 PDFファイルを作成中...")
+        print(f"{'='*60}")
+        try:
+            pdf_path = self.finish_pdf(pdf_writer)
+        except Exception as e:
+            print(f"  ❌ PDF作成エラー: {e}")
+            pdf_writer.abort()
+            pdf_path = None
+        
+        results = self.build_results(screenshot_paths, text_paths, pdf_path)
+        results['replayed_from'] = str(screenshots_dir)
+        if interrupted:
+            results['interrupted'] = True
+        if pipeline and pipeline.cancelled_pages:
+            results['cancelled_pages'] = sorted(pipeline.cancelled_pages)
+        results_path = self.write_results(results)
+        self.tracer.close()
+        
+        print(f"\n{'='*60}")
+        print(f"✅ 再処理完了！" if not interrupted else f"⚠️ 再処理を中断しました")
+        print(f"{'='*60}")
+        print(f"   処理したページ数: {len(screenshot_paths)}")
+        if pdf_path:
+            print(f"   PDFファイル: {pdf_path}")
+        self.print_ocr_summary()
+        print(f"   結果ファイル: {results_path}")
+        print(f"   トレース: {self.tracer.path}")
+        self.print_timing_summary(results['timings'])
+        
+        if interrupted:
+            raise interrupted
+        return True
+    
+    @staticmethod
+    def crop_name(page_number: int, path: Path) -> str:
+        """
+        再処理で切り抜いた画像を保存するファイル名
+        
+        フレームストアの画像（キーのファイル名）は、find_screenshots() で見つけられるよう
+        スクリーンショットと同じ形式のファイル名（更新日時を使用）にします。
+        """
+        if SCREENSHOT_NAME_PATTERN.match(path.name):
+            return path.name
+        timestamp = datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y%m%d_%H%M%S")
+        return f"page_{page_number:04d}_{timestamp}.png"
+    
+    def assemble_from_queue(self, work_queue: 'WorkQueue') -> Optional[dict]:
+        """
+        作業キューでワーカーが処理したページからPDFと結果ファイルを作成する（コーディネーター）
+        
+        PDFにはワーカーが圧縮したページをそのまま埋め込むため、画像の読み込みも再圧縮も行いません。
+        失敗として扱われたタスクのページはPDFに含めず、結果ファイルの work_queue.failed_pages に記録します。
+        
+        Args:
+            work_queue: 作業キュー
+            
+        Returns:
+            結果（results.json の内容、処理待ち・処理中のタスクが残っている場合None）
+        """
+        counts = work_queue.counts(self.output_dir)
+        print(f"\n🧩 作業キューの処理結果からPDFを作成します: {self.output_dir}")
+        if counts['tasks'] or counts['leases']:
+            print(f"❌ 処理待ち{counts['tasks']}件・処理中{counts['leases']}件のタスクが残っています"
+                  f"（ワーカーの完了を待ってから実行してください）")
+            return None
+        records = {record['page']: record for record in work_queue.records('done', self.output_dir)}
+        failed = sorted(record['page'] for record in work_queue.records('failed', self.output_dir))
+        if not records:
+            print(f"❌ 処理済みのページがありません")
+            return None
+        pages = sorted(records)
+        print(f"   ページ: {pages[0]}〜{pages[-1]}（{len(pages)}ページ）")
+        if failed:
+            print(f"   ⚠️ 失敗したページ: {', '.join(str(page) for page in failed)}")
+        if self.append_pdf and not self.prepare_append(pages):
+            return None
+        
+        self.tracer.open(fresh=True)
+        pdf_writer = self.open_pdf_writer()
+        screenshot_paths: Dict[int, Path] = {}
+        text_paths: Dict[int, Path] = {}
+        usage: Dict[str, int] = {}
+        workers: Dict[str, int] = {}
+        for page in pages:
+            record = records[page]
+            self.tracer.set_page(page)
+            try:
+                data = work_queue.read_artifact(record)
+            except (OSError, TypeError) as e:
+                print(f"  ⚠️ ページ {page} の変換結果を読み込めません: {e}")
+                continue
+            meta = record['pdf']
+            with self.tracer.span('pdf.page'):
+                pdf_writer.add_encoded_page(EncodedPage(
+                    meta['width'], meta['height'], meta['resolution'], meta['profile'], meta['image_params'], data
+                ))
+            self.pdf_pages.append(page)
+            screenshot_paths[page] = Path(record['screenshot'])
+            if record.get('text_file'):
+                text_paths[page] = Path(record['text_file'])
+            if record.get('route'):
+                self.page_routes[page] = record['route']
+            for key, value in record.get('llm_usage', {}).items():
+                usage[key] = usage.get(key, 0) + value
+            workers[record['worker']] = workers.get(record['worker'], 0) + 1
+        
+        print(f"\n{'='*60}")
+        print(f"📄 PDFファイルを作成中...")
+        print(f"{'='*60}")
+        try:
+            pdf_path = self.finish_pdf(pdf_writer)
         except Exception as e:
-            print(f"  ❌ ページめくりエラー: {e}")
+            print(f"  ❌ PDF作成エラー: {e}")
+            pdf_writer.abort()
+            pdf_path = None
+        
+        results = self.build_results(screenshot_paths, text_paths, pdf_path)
+        # 文字起こしはワーカーが行うため、テキストファイル・LLMの使用量・振り分けはタスクの記録から集計する
+        if text_paths:
+            results['ocr_enabled'] = True
+            results['text_files'] = [str(text_paths[page]) for page in sorted(text_paths)]
+            results['llm_usage'] = usage
+        if self.page_routes:
+            results['ocr_routing'] = {
+                'engines': self.count_routes('engine'),
+                'reasons': self.count_routes('reason'),
+                'pages': {str(page): self.page_routes[page] for page in sorted(self.page_routes)}
+            }
+        results['work_queue'] = {
+            'root': str(work_queue.root),
+            'pages': len(pages),
+            'failed_pages': failed,
+            'attempts': sum(record['attempts'] for record in records.values()),
+            'workers': workers,
+            'worker_seconds': round(sum(record.get('seconds', 0.0) for record in records.values()), 3)
+        }
+        results_path = self.write_results(results)
+        self.tracer.close()
+        
+        print(f"\n{'='*60}")
+        print(f"✅ PDFと結果ファイルを作成しました")
+        print(f"{'='*60}")
+        print(f"   ページ数: {len(self.pdf_pages)}（ワーカー {len(workers)}個、失敗 {len(failed)}ページ）")
+        if pdf_path:
+            print(f"   PDFファイル: {pdf_path}")
+        print(f"   結果ファイル: {results_path}")
+        return results
+    
+    def process_pages(self, num_pages: Optional[int] = None, start_page: int = 1, delay_between_pages: float = 3.0,
+                      ocr_workers: int = 0, ocr_queue_size: int = 4, resume: bool = False) -> bool:
+        """
+        複数ページを処理
+        
+        各ページの処理状況はジャーナル（journal.jsonl）に逐次記録されるため、
+        中断した場合も resume=True で続きから再開できます。
+        
+        Args:
+            num_pages: 処理するページ数（再開時に省略した場合は前回と同じ範囲）
+            start_page: 開始ページ番号（デフォルト: 1、再開時は無視）
+            delay_between_pages: ページ間の待機時間（秒）
+            ocr_workers: バックグラウンド文字起こしワーカー数（0の場合はページごとに同期処理）
+            ocr_queue_size: 文字起こし待ちキューの最大長（ワーカー使用時）
+            resume: ジャーナルを読み込んで前回の続きから再開するかどうか
+            
+        Returns:
+            処理できた場合True（再開するジャーナルが見つからない場合や、既存のPDFに追記できない場合False）
+        """
+        session = self.capture_pages(num_pages, start_page, delay_between_pages, ocr_workers, ocr_queue_size, resume)
+        if session is None:
             return False
+        self.finish_pages(session)
+        return True
     
-    def create_pdf_from_images(self, image_paths: List[Path], output_filename: str = None) -> Optional[Path]:
+    def capture_pages(self, num_pages: Optional[int] = None, start_page: int = 1, delay_between_pages: float = 3.0,
+                      ocr_workers: int = 0, ocr_queue_size: int = 4, resume: bool = False,
+                      countdown: int = 5) -> Optional[CaptureSession]:
+        """
+        ページをめくりながらキャプチャする（process_pages() の前半）
+        
+        文字起こしとPDFへの追記はキャプチャと並行して進み、finish_pages() で完了を待ちます。
+        キャプチャが中断された場合も例外は送出せず、セッションに記録して finish_pages() で再送出します。
+        
+        Args:
+            num_pages: 処理するページ数（再開時に省略した場合は前回と同じ範囲）
+            start_page: 開始ページ番号（デフォルト: 1、再開時は無視）
+            delay_between_pages: ページ間の待機時間（秒）
+            ocr_workers: バックグラウンド文字起こしワーカー数（0の場合はページごとに同期処理）
+            ocr_queue_size: 文字起こし待ちキューの最大長（ワーカー使用時）
+            resume: ジャーナルを読み込んで前回の続きから再開するかどうか
+            countdown: キャプチャを始める前のカウントダウンの秒数
+            
+        Returns:
+            キャプチャの結果（再開するジャーナルが見つからない場合や、既存のPDFに追記できない場合None）
+        """
+        session_start = time.monotonic()
+        screenshot_paths: Dict[int, Path] = {}
+        text_paths: Dict[int, Path] = {}
+        settle_times = []
+        page_hashes: Dict[int, int] = {}
+        
+        # 再開する場合はジャーナルから前回の状態を復元
+        resume_state = None
+        restored_pages: Dict[int, Path] = {}
+        missing_pages: List[int] = []
+        if resume:
+            resume_state = PageJournal.load(self.journal.path)
+            if resume_state is None:
+                print(f"❌ ジャーナルが見つかりません: {self.journal.path}")
+                return None
+            start_page = resume_state['start_page']
+            if num_pages is None:
+                num_pages = resume_state['end_page'] - start_page + 1
+            for page, record in resume_state['captures'].items():
+                path = Path(record['screenshot'])
+                if not path.exists() and record.get('original') and Path(record['original']).exists():
+                    # フレームストアへの書き込み前に強制終了したページは、screencaptureで保存した画像から復元する
+                    path = Path(record['original'])
+                    restored_pages[page] = path
+                if path.exists():
+                    screenshot_paths[page] = path
+                    page_hashes[page] = int(record['hash'], 16)
+                else:
+                    missing_pages.append(page)
+            if self.enable_ocr:
+                for page, record in resume_state['ocr'].items():
+                    if record['status'] == 'ok' and page in screenshot_paths and Path(record['text_file']).exists():
+                        text_paths[page] = Path(record['text_file'])
+                        if record.get('route'):
+                            self.page_routes[page] = {'engine': record['engine'], 'reason': record['route'], 'confidence': None}
+        end_page = start_page + num_pages - 1
+        
+        print(f"\n📖 {num_pages}ページを処理します")
+        if self.append_pdf and not resume_state and not self.work_queue and \
+                not self.prepare_append(list(range(start_page, end_page + 1))):
+            return None
+        print(f"   開始ページ: {start_page}")
+        if self.adaptive_settle:
+            print(f"   ページ間の待機: 画面の静止を検出（最大{self.settle_detector.timeout}秒）")
+        else:
+            print(f"   ページ間の待機時間: {delay_between_pages}秒")
+        
+        # Kindleで現在表示されているページと、次にキャプチャするページを決める
+        page_number = start_page
+        pending_turn = False
+        if resume_state:
+            shown_page = resume_state['last_turned'] or start_page
+            if shown_page in screenshot_paths:
+                # 表示中のページはキャプチャ済みなので、めくってから再開
+                page_number = shown_page + 1
+                pending_turn = True
+            else:
+                page_number = shown_page
+            print(f"   ♻️ 再開: キャプチャ済み {len(screenshot_paths)}ページ、ページ {page_number} から再開します")
+            missing_pages = [page for page in sorted(missing_pages) if page < page_number]
+            if missing_pages:
+                print(f"   ⚠️ キャプチャ済みとして記録された画像が見つからないページ: "
+                      f"{', '.join(str(page) for page in missing_pages)}（PDFから抜けます。"
+                      f"--start-page で取り直してください）")
+            self.journal.open(fresh=False)
+            self.journal.append('resume', page=page_number, missing_pages=missing_pages)
+            self.tracer.open(fresh=False)
+            # 書き込みスレッドの起動前のため、復元した画像のフレームストアへの保存はここで完了する
+            if self.frame_store:
+                for page, path in sorted(restored_pages.items()):
+                    screenshot_paths[page] = self.store_frame(page, Frame(path=path))
+        else:
+            self.journal.open(fresh=True)
+            self.journal.append('run_start', start_page=start_page, end_page=end_page)
+            self.tracer.open(fresh=True)
+        
+        # LLM文字起こしの投入先（ワーカー数が0の場合はページごとに同期処理、バッチ指定時はまとめて処理）
+        pipeline = None
+        if self.enable_ocr:
+            pipeline = self.start_transcription(ocr_workers, ocr_queue_size)
+        
+        # PDFはキャプチャしたページから順に、書き込みスレッドで追記していく
+        # （作業キューを使う場合は画像の保存後にタスクを登録し、PDFはコーディネーターが作成する）
+        pdf_writer = self.open_pdf_writer() if not self.work_queue else None
+        self.writer.start()
+        for page in sorted(screenshot_paths):
+            if pdf_writer:
+                self.writer.submit(self.add_pdf_page, pdf_writer, screenshot_paths[page], page)
+            else:
+                self.writer.submit(self.enqueue_page, page, screenshot_paths[page])
+        
+        previous_hash = page_hashes[max(page_hashes)] if page_hashes else None
+        identical_count = 0
+        duplicate_count = 0
+        end_of_book = False
+        interrupted: Optional[BaseException] = None
+        
+        try:
+            # 前回文字起こしに失敗した（または未完了の）ページを再投入
+            if self.enable_ocr:
+                for page in sorted(screenshot_paths):
+                    if page not in text_paths:
+                        print(f"  🔁 ページ {page} の文字起こしを再実行します")
+                        pipeline.submit(page, screenshot_paths[page])
+            
+            if page_number <= end_page:
+                print(f"\n⚠️  注意: マウスを画面の左上隅に移動すると緊急停止します\n")
+                
+                # 処理開始前にKindleアプリを前面に表示
+                print("📚 Kindleアプリを前面に表示しています...")
+                self.activate_kindle_app()
+                self.tracer.sleep('sleep.startup', 2)
+                
+                # 処理開始前のカウントダウン
+                if countdown:
+                    print(f"{countdown}秒後に処理を開始します...")
+                for i in range(countdown, 0, -1):
+                    print(f"  {i}...")
+                    self.tracer.sleep('sleep.startup', 1)
+            
+            while page_number <= end_page:
+                # 前のページの処理が終わっていれば次のページへ
+                if pending_turn:
+                    if not self.advance_page(page_number, delay_between_pages, settle_times):
+                        print(f"  ⚠️ ページめくりに失敗しました。処理を中断します")
+                        break
+                    pending_turn = False
+                
+                self.tracer.set_page(page_number)
+                print(f"\n{'='*60}")
+                print(f"📄 ページ {page_number}/{end_page} を処理中...")
+                print(f"{'='*60}")
+                
+                # スクリーンショット取得（デコードはここで1回だけ行い、以降の処理で共有する）
+                capture_start = time.monotonic()
+                frame = self.capture_page(page_number)
+                capture_seconds = time.monotonic() - capture_start
+                if not frame:
+                    print(f"  ⚠️ ページ {page_number} のスクリーンショット取得をスキップします")
+                    self.journal.append('capture_failed', page=page_number)
+                    page_number += 1
+                    pending_turn = True
+                    continue
+                
+                screenshot_path = frame.path
+                with self.tracer.span('hash'):
+                    page_hash = frame.perceptual_hash()
+                
+                # 直前のページと同じ画面かどうかを確認
+                if self.detect_duplicates:
+                    if previous_hash is not None and hamming_distance(page_hash, previous_hash) <= self.hash_threshold:
+                        identical_count += 1
+                        duplicate_count += 1
+                        screenshot_path.unlink()
+                        self.journal.append('duplicate', page=page_number)
+                        if identical_count >= self.end_after:
+                            print(f"  🏁 同じ画面が{identical_count}回続いたため、本の終わりと判断して終了します")
+                            end_of_book = True
+                            self.journal.append('end_of_book', page=page_number)
+                            break
+                        print(f"  ⚠️ ページが変わっていません。ページめくりを再試行します（{identical_count}/{self.end_after}）")
+                        pending_turn = True
+                        continue
+                    identical_count = 0
+                previous_hash = page_hash
+                
+                # 切り抜いた画像の保存とPDFへの追記は書き込みスレッドで行う
+                # （フレームストアへの書き込み前に強制終了した場合に備え、screencaptureで保存した画像のパスも記録する）
+                original_path = screenshot_path
+                if self.frame_store:
+                    screenshot_path = self.store_frame(page_number, frame)
+                elif frame.dirty:
+                    self.writer.submit(self.archive_frame, frame, screenshot_path)
+                screenshot_paths[page_number] = screenshot_path
+                if pdf_writer:
+                    self.writer.submit(self.add_pdf_page, pdf_writer, frame, page_number)
+                else:
+                    dpi = frame.image.info.get('dpi')
+                    self.writer.submit(self.enqueue_page, page_number, screenshot_path, dpi[0] if dpi else None)
+                self.journal.append(
+                    'capture',
+                    page=page_number,
+                    screenshot=str(screenshot_path),
+                    original=str(original_path) if original_path != screenshot_path else None,
+                    hash=f'{page_hash:064x}',
+                    timings={'capture': round(capture_seconds, 3)}
+                )
+                
+                # LLM文字起こし処理（有効な場合、ワーカー使用時はキャプチャを止めないように投入のみ）
+                if pipeline:
+                    pipeline.submit(page_number, frame)
+                del frame
+                
+                page_number += 1
+                pending_turn = True
+        except BaseException as e:
+            # 中断された場合もここまでのページでPDFと結果ファイルを作成してから再送出する
+            interrupted = e
+            print(f"\n⚠️ 処理が中断されました。ここまでのページでPDFと結果ファイルを作成します")
+            # 非同期文字起こしの送信中のリクエストは取り消し、保存済みのページだけを残す
+            if isinstance(e, KeyboardInterrupt) and isinstance(pipeline, AsyncTranscriptionEngine):
+                pipeline.cancel()
+        
+        session = CaptureSession(num_pages, screenshot_paths, text_paths, pipeline, pdf_writer)
+        session.settle_times = settle_times
+        session.resume_state = resume_state
+        session.missing_pages = missing_pages
+        session.interrupted = interrupted
+        session.duplicate_count = duplicate_count
+        session.end_of_book = end_of_book
+        session.capture_seconds = time.monotonic() - session_start
+        return session
+    
+    def finish_pages(self, session: CaptureSession) -> dict:
+        """
+        文字起こしとPDFの完成を待ち、結果ファイルを作成する（process_pages() の後半）
+        
+        キャプチャが中断されていた場合は、結果ファイルを作成してから中断の例外を再送出します。
+        
+        Args:
+            session: capture_pages() の結果
+            
+        Returns:
+            結果（results.json の内容）
+        """
+        num_pages = session.num_pages
+        screenshot_paths = session.screenshot_paths
+        text_paths = session.text_paths
+        pdf_writer = session.pdf_writer
+        interrupted = session.interrupted
+        duplicate_count = session.duplicate_count
+        end_of_book = session.end_of_book
+        
+        # 中断された場合も投入済みのページは文字起こしと書き込みを完了させる
+        if session.pipeline:
+            text_paths.update(session.pipeline.close())
+            if session.pipeline.interrupted and not interrupted:
+                interrupted = session.interrupted = session.pipeline.interrupted
+        self.writer.close()
+        
+        # 追記してきたPDFを完成させる（作業キューを使う場合はコーディネーターが作成する）
+        pdf_path = None
+        if pdf_writer:
+            print(f"\n{'='*60}")
+            print(f"📄 PDFファイルを作成中...")
+            print(f"{'='*60}")
+            
+            try:
+                pdf_path = self.finish_pdf(pdf_writer)
+            except Exception as e:
+                print(f"  ❌ PDF作成エラー: {e}")
+                pdf_writer.abort()
+        
+        # フレームストアの索引（保持方針により参照されなくなった画像はここで削除する）
+        try:
+            self.save_frame_index(screenshot_paths)
+        except (OSError, ValueError) as e:
+            print(f"  ⚠️ フレームストアの索引を保存できませんでした: {e}")
+        
+        # 結果をJSONファイルに保存
+        results = self.build_results(screenshot_paths, text_paths, pdf_path)
+        
+        # 中断・再開の情報
+        if session.resume_state:
+            results['resumed'] = True
+        if session.missing_pages:
+            results['missing_pages'] = session.missing_pages
+        if interrupted:
+            results['interrupted'] = True
+        if session.pipeline and session.pipeline.cancelled_pages:
+            results['cancelled_pages'] = sorted(session.pipeline.cancelled_pages)
+        
+        # 画面の静止検出を使用した場合、ページごとの実測待機時間を追加
+        if self.adaptive_settle:
+            results['settle_times'] = session.settle_times
+        
+        # 重複ページ検出の結果
+        if self.detect_duplicates:
+            results['duplicates_skipped'] = duplicate_count
+            results['end_of_book'] = end_of_book
+        
+        # 前面表示の統計（省略できたactivateの回数など）
+        results['focus'] = self.focus_manager.stats()
+        
+        # 作業キューに登録したページ
+        if self.work_queue:
+            results['work_queue'] = {'root': str(self.work_queue.root), 'queued_pages': len(self.queued_pages)}
+        
+        results_path = self.write_results(results)
+        
+        if not interrupted:
+            self.journal.append('run_end', pdf_file=results['pdf_file'])
+        self.journal.close()
+        self.tracer.close()
+        
+        print(f"\n{'='*60}")
+        print(f"✅ 処理完了！" if not interrupted else f"⚠️ 中断しました（--resume で続きから再開できます）")
+        print(f"{'='*60}")
+        print(f"   処理したページ数: {len(screenshot_paths)}/{num_pages}")
+        if self.detect_duplicates:
+            print(f"   除外した重複ページ: {duplicate_count}枚" + ("（本の終わりを検出）" if end_of_book else ""))
+        focus_stats = self.focus_manager.stats()
+        print(f"   Kindleの再activate: {focus_stats['activations']}回（省略: {focus_stats['skipped_activations']}回）")
+        if pdf_path:
+            print(f"   PDFファイル: {pdf_path}")
+        if self.work_queue:
+            print(f"   作業キュー: {self.work_queue.root}（{len(self.queued_pages)}ページを登録、"
+                  f"--worker で処理し --assemble でPDFを作成）")
+        self.print_ocr_summary()
+        print(f"   スクリーンショット: {self.screenshots_dir}")
+        if self.frame_store:
+            self.print_frame_store_summary()
+        print(f"   結果ファイル: {results_path}")
+        print(f"   ジャーナル: {self.journal.path}")
+        print(f"   トレース: {self.tracer.path}")
+        self.print_timing_summary(results['timings'])
+        
+        if interrupted:
+            raise interrupted
+        return results
+
+
+def load_job_spec(path: Path, manual_open: bool = False) -> List[dict]:
+    """
+    複数の本を処理するジョブ定義ファイル（JSON）を読み込む
+
+    ファイルは本のリスト、または {"books": [...]} の形式で、各本は次の項目を持ちます。
+    output（出力ディレクトリ、必須）, pages（ページ数、必須）, title, start_page, delay, open_url
+    2冊目以降の本は open_url が必須です（無人で実行中に手動で本を開くのを待って止まらないようにするため）。
+
+    Args:
+        path: ジョブ定義ファイルのパス
+        manual_open: 2冊目以降の open_url がない本を手動で開くのを待つかどうか
+
+    Returns:
+        項目を補完した本のリスト
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    books = spec.get('books') if isinstance(spec, dict) else spec
+    if not isinstance(books, list) or not books:
+        raise ValueError(f"ジョブ定義ファイルに本が定義されていません: {path}")
+
+    normalized = []
+    outputs = set()
+    for index, book in enumerate(books, 1):
+        if not isinstance(book, dict) or not book.get('output') or not book.get('pages'):
+            raise ValueError(f"{index}冊目の定義に output と pages が必要です: {path}")
+        output = str(book['output'])
+        if Path(output).resolve() in outputs:
+            raise ValueError(f"出力ディレクトリが重複しています: {output}")
+        if index > 1 and not book.get('open_url') and not manual_open:
+            raise ValueError(f"{index}冊目の定義に open_url がありません: {path}"
+                             f"（手動で本を開く場合は --job-manual-open を指定してください）")
+        outputs.add(Path(output).resolve())
+        normalized.append({
+            'title': str(book.get('title') or Path(output).name),
+            'output': output,
+            'pages': int(book['pages']),
+            'start_page': int(book.get('start_page', 1)),
+            'delay': float(book['delay']) if book.get('delay') is not None else None,
+            'open_url': book.get('open_url')
+        })
+    return normalized
+
+
+class LibraryScheduler:
+    """
+    ジョブ定義ファイルの複数の本を順に処理するスケジューラ
+
+    1冊のキャプチャが終わると、その本の文字起こしとPDFの仕上げを別スレッドに任せ、
+    すぐに次の本のキャプチャを始めます（仕上げ中の本は overlap 冊まで）。
+    本ごとに出力ディレクトリに manifest.json を書き出し、最後に全体の集計を summary_path に保存します。
+    """
+
+    def __init__(self, books: List[dict], make_kindle_pdf: Callable[[dict], 'KindlePDF'], summary_path: Path,
+                 overlap: int = 1, default_delay: float = 3.0, ocr_workers: int = 0, ocr_queue_size: int = 4,
+                 skip_open: bool = False, open_wait: float = 5.0, manual_open: bool = False,
+                 sleeper: Callable[[float], None] = time.sleep):
+        """
+        初期化
+
+        Args:
+            books: load_job_spec() で読み込んだ本のリスト
+            make_kindle_pdf: 本の定義からKindlePDFを作成する関数
+            summary_path: 全体の集計の保存先
+            overlap: 次の本のキャプチャと並行して仕上げる本の数の上限
+            default_delay: 本に delay がない場合のページ間の待機時間（秒）
+            ocr_workers: バックグラウンド文字起こしワーカー数
+            ocr_queue_size: 文字起こし待ちキューの最大長
+            skip_open: 最初の本の前にKindleアプリを開かない
+            open_wait: open_url で本を開いてから表示されるまで待つ時間（秒）
+            manual_open: 2冊目以降の open_url がない本を手動で開くのを待つかどうか（しない場合はその本を失敗にする）
+            sleeper: 待機に使う関数
+        """
+        self.books = books
+        self.make_kindle_pdf = make_kindle_pdf
+        self.summary_path = Path(summary_path)
+        self.overlap = max(1, overlap)
+        self.default_delay = default_delay
+        self.ocr_workers = ocr_workers
+        self.ocr_queue_size = ocr_queue_size
+        self.skip_open = skip_open
+        self.open_wait = open_wait
+        self.manual_open = manual_open
+        self.sleeper = sleeper
+        self.entries: List[dict] = []
+
+    def open_book(self, book: dict, first: bool) -> bool:
+        """
+        Kindleアプリで次の本を開く
+
+        open_url がある場合はmacOSの open コマンドで開き、ない場合は2冊目以降のみ手動で開くのを待ちます
+        （manual_open でない場合は待たずに失敗します）。
+
+        Args:
+            book: 本の定義
+            first: 最初の本かどうか
+
+        Returns:
+            本を開けた場合True
+        """
+        if book['open_url']:
+            print(f"📖 「{book['title']}」を開いています...")
+            try:
+                subprocess.run(['open', book['open_url']], check=True, capture_output=True)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"  ❌ 本を開けませんでした: {e}")
+                return False
+            self.sleeper(self.open_wait)
+            return True
+        if not first:
+            if not self.manual_open:
+                print(f"  ❌ 「{book['title']}」の open_url がないため開けません（--job-manual-open で手動で開けます）")
+                return False
+            input(f"\n📖 Kindleで「{book['title']}」の{book['start_page']}ページ目を開いてから Enter を押してください...")
+        return True
+
+    def _new_entry(self, book: dict) -> dict:
+        entry = {
+            'title': book['title'],
+            'output_dir': book['output'],
+            'status': 'pending',
+            'pages_requested': book['pages'],
+            'pages': 0,
+            'text_pages': 0,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'capture_seconds': None,
+            'finish_seconds': None,
+            'elapsed_seconds': None
+        }
+        self.entries.append(entry)
+        return entry
+
+    def _finish(self, kindle_pdf: 'KindlePDF', session: CaptureSession, entry: dict, started: float):
+        """文字起こしとPDFの完成を待ち、本の集計とマニフェストを書き出す（仕上げスレッドで実行）"""
+        finish_start = time.monotonic()
+        try:
+            results = kindle_pdf.finish_pages(session)
+            entry['status'] = 'completed'
+        except KeyboardInterrupt:
+            results = None
+            entry['status'] = 'interrupted'
+        except Exception as e:
+            print(f"  ❌ 「{entry['title']}」の仕上げでエラーが発生しました: {e}")
+            results = None
+            entry['status'] = 'failed'
+            entry['error'] = str(e)
+        finally:
+            kindle_pdf.writer.close()
+        entry['finish_seconds'] = round(time.monotonic() - finish_start, 3)
+        entry['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        entry['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        entry['pages'] = len(session.screenshot_paths)
+        entry['text_pages'] = len(session.text_paths)
+        entry['pages_per_hour'] = (
+            round(entry['pages'] / entry['elapsed_seconds'] * 3600, 1) if entry['elapsed_seconds'] else None
+        )
+        if results:
+            entry['pdf_file'] = results['pdf_file']
+            entry['results_file'] = str(kindle_pdf.output_dir / "results.json")
+            if 'llm_usage' in results:
+                entry['llm_usage'] = results['llm_usage']
+        with open(kindle_pdf.output_dir / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+
+    def run(self) -> dict:
+        """
+        すべての本を処理して全体の集計を保存する
+
+        キャプチャ中に中断された場合は、その本と仕上げ中の本を完成させて集計を保存してから再送出します。
+
+        Returns:
+            全体の集計
+        """
+        run_start = time.monotonic()
+        started_at = datetime.now().isoformat(timespec='seconds')
+        finishing = deque()
+        interrupted: Optional[BaseException] = None
+        print(f"\n📚 {len(self.books)}冊を処理します（仕上げの並行数: {self.overlap}）")
+
+        try:
+            for index, book in enumerate(self.books):
+                print(f"\n{'#'*60}")
+                print(f"📚 {index + 1}/{len(self.books)}冊目: {book['title']}（{book['pages']}ページ）")
+                print(f"{'#'*60}")
+                entry = self._new_entry(book)
+                started = time.monotonic()
+                try:
+                    kindle_pdf = self.make_kindle_pdf(book)
+                    if index == 0 and not self.skip_open and not kindle_pdf.open_kindle_app():
+                        raise RuntimeError("Kindleアプリを開けませんでした")
+                    if not self.open_book(book, first=index == 0):
+                        raise RuntimeError("本を開けませんでした")
+                except Exception as e:
+                    print(f"  ❌ 「{book['title']}」をスキップします: {e}")
+                    entry['status'] = 'failed'
+                    entry['error'] = str(e)
+                    continue
+
+                # 仕上げ中の本が多すぎる場合は、古いものから完了を待つ
+                while len(finishing) >= self.overlap:
+                    finishing.popleft().join()
+
+                entry['status'] = 'capturing'
+                session = kindle_pdf.capture_pages(
+                    num_pages=book['pages'],
+                    start_page=book['start_page'],
+                    delay_between_pages=book['delay'] if book['delay'] is not None else self.default_delay,
+                    ocr_workers=self.ocr_workers,
+                    ocr_queue_size=self.ocr_queue_size,
+                    countdown=5 if index == 0 else 0
+                )
+                if session is None:
+                    entry['status'] = 'failed'
+                    entry['error'] = '既存のPDFに追記できません'
+                    continue
+                entry['capture_seconds'] = round(session.capture_seconds, 3)
+                if session.interrupted:
+                    interrupted = session.interrupted
+                    self._finish(kindle_pdf, session, entry, started)
+                    break
+
+                print(f"\n🧵 「{book['title']}」の文字起こしとPDFの仕上げをバックグラウンドで続けます")
+                thread = threading.Thread(
+                    target=self._finish, args=(kindle_pdf, session, entry, started),
+                    name=f"finish-{index + 1}", daemon=True
+                )
+                thread.start()
+                finishing.append(thread)
+        except BaseException as e:
+            interrupted = e
+            print(f"\n⚠️ 処理が中断されました。仕上げ中の本を完成させてから集計を保存します")
+        finally:
+            if finishing:
+                print(f"\n⏳ 仕上げ中の本（{len(finishing)}冊）の完了を待機中...")
+            for thread in finishing:
+                thread.join()
+            summary = self.write_summary(started_at, time.monotonic() - run_start, interrupted)
+
+        if interrupted:
+            raise interrupted
+        return summary
+
+    def write_summary(self, started_at: str, wall_seconds: float, interrupted: Optional[BaseException]) -> dict:
+        """全体の集計を保存して表示する"""
+        total_pages = sum(entry['pages'] for entry in self.entries)
+        busy_seconds = sum(entry['elapsed_seconds'] or 0 for entry in self.entries)
+        summary = {
+            'started_at': started_at,
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'interrupted': bool(interrupted),
+            'books': self.entries,
+            'total_books': len(self.books),
+            'completed_books': sum(1 for entry in self.entries if entry['status'] == 'completed'),
+            'total_pages': total_pages,
+            'wall_seconds': round(wall_seconds, 3),
+            'pages_per_hour': round(total_pages / wall_seconds * 3600, 1) if wall_seconds else None,
+            # 本ごとの所要時間の合計と実際の経過時間の差（キャプチャと仕上げを重ねたことで短縮できた時間）
+            'overlap_seconds': round(max(0.0, busy_seconds - wall_seconds), 3)
+        }
+        self.summary_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        print(f"\n{'#'*60}")
+        print(f"📚 全体の集計")
+        print(f"{'#'*60}")
+        for entry in self.entries:
+            rate = f"{entry['pages_per_hour']}ページ/時" if entry.get('pages_per_hour') else "-"
+            capture = f"{entry['capture_seconds']:.0f}秒" if entry['capture_seconds'] is not None else "-"
+            finish = f"{entry['finish_seconds']:.0f}秒" if entry['finish_seconds'] is not None else "-"
+            print(f"   [{entry['status']}] {entry['title']}: {entry['pages']}/{entry['pages_requested']}ページ、"
+                  f"キャプチャ {capture}、仕上げ {finish}、{rate}")
+        print(f"   合計: {summary['completed_books']}/{summary['total_books']}冊、{total_pages}ページ、"
+              f"{summary['wall_seconds']:.0f}秒（{summary['pages_per_hour']}ページ/時、重ねて短縮: {summary['overlap_seconds']:.0f}秒）")
+        print(f"   集計ファイル: {self.summary_path}")
+        return summary
+
+
+
+class QueueLease(NamedTuple):
+    """WorkQueue.claim() で取り出したタスクのリース"""
+    task: dict
+    path: Path
+    token: str
+
+
+class WorkQueue:
+    """
+    共有ディレクトリに置くリース方式のページ単位の作業キュー
+
+    キャプチャしたホストがページごとのタスク（PDF用の変換と文字起こし）を登録し、同じホストや
+    共有ディレクトリをマウントした別のホストの任意の数のワーカー（QueueWorker）が取り出して処理します。
+    タスクは状態ごとのディレクトリに1ファイルずつ置き、状態の変更はファイルの rename で行うため、
+    ロックやデータベースを使わずに複数のプロセスから同時に取り出せます。
+
+        tasks/<ID>.json             処理待ち
+        leases/<ID>.<トークン>.json  処理中（ファイルの更新日時がリースの期限の基準）
+        done/<ID>.json              完了（PDF用に圧縮したページは results/ に保存）
+        failed/<ID>.json            max_attempts 回失敗したタスク
+
+    処理中のワーカーはリースを定期的に更新し、lease_seconds の間更新されないリース（強制終了したワーカー）は
+    他のワーカーが処理待ちに戻します。そのため同じタスクが2回処理される場合がありますが、
+    タスクの処理は何度行っても同じ結果になり、完了の記録は後から書いたもので置き換わります。
+    タスクのIDは本とページ番号から決まり、同じページを登録し直した場合は新しいタスクで置き換えます。
+    """
+
+    STATES = ('tasks', 'leases', 'done', 'failed')
+
+    def __init__(self, root: Path, lease_seconds: float = 300.0, max_attempts: int = 3):
+        """
+        初期化
+
+        Args:
+            root: キューのディレクトリ（複数のホストで使う場合は共有ディレクトリ）
+            lease_seconds: リースの期限（秒、ワーカーはこの3分の1ごとにリースを更新する）
+            max_attempts: タスクを失敗として扱うまでの最大試行回数
+        """
+        self.root = Path(root)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.dirs = {name: self.root / name for name in self.STATES + ('results',)}
+        for path in self.dirs.values():
+            path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def book_key(book_dir: Path) -> str:
+        """本の出力ディレクトリからタスクIDの接頭辞を作る"""
+        return hashlib.sha1(str(Path(book_dir).resolve()).encode('utf-8')).hexdigest()[:12]
+
+    @staticmethod
+    def _read_json(path: Path) -> Optional[dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write_json(path: Path, data: dict):
+        # 他のホストのプロセスと一時ファイルの名前が重ならないよう、ホスト名とプロセスIDを付ける
+        tmp_path = path.with_name(f'{path.name}.{os.uname().nodename}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def enqueue(self, book_dir: Path, page: int, image: Path, **options) -> Optional[str]:
+        """
+        ページのタスクを登録する
+
+        処理待ちのタスクは置き換え、同じ画像で完了済みのタスクは登録しません（再開時の再登録で処理し直さないため）。
+
+        Args:
+            book_dir: 本の出力ディレクトリ（すべてのホストで同じパスで参照できること）
+            page: ページ番号
+            image: ページの画像のパス（同上）
+            **options: タスクの処理方法（ocr, crop_to, pdf_profile, pdf_dpi, pdf_jpeg_quality）
+
+        Returns:
+            タスクのID（完了済みのため登録しなかった場合None）
+        """
+        book_dir = Path(book_dir).resolve()
+        image = str(Path(image).resolve())
+        task_id = f'{self.book_key(book_dir)}-{page:05d}'
+        done = self._read_json(self.dirs['done'] / f'{task_id}.json')
+        if done and done['image'] == image and all(done.get(key) == value for key, value in options.items()):
+            return None
+        task = {
+            'id': task_id,
+            'book': str(book_dir),
+            'page': page,
+            'image': image,
+            'attempts': 0,
+            'enqueued_at': time.time(),
+            **options
+        }
+        self._write_json(self.dirs['tasks'] / f'{task_id}.json', task)
+        try:
+            (self.dirs['failed'] / f'{task_id}.json').unlink()
+        except FileNotFoundError:
+            pass
+        return task_id
+
+    def claim(self, worker: str) -> Optional[QueueLease]:
+        """
+        処理待ちのタスクを1つ取り出してリースする（期限切れのリースは先に処理待ちに戻す）
+
+        Args:
+            worker: ワーカーの名前（完了の記録に残す）
+
+        Returns:
+            リース（処理待ちのタスクがない場合None）
+        """
+        self.reclaim_expired()
+        for path in sorted(self.dirs['tasks'].glob('*.json')):
+            task_id = path.name[:-len('.json')]
+            token = f'{random.getrandbits(32):08x}'
+            lease_path = self.dirs['leases'] / f'{task_id}.{token}.json'
+            try:
+                os.rename(path, lease_path)
+                # rename はタスクを登録した時の更新日時を引き継ぐため、すぐにリースの期限を延ばす
+                os.utime(lease_path)
+            except FileNotFoundError:
+                # 他のワーカーが先に取り出した（または期限切れとみなして処理待ちに戻した）
+                continue
+            task = self._read_json(lease_path)
+            if task is None:
+                # 期限を延ばす前に他のワーカーが期限切れとみなして処理待ちに戻した
+                continue
+            if task['attempts'] >= self.max_attempts:
+                task.setdefault('last_error', 'リースの期限切れ（ワーカーが強制終了した可能性があります）')
+                self._write_json(lease_path, task)
+                os.replace(lease_path, self.dirs['failed'] / f'{task_id}.json')
+                continue
+            task['attempts'] += 1
+            task['worker'] = worker
+            task['claimed_at'] = time.time()
+            self._write_json(lease_path, task)
+            return QueueLease(task, lease_path, token)
+        return None
+
+    def renew(self, lease: QueueLease) -> bool:
+        """リースを更新する（期限切れで他のワーカーに移っていた場合False）"""
+        try:
+            os.utime(lease.path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def hold(self, lease: QueueLease):
+        """処理中、lease_seconds の3分の1ごとにリースを更新する"""
+        stop = threading.Event()
+
+        def renew_until_stopped():
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.renew(lease):
+                    print(f"  ⚠️ タスク {lease.task['id']} のリースが期限切れになり、他のワーカーに移りました")
+                    return
+
+        thread = threading.Thread(target=renew_until_stopped, name="lease-renewal", daemon=True)
+        thread.start()
+        try:
+            yield lease
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, lease: QueueLease, record: dict, artifact: Optional[bytes] = None):
+        """
+        タスクの完了を記録する
+
+        Args:
+            lease: claim() で取り出したリース
+            record: 完了の記録に加える処理結果
+            artifact: results/ に保存するデータ（PDF用に圧縮したページ）
+        """
+        task_id = lease.task['id']
+        artifact_name = None
+        if artifact is not None:
+            artifact_name = f'{task_id}.{lease.token}.bin'
+            with open(self.dirs['results'] / artifact_name, 'wb') as f:
+                f.write(artifact)
+        done_path = self.dirs['done'] / f'{task_id}.json'
+        previous = self._read_json(done_path)
+        self._write_json(done_path, {**lease.task, **record, 'artifact': artifact_name, 'completed_at': time.time()})
+        if previous and previous.get('artifact') and previous['artifact'] != artifact_name:
+            try:
+                (self.dirs['results'] / previous['artifact']).unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            lease.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def release(self, lease: QueueLease, error: str, count_attempt: bool = True) -> str:
         """
-        スクリーンショット画像をPDFファイルにまとめる
-        
+        処理できなかったタスクを処理待ちに戻す（max_attempts 回失敗した場合は失敗として扱う）
+
         Args:
-            image_paths: 画像ファイルのパスのリスト
-            output_filename: 出力PDFファイル名（指定しない場合は自動生成）
-            
+            lease: claim() で取り出したリース
+            error: エラーの内容
+            count_attempt: 試行回数に数えるかどうか（中断した場合は数えない）
+
         Returns:
-            生成されたPDFファイルのパス
+            戻した先の状態（tasks / failed、リースが他のワーカーに移っていた場合 leases）
         """
-        if not image_paths:
-            print("  ⚠️ PDF化する画像がありません")
-            return None
-        
-        print(f"  📄 {len(image_paths)}枚の画像をPDF化中...")
-        
+        if not lease.path.exists():
+            return 'leases'
+        task = dict(lease.task, last_error=error)
+        if not count_attempt:
+            task['attempts'] -= 1
+        state = 'failed' if task['attempts'] >= self.max_attempts else 'tasks'
+        target = self.dirs[state] / f"{task['id']}.json"
+        if state == 'tasks' and target.exists():
+            # 処理中に同じページが登録し直された
+            lease.path.unlink()
+            return state
+        self._write_json(lease.path, task)
+        os.replace(lease.path, target)
+        return state
+
+    def reclaim_expired(self) -> int:
+        """
+        lease_seconds の間更新されていないリースを処理待ちに戻す
+
+        Returns:
+            戻したタスクの数
+        """
+        deadline = time.time() - self.lease_seconds
+        reclaimed = 0
+        for path in self.dirs['leases'].glob('*.json'):
+            try:
+                if path.stat().st_mtime > deadline:
+                    continue
+                target = self.dirs['tasks'] / f"{path.name.split('.')[0]}.json"
+                if target.exists():
+                    path.unlink()
+                else:
+                    os.rename(path, target)
+            except FileNotFoundError:
+                continue
+            reclaimed += 1
+        return reclaimed
+
+    def counts(self, book_dir: Optional[Path] = None) -> Dict[str, int]:
+        """状態ごとのタスク数（book_dir を指定した場合はその本のタスクだけ）"""
+        pattern = f'{self.book_key(book_dir)}-*.json' if book_dir is not None else '*.json'
+        return {state: sum(1 for _ in self.dirs[state].glob(pattern)) for state in self.STATES}
+
+    def records(self, state: str, book_dir: Optional[Path] = None) -> List[dict]:
+        """指定した状態のタスク（book_dir を指定した場合はその本のタスクだけ）"""
+        pattern = f'{self.book_key(book_dir)}-*.json' if book_dir is not None else '*.json'
+        records = (self._read_json(path) for path in sorted(self.dirs[state].glob(pattern)))
+        return [record for record in records if record is not None]
+
+    def books(self) -> List[Path]:
+        """タスクのある本の出力ディレクトリ"""
+        books: Dict[str, None] = {}
+        for state in self.STATES:
+            for record in self.records(state):
+                books.setdefault(record['book'])
+        return [Path(book) for book in books]
+
+    def read_artifact(self, record: dict) -> bytes:
+        """完了したタスクの results/ のデータを読み込む"""
+        with open(self.dirs['results'] / record['artifact'], 'rb') as f:
+            return f.read()
+
+
+class QueueWorker:
+    """
+    WorkQueue からページのタスクを取り出し、PDF用の変換と文字起こしを行うワーカー
+
+    同じホストで複数のプロセスを起動しても、共有ディレクトリをマウントした別のホストで起動しても構いません。
+    PDF用に圧縮したページはキューの results/ に、文字起こし結果は本の texts/ に保存し、
+    PDFと結果ファイルはコーディネーター（KindlePDF.assemble_from_queue()）が最後にまとめて作成します。
+    """
+
+    def __init__(self, work_queue: WorkQueue, make_kindle_pdf: Callable[[Path, bool], 'KindlePDF'],
+                 name: Optional[str] = None, idle_timeout: float = 0.0, poll_interval: float = 1.0):
+        """
+        初期化
+
+        Args:
+            work_queue: 作業キュー
+            make_kindle_pdf: 本の出力ディレクトリと文字起こしの有無から、文字起こしに使う KindlePDF を作成する関数
+            name: ワーカーの名前（指定しない場合は ホスト名:プロセスID）
+            idle_timeout: 処理待ち・処理中のタスクがなくなってから終了するまで待つ時間（秒）
+            poll_interval: 処理待ちのタスクがない場合に確認し直す間隔（秒）
+        """
+        self.queue = work_queue
+        self.make_kindle_pdf = make_kindle_pdf
+        self.name = name or f'{os.uname().nodename}:{os.getpid()}'
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.stats = {'completed': 0, 'retried': 0, 'failed': 0, 'seconds': 0.0}
+        self._books: Dict[Tuple[str, bool], 'KindlePDF'] = {}
+
+    def kindle_pdf_for(self, task: dict) -> 'KindlePDF':
+        """タスクの本の KindlePDF（本と文字起こしの有無ごとに1回だけ作成）"""
+        key = (task['book'], bool(task.get('ocr')))
+        if key not in self._books:
+            self._books[key] = self.make_kindle_pdf(Path(task['book']), bool(task.get('ocr')))
+        return self._books[key]
+
+    def process(self, task: dict) -> Tuple[dict, bytes]:
+        """
+        1ページ分のタスクを処理する
+
+        Args:
+            task: タスク
+
+        Returns:
+            (完了の記録に加える処理結果, PDF用に圧縮したページのデータ)
+        """
+        kindle_pdf = self.kindle_pdf_for(task)
+        ocr = bool(task.get('ocr'))
+        encoder = PDFPageEncoder(task.get('pdf_dpi'), task.get('pdf_jpeg_quality', 75), task.get('pdf_profile', 'jpeg'))
+        model_name = kindle_pdf.model_name if kindle_pdf.transcription_cache else None
+        result = convert_page(task['image'], encoder, task.get('crop_to'), model_name,
+                              kindle_pdf.upload_encoder if ocr else None)
+        if 'error' in result:
+            raise RuntimeError(f"画像を変換できません（{result['error']}）")
+        page: EncodedPage = result['pdf']
+        record = {
+            'pdf': {
+                'width': page.width,
+                'height': page.height,
+                'resolution': page.resolution,
+                'profile': page.profile,
+                'image_params': page.image_params
+            },
+            'screenshot': result['path'],
+            'region': list(result['region']) if result['region'] else None,
+            'text_file': None
+        }
+        if ocr:
+            usage_before = dict(kindle_pdf.llm_usage)
+            frame = Frame(path=result['path'], derived=result['derived'])
+            text_path = kindle_pdf.transcribe_pages([(task['page'], frame)]).get(task['page'])
+            if not text_path:
+                raise RuntimeError("文字起こしに失敗しました")
+            record['text_file'] = str(text_path)
+            record['route'] = kindle_pdf.page_routes.get(task['page'])
+            record['llm_usage'] = {key: kindle_pdf.llm_usage[key] - value for key, value in usage_before.items()}
+        return record, page.data
+
+    def run(self) -> dict:
+        """
+        処理待ち・処理中のタスクがなくなるまでタスクを処理する
+
+        Returns:
+            completed, retried, failed, seconds を持つ集計
+        """
+        print(f"\n🛠️ ワーカー {self.name} を開始します: {self.queue.root}")
+        idle_since = None
+        while True:
+            lease = self.queue.claim(self.name)
+            if lease is None:
+                counts = self.queue.counts()
+                if counts['tasks'] or counts['leases']:
+                    # 他のワーカーが処理中（強制終了していればリースの期限切れ後に取り出す）
+                    idle_since = None
+                else:
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since >= self.idle_timeout:
+                        break
+                time.sleep(self.poll_interval)
+                continue
+            idle_since = None
+            task = lease.task
+            print(f"\n📄 {Path(task['book']).name} ページ {task['page']} を処理します（{task['attempts']}回目）")
+            start = time.monotonic()
+            try:
+                # APIキーがないなど、ワーカーの設定の問題はタスクの失敗に数えずに終了する
+                self.kindle_pdf_for(task)
+            except (ValueError, MissingDependencyError) as e:
+                self.queue.release(lease, str(e), count_attempt=False)
+                raise
+            try:
+                with self.queue.hold(lease):
+                    record, data = self.process(task)
+            except KeyboardInterrupt:
+                self.queue.release(lease, '中断されました', count_attempt=False)
+                raise
+            except Exception as e:
+                state = self.queue.release(lease, str(e))
+                print(f"  ❌ ページ {task['page']} を処理できませんでした: {e}"
+                      + ("（失敗として扱います）" if state == 'failed' else "（再試行します）"))
+                self.stats['failed' if state == 'failed' else 'retried'] += 1
+                continue
+            seconds = time.monotonic() - start
+            self.queue.complete(lease, dict(record, worker=self.name, seconds=round(seconds, 3)), data)
+            self.stats['completed'] += 1
+            self.stats['seconds'] += seconds
+            print(f"  ✅ ページ {task['page']} 完了（{seconds:.1f}秒）")
+
+        print(f"\n✅ ワーカー {self.name} を終了します（完了: {self.stats['completed']}件、"
+              f"再試行: {self.stats['retried']}件、失敗: {self.stats['failed']}件、処理時間: {self.stats['seconds']:.1f}秒）")
+        return self.stats
+
+def text_similarity(reference: str, text: str) -> float:
+    """
+    2つの文字起こし結果の一致率を計算する（空白・改行の違いは無視する）
+
+    Args:
+        reference: 正解とする文字起こし結果
+        text: 比べる文字起こし結果
+
+    Returns:
+        0〜1の一致率（difflib の ratio）
+    """
+    reference = re.sub(r'\s+', '', reference)
+    text = re.sub(r'\s+', '', text)
+    if not reference and not text:
+        return 1.0
+    return difflib.SequenceMatcher(None, reference, text, autojunk=False).ratio()
+
+
+class UploadCalibrator:
+    """
+    LLMにアップロードする画像の設定ごとに、データ量・画像のトークン数・文字起こしの精度を測る
+
+    既存の texts/ の文字起こし結果を正解として、サンプルのページを設定ごとに文字起こしし直して比べます。
+    正解も同じLLMの出力のため、従来の設定（jpeg@2048）の精度は、同じ設定で文字起こしし直したときのばらつきの目安になります。
+    """
+
+    # 既定で比べる設定（プロファイル@長辺の最大ピクセル数）。最初の設定を基準にする
+    DEFAULT_SETTINGS = ('jpeg@2048', 'jpeg@1600', 'gray@1600', 'gray@1280', 'gray@1024',
+                        'bilevel@1600', 'bilevel@1280', 'bilevel@1024', 'auto@1600', 'auto@1280')
+
+    def __init__(self, kindle_pdf: 'KindlePDF', encoders: List[UploadEncoder]):
+        """
+        初期化
+
+        Args:
+            kindle_pdf: 文字起こしに使う KindlePDF（レート制限・再試行・使用量の集計を共有する）
+            encoders: 比べるアップロード用のエンコーダ（最初のものを基準にする）
+        """
+        self.kindle_pdf = kindle_pdf
+        self.encoders = encoders
+
+    @staticmethod
+    def parse_setting(setting: str) -> UploadEncoder:
+        """
+        「プロファイル@長辺の最大ピクセル数」（例: gray@1280、auto）からエンコーダを作る
+
+        Args:
+            setting: 設定の文字列
+
+        Returns:
+            アップロード用のエンコーダ
+        """
+        profile, _, max_size = setting.strip().partition('@')
         try:
-            # 画像を読み込んでPDFに変換
-            images = []
-            for img_path in sorted(image_paths):
+            return UploadEncoder(profile, int(max_size) if max_size else None)
+        except ValueError:
+            raise ValueError(f"アップロード設定の形式が正しくありません: {setting}（例: gray@1280）")
+
+    @staticmethod
+    def sample_pages(book_dirs: List[Path], count: int) -> List[Tuple[Path, int, Path, str]]:
+        """
+        正解の文字起こし結果とスクリーンショットがそろっているページから、本全体に均等にサンプルを選ぶ
+
+        スクリーンショットは出力ディレクトリの screenshots/ と、results.json に記録されたパスから探します。
+        ローカルOCRで文字起こししたページ（results.json の ocr_routing）はLLMの出力ではないため除きます。
+
+        Args:
+            book_dirs: 本の出力ディレクトリのリスト
+            count: 選ぶページ数
+
+        Returns:
+            (本の出力ディレクトリ, ページ番号, スクリーンショットのパス, 正解の文字起こし結果) のリスト
+        """
+        candidates = []
+        for book_dir in book_dirs:
+            screenshots = {}
+            routes = {}
+            results_path = book_dir / "results.json"
+            if results_path.exists():
+                with open(results_path, 'r', encoding='utf-8') as f:
+                    results = json.load(f)
+                screenshots = results_screenshots(results)
+                routes = (results.get('ocr_routing') or {}).get('pages', {})
+            screenshots_dir = book_dir / "screenshots"
+            if screenshots_dir.is_dir():
+                screenshots.update(find_screenshots(screenshots_dir))
+            for text_file in sorted((book_dir / "texts").glob("page_*.txt")):
+                match = re.fullmatch(r'page_(\d+)\.txt', text_file.name)
+                if not match:
+                    continue
+                page = int(match.group(1))
+                if page not in screenshots or routes.get(str(page), {}).get('engine') == 'local':
+                    continue
+                candidates.append((book_dir, page, screenshots[page], text_file))
+        if count < len(candidates):
+            candidates = [candidates[i * len(candidates) // count] for i in range(count)]
+        samples = []
+        for book_dir, page, screenshot, text_file in candidates:
+            reference = text_file.read_text(encoding='utf-8').strip()
+            if reference:
+                samples.append((book_dir, page, screenshot, reference))
+        return samples
+
+    def transcribe(self, payload: UploadPayload) -> Tuple[str, int]:
+        """
+        キャッシュを使わずに1ページを文字起こしする
+
+        Returns:
+            (文字起こし結果, 入力トークン数)
+        """
+        response = self.kindle_pdf.generate_content([TRANSCRIPTION_PROMPT, payload.part()], num_pages=1)
+        return response.text.strip(), response.prompt_tokens
+
+    def run(self, samples: List[Tuple[Path, int, Path, str]]) -> List[dict]:
+        """
+        サンプルのページを設定ごとに文字起こしし、設定ごとの集計を返す
+
+        画像のデコードはページごとに1回だけ行い、すべての設定で共有します。
+
+        Args:
+            samples: sample_pages() の結果
+
+        Returns:
+            設定ごとの集計（setting, pages, failed, bytes, bytes_ratio, image_tokens, prompt_tokens,
+            accuracy, min_accuracy, profiles, pareto）のリスト
+        """
+        totals = [{'pages': 0, 'failed': 0, 'bytes': 0, 'image_tokens': 0, 'prompt_tokens': 0, 'accuracy': [],
+                   'profiles': {}} for _ in self.encoders]
+        for n, (book_dir, page, screenshot, reference) in enumerate(samples, 1):
+            print(f"\n📄 [{n}/{len(samples)}] {book_dir.name} ページ {page}")
+            frame = Frame(path=screenshot)
+            for encoder, total in zip(self.encoders, totals):
+                payload = frame.upload_payload(encoder)
                 try:
-                    img = Image.open(img_path)
-                    # RGBAモードの場合はRGBに変換（PDFはRGBのみ対応）
-                    if img.mode in ('RGBA', 'P'):
-                        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'RGBA':
-                            rgb_img.paste(img, mask=img.split()[3])  # アルファチャンネルをマスクとして使用
-                        else:
-                            rgb_img.paste(img)
-                        img = rgb_img
-                    elif img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    images.append(img)
+                    text, prompt_tokens = self.transcribe(payload)
                 except Exception as e:
-                    print(f"  ⚠️ 画像読み込みエラー ({img_path.name}): {e}")
+                    print(f"  ❌ {encoder.label}: 文字起こしエラー: {e}")
+                    total['failed'] += 1
                     continue
-            
-            if not images:
-                print("  ❌ PDF化できる画像がありません")
-                return None
-            
-            # 出力ファイル名を決定
-            if output_filename is None:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_filename = f"kindle_pages_{timestamp}.pdf"
-            
-            pdf_path = self.output_dir / output_filename
-            
-            # 最初の画像をベースにしてPDFを作成
-            if images:
-                images[0].save(
-                    pdf_path,
-                    "PDF",
-                    resolution=100.0,
-                    save_all=True,
-                    append_images=images[1:] if len(images) > 1 else []
-                )
-            
-            print(f"  ✅ PDF作成完了: {pdf_path.name}")
-            print(f"     ページ数: {len(images)}")
-            return pdf_path
-            
-        except Exception as e:
-            print(f"  ❌ PDF作成エラー: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
-    
-    def process_pages(self, num_pages: int, start_page: int = 1, delay_between_pages: float = 3.0):
+                accuracy = text_similarity(reference, text)
+                total['pages'] += 1
+                total['bytes'] += len(payload.data)
+                total['image_tokens'] += estimate_image_tokens(payload.width, payload.height)
+                total['prompt_tokens'] += prompt_tokens
+                total['accuracy'].append(accuracy)
+                total['profiles'][payload.profile] = total['profiles'].get(payload.profile, 0) + 1
+                print(f"  {encoder.label:>14}: {len(payload.data) / 1024:7.1f}KB  一致率 {accuracy:.3f}")
+
+        rows = []
+        for encoder, total in zip(self.encoders, totals):
+            pages = total['pages']
+            rows.append({
+                'setting': encoder.label,
+                'pages': pages,
+                'failed': total['failed'],
+                'bytes': round(total['bytes'] / pages) if pages else None,
+                'bytes_ratio': None,
+                'image_tokens': round(total['image_tokens'] / pages) if pages else None,
+                'prompt_tokens': round(total['prompt_tokens'] / pages) if pages else None,
+                'accuracy': round(sum(total['accuracy']) / pages, 4) if pages else None,
+                'min_accuracy': round(min(total['accuracy']), 4) if pages else None,
+                'profiles': dict(sorted(total['profiles'].items())),
+                'pareto': False
+            })
+        baseline_bytes = rows[0]['bytes'] if rows else None
+        measured = [row for row in rows if row['pages']]
+        for row in measured:
+            if baseline_bytes:
+                row['bytes_ratio'] = round(row['bytes'] / baseline_bytes, 3)
+            # データ量が少なく精度も高い設定がほかにない設定（サイズと精度のトレードオフ曲線上の設定）
+            row['pareto'] = not any(
+                other['bytes'] <= row['bytes'] and other['accuracy'] >= row['accuracy']
+                and (other['bytes'], -other['accuracy']) != (row['bytes'], -row['accuracy'])
+                for other in measured
+            )
+        return rows
+
+    @staticmethod
+    def recommend(rows: List[dict], tolerance: float) -> Optional[dict]:
         """
-        複数ページを処理
-        
+        基準の設定（最初の設定）との精度の差が tolerance 以内で、データ量が最も少ない設定を選ぶ
+
         Args:
-            num_pages: 処理するページ数
-            start_page: 開始ページ番号（デフォルト: 1）
-            delay_between_pages: ページ間の待機時間（秒）
+            rows: run() の結果
+            tolerance: 許容する一致率の低下（0〜1）
+
+        Returns:
+            推奨する設定の集計（基準の設定を測れなかった場合はNone）
         """
-        print(f"\n📖 {num_pages}ページを処理します")
-        print(f"   開始ページ: {start_page}")
-        print(f"   ページ間の待機時間: {delay_between_pages}秒")
-        print(f"\n⚠️  注意: マウスを画面の左上隅に移動すると緊急停止します\n")
-        
-        # 処理開始前にKindleアプリを前面に表示
-        print("📚 Kindleアプリを前面に表示しています...")
-        self.activate_kindle_app()
-        time.sleep(2)
-        
-        # 処理開始前のカウントダウン
-        print("5秒後に処理を開始します...")
-        for i in range(5, 0, -1):
-            print(f"  {i}...")
-            time.sleep(1)
-        
-        screenshot_paths = []
-        
-        for i in range(num_pages):
-            page_number = start_page + i
-            print(f"\n{'='*60}")
-            print(f"📄 ページ {page_number}/{start_page + num_pages - 1} を処理中...")
-            print(f"{'='*60}")
-            
-            # スクリーンショット取得
-            screenshot_path = self.take_screenshot(page_number)
-            if not screenshot_path:
-                print(f"  ⚠️ ページ {page_number} のスクリーンショット取得をスキップします")
-                continue
-            
-            screenshot_paths.append(screenshot_path)
-            
-            # LLM文字起こし処理（有効な場合）
-            if self.enable_ocr:
-                transcribed_text = self.extract_text_from_image(screenshot_path)
-                if transcribed_text:
-                    text_path = self.save_text(transcribed_text, page_number)
-                    if text_path:
-                        print(f"  💾 テキスト保存: {text_path.name}")
-            
-            # 最後のページでない場合、次のページへ
-            if i < num_pages - 1:
-                print(f"\n  ⏳ {delay_between_pages}秒待機してから次のページへ...")
-                time.sleep(delay_between_pages)
-                
-                # ページをめくる
-                print(f"\n  📖 ページをめくります...")
-                if not self.turn_page("next"):
-                    print(f"  ⚠️ ページめくりに失敗しました。処理を中断します")
-                    break
-                
-                # ページが完全に読み込まれるまで追加で待機
-                print(f"  ⏳ ページの読み込みを待機中...")
-                time.sleep(2.0)
-                
-                # Kindleアプリが確実に前面にあることを確認
-                self.activate_kindle_app()
-                time.sleep(1.0)
-        
-        # すべてのスクリーンショットをPDFにまとめる
-        print(f"\n{'='*60}")
-        print(f"📄 PDFファイルを作成中...")
-        print(f"{'='*60}")
-        
-        pdf_path = self.create_pdf_from_images(screenshot_paths)
-        
-        # 結果をJSONファイルに保存
-        results = {
-            'total_pages': len(screenshot_paths),
-            'screenshots': [str(p) for p in screenshot_paths],
-            'pdf_file': str(pdf_path) if pdf_path else None,
-            'ocr_enabled': self.enable_ocr
-        }
-        
-        # LLM文字起こしが有効な場合、テキストファイルの情報も追加
-        if self.enable_ocr:
-            text_files = []
-            for i in range(len(screenshot_paths)):
-                page_number = start_page + i
-                text_file = self.texts_dir / f"page_{page_number:04d}.txt"
-                if text_file.exists():
-                    text_files.append(str(text_file))
-            results['text_files'] = text_files
-        
-        results_path = self.output_dir / "results.json"
-        with open(results_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        if not rows or not rows[0]['pages']:
+            return None
+        floor = rows[0]['accuracy'] - tolerance
+        candidates = [row for row in rows if row['pages'] and row['accuracy'] >= floor]
+        return min(candidates, key=lambda row: (row['bytes'], -row['accuracy']))
+
+
+def run_profiled(func: Callable[[], object], output_dir: Path, cpu: bool = False, memory: bool = False):
+    """
+    CPUプロファイル（cProfile）とメモリ確保の追跡（tracemalloc）を有効にして関数を実行する
+
+    結果は出力ディレクトリの profile.pstats（`python -m pstats` で表示）と
+    memory_top.txt（確保量の多い行の上位とピーク使用量）に保存します。
+
+    Args:
+        func: 実行する関数
+        output_dir: 結果を保存するディレクトリ
+        cpu: cProfileを有効にするかどうか
+        memory: tracemallocを有効にするかどうか
+
+    Returns:
+        関数の戻り値
+    """
+    import cProfile
+    import tracemalloc
+
+    profiler = cProfile.Profile() if cpu else None
+    if memory:
+        tracemalloc.start(10)
+    if profiler:
+        profiler.enable()
+    try:
+        return func()
+    finally:
+        if profiler:
+            profiler.disable()
+            profile_path = Path(output_dir) / "profile.pstats"
+            profiler.dump_stats(str(profile_path))
+            print(f"   CPUプロファイル: {profile_path}")
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            memory_path = Path(output_dir) / "memory_top.txt"
+            with open(memory_path, 'w', encoding='utf-8') as f:
+                f.write(f"current: {current} bytes\npeak: {peak} bytes\n\n")
+                for stat in snapshot.statistics('lineno')[:30]:
+                    f.write(f"{stat}\n")
+            print(f"   メモリ使用量: ピーク {peak / 1024 / 1024:.1f}MB（詳細: {memory_path}）")
+
+
+def run_index_command(args):
+    """
+    全文検索インデックスの検索（--search）と既存の文字起こし結果の登録（--index-texts）を行う
+    
+    Args:
+        args: コマンドライン引数
+    """
+    text_index = TextIndex(Path(args.index_db))
+    try:
+        if args.index_texts:
+            book_dirs = find_book_dirs([Path(path) for path in args.index_texts])
+            if not book_dirs:
+                print(f"❌ texts/ を含むディレクトリが見つかりません: {' '.join(args.index_texts)}")
+            print(f"\n🗂️ {len(book_dirs)}冊の文字起こし結果を全文検索インデックスに登録します: {text_index.db_path}")
+            start = time.perf_counter()
+            for book_dir in book_dirs:
+                added, unchanged = text_index.index_book(book_dir)
+                print(f"   {book_dir}: {added}ページを登録（変更なし: {unchanged}ページ）")
+            stats = text_index.stats()
+            print(f"✅ 登録完了（{time.perf_counter() - start:.1f}秒、合計 {stats['books']}冊・{stats['pages']}ページ）")
         
-        print(f"\n{'='*60}")
-        print(f"✅ 処理完了！")
-        print(f"{'='*60}")
-        print(f"   処理したページ数: {len(screenshot_paths)}/{num_pages}")
-        if pdf_path:
-            print(f"   PDFファイル: {pdf_path}")
-        if self.enable_ocr:
-            print(f"   テキストファイル: {self.texts_dir}")
-        print(f"   スクリーンショット: {self.screenshots_dir}")
-        print(f"   結果ファイル: {results_path}")
+        if args.search:
+            start = time.perf_counter()
+            hits = text_index.search(args.search, limit=args.search_limit, book=args.search_book)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            stats = text_index.stats()
+            print(f"\n🔎 「{args.search}」の検索結果: {len(hits)}件"
+                  f"（{elapsed_ms:.1f}ms、{stats['books']}冊・{stats['pages']}ページから）")
+            for rank, hit in enumerate(hits, 1):
+                print(f"\n{rank:3d}. {hit.book} p.{hit.page}")
+                print(f"     {hit.snippet}")
+                if hit.screenshot:
+                    print(f"     📷 {hit.screenshot}")
+    finally:
+        text_index.close()
 
 
-def main():
-    """メイン関数"""
+def run_compact_command(args, frame_store: FrameStore):
+    """
+    既存のスクリーンショットをフレームストアに移す（--compact-screenshots）
+    
+    Args:
+        args: コマンドライン引数
+        frame_store: 保存先のフレームストア
+    """
+    screenshot_dirs = []
+    for path in args.compact_screenshots:
+        path = Path(path)
+        candidates = [path / "screenshots"] if (path / "screenshots").is_dir() else sorted(path.glob("**/screenshots"))
+        screenshot_dirs.extend(candidate for candidate in candidates if candidate.is_dir())
+    if not screenshot_dirs:
+        print(f"❌ screenshots/ を含むディレクトリが見つかりません: {' '.join(args.compact_screenshots)}")
+        return
+    print(f"\n🗜️ {len(screenshot_dirs)}冊のスクリーンショットをフレームストアに移します: "
+          f"{frame_store.root}（{frame_store.codec}）")
+    start = time.perf_counter()
+    original_bytes = 0
+    stored_bytes = 0
+    for screenshots_dir in screenshot_dirs:
+        stats = compact_screenshots(screenshots_dir, frame_store, prune=args.prune_screenshots)
+        original_bytes += stats['original_bytes']
+        stored_bytes += stats['stored_bytes']
+        pruned = f"、元のファイルを{stats['pruned_files']}個削除" if args.prune_screenshots else ""
+        print(f"   {screenshots_dir.parent}: {stats['pages']}ページ（新規: {stats['new']}、"
+              f"重複: {stats['duplicates']}） {stats['original_bytes'] / 1024 / 1024:.1f}MB"
+              f" → {stats['stored_bytes'] / 1024 / 1024:.1f}MB{pruned}")
+    files, removed_bytes = frame_store.apply_retention()
+    print(f"✅ 移行完了（{time.perf_counter() - start:.1f}秒、{original_bytes / 1024 / 1024:.1f}MB → "
+          f"{stored_bytes / 1024 / 1024:.1f}MB）")
+    if files:
+        print(f"   参照されていない画像を{files}個削除しました（{removed_bytes / 1024 / 1024:.1f}MB）")
+    if not args.prune_screenshots and original_bytes:
+        print("   元のスクリーンショットは残しています（削除する場合は --prune-screenshots を指定）")
+
+
+def run_calibration_command(args, options: dict):
+    """
+    既存の文字起こし結果を正解として、アップロード画像の設定ごとのデータ量と精度を比べる（--calibrate-upload）
+    
+    Args:
+        args: コマンドライン引数
+        options: KindlePDF の設定（LLMバックエンド・レート制限・再試行）
+    """
+    book_dirs = find_book_dirs([Path(path) for path in args.calibrate_upload])
+    if not book_dirs:
+        print(f"❌ texts/ を含むディレクトリが見つかりません: {' '.join(args.calibrate_upload)}")
+        return
+    settings = args.calibration_settings.split(',') if args.calibration_settings else UploadCalibrator.DEFAULT_SETTINGS
+    encoders = [UploadCalibrator.parse_setting(setting) for setting in settings if setting.strip()]
+    samples = UploadCalibrator.sample_pages(book_dirs, args.calibration_pages)
+    if not samples:
+        print("❌ 文字起こし結果とスクリーンショットがそろっているページがありません")
+        return
+    
+    kindle_pdf = KindlePDF(output_dir=book_dirs[0], **dict(
+        options, enable_ocr=True, use_cache=False, text_index=None, ocr_router=None, frame_store=None,
+        work_queue=None, append_pdf=False
+    ))
+    print(f"\n🎯 {len(book_dirs)}冊から{len(samples)}ページを{len(encoders)}通りの設定で文字起こしし直します"
+          f"（LLMリクエスト {len(samples) * len(encoders)}回）")
+    start = time.perf_counter()
+    calibrator = UploadCalibrator(kindle_pdf, encoders)
+    rows = calibrator.run(samples)
+    recommended = calibrator.recommend(rows, args.calibration_tolerance)
+    
+    print(f"\n{'='*60}")
+    print(f"📊 アップロード設定ごとのデータ量と一致率（基準: {rows[0]['setting']}、★はトレードオフ曲線上の設定）")
+    print(f"{'='*60}")
+    print(f"   {'':>10}設定    1ページ  基準比  画像トークン  一致率    最小")
+    for row in rows:
+        if not row['pages']:
+            print(f"   {row['setting']:>14}  （すべて失敗）")
+            continue
+        ratio = f"{row['bytes_ratio']:.2f}" if row['bytes_ratio'] is not None else '-'
+        mark = ' ★' if row['pareto'] else ''
+        print(f"   {row['setting']:>14}  {row['bytes'] / 1024:7.1f}KB  {ratio:>6}  {row['image_tokens']:>12}"
+              f"  {row['accuracy']:6.3f}  {row['min_accuracy']:6.3f}{mark}")
+    if recommended:
+        profile, _, max_size = recommended['setting'].partition('@')
+        flags = f"--upload-profile {profile}" + (f" --upload-max-size {max_size}" if max_size else "")
+        print(f"\n💡 一致率の低下を{args.calibration_tolerance:g}以内に抑えてデータ量が最も少ない設定: "
+              f"{recommended['setting']}（{flags}）")
+    
+    report_path = Path(args.calibrate_upload[0]) / "upload_calibration.json"
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'backend': kindle_pdf.model_name,
+        'books': [str(book_dir) for book_dir in book_dirs],
+        'pages': [{'book': str(book_dir), 'page': page} for book_dir, page, _, _ in samples],
+        'tolerance': args.calibration_tolerance,
+        'settings': rows,
+        'recommended': recommended['setting'] if recommended else None,
+        'llm_usage': kindle_pdf.llm_usage
+    }
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 計測完了（{time.perf_counter() - start:.1f}秒）: {report_path}")
+
+
+def build_parser():
+    """コマンドライン引数のパーサーを作成"""
     import argparse
     
-    parser = argparse.ArgumentParser(
-        description="Kindleアプリの自動ページめくりとスクリーンショット取得＋PDF化処理",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-使用例:
-  # 5ページを処理してPDF化
-  python kindle_ocr.py --pages 5
-  
-  # 10ページを処理、ページ間の待機時間を5秒に設定
-  python kindle_ocr.py --pages 10 --delay 5
-  
-  # カスタム出力ディレクトリを指定
-  python kindle_ocr.py --pages 5 --output my_output
-        """
+    parser = argparse.ArgumentParser(
+        description="Kindleアプリの自動ページめくりとスクリーンショット取得＋PDF化処理",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # 5ページを処理してPDF化
+  python kindle_ocr.py --pages 5
+  
+  # 10ページを処理、ページ間の待機時間を5秒に設定
+  python kindle_ocr.py --pages 10 --delay 5
+  
+  # カスタム出力ディレクトリを指定
+  python kindle_ocr.py --pages 5 --output my_output
+        """
+    )
+    
+    parser.add_argument(
+        '--pages',
+        type=int,
+        help='処理するページ数（--resume使用時は省略可）'
+    )
+    
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='出力ディレクトリのジャーナル（journal.jsonl）を読み込んで、中断した処理を続きから再開する'
+    )
+    
+    parser.add_argument(
+        '--append-pdf',
+        action='store_true',
+        help='出力ディレクトリの前回のPDFに今回のページを追記し、results.json をまとめる'
+             '（--start-page は前回の最後のページの次のページ）'
+    )
+    
+    parser.add_argument(
+        '--replay',
+        metavar='DIR',
+        help='Kindleアプリを操作せず、取得済みのスクリーンショットのディレクトリから文字起こし・PDF・結果ファイルを作り直す'
+    )
+    
+    parser.add_argument(
+        '--jobs',
+        metavar='FILE',
+        help='複数の本を順に処理するジョブ定義ファイル（JSON）。次の本のキャプチャ中に前の本の文字起こしとPDFを仕上げる'
+    )
+    
+    parser.add_argument(
+        '--job-overlap',
+        type=int,
+        default=1,
+        help='--jobs で次の本のキャプチャと並行して仕上げる本の数の上限（デフォルト: 1）'
+    )
+    
+    parser.add_argument(
+        '--job-manual-open',
+        action='store_true',
+        help='--jobs で2冊目以降の open_url がない本を手動で開いてEnterを押すまで待つ（無人実行では指定しない）'
+    )
+    
+    parser.add_argument(
+        '--queue',
+        metavar='DIR',
+        help='作業キューのディレクトリ（共有ディレクトリ可）。キャプチャ・--replay ではPDF化と文字起こしをせずにページを登録する'
+    )
+    
+    parser.add_argument(
+        '--worker',
+        action='store_true',
+        help='--queue のタスクを取り出してPDF用の変換と文字起こしを行うワーカーとして実行する'
+    )
+    
+    parser.add_argument(
+        '--worker-idle',
+        type=float,
+        default=0.0,
+        help='--worker で処理待ち・処理中のタスクがなくなってから終了するまで待つ時間（秒、デフォルト: 0）'
+    )
+    
+    parser.add_argument(
+        '--assemble',
+        action='store_true',
+        help='--queue でワーカーが処理したページから、本ごとにPDFと results.json を作成する'
+    )
+    
+    parser.add_argument(
+        '--lease-seconds',
+        type=float,
+        default=300.0,
+        help='作業キューのリースの期限（秒、この間更新されないタスクは他のワーカーが処理し直す、デフォルト: 300）'
     )
     
     parser.add_argument(
-        '--pages',
+        '--max-attempts',
+        type=int,
+        default=3,
+        help='作業キューのタスクを失敗として扱うまでの最大試行回数（デフォルト: 3）'
+    )
+    
+    parser.add_argument(
+        '--search',
+        metavar='QUERY',
+        help='全文検索インデックスから文字起こし結果を検索する（空白区切りでAND検索）'
+    )
+    
+    parser.add_argument(
+        '--search-limit',
         type=int,
-        required=True,
-        help='処理するページ数'
+        default=20,
+        help='--search で表示する件数（デフォルト: 20）'
+    )
+    
+    parser.add_argument(
+        '--search-book',
+        metavar='TITLE',
+        help='--search の対象を指定したタイトルの本に絞り込む'
+    )
+    
+    parser.add_argument(
+        '--index-texts',
+        metavar='DIR',
+        nargs='+',
+        help='指定したディレクトリ以下の既存の texts/ を全文検索インデックスにまとめて登録する'
+    )
+    
+    parser.add_argument(
+        '--index-db',
+        default=str(DEFAULT_INDEX_PATH),
+        help=f'全文検索インデックスのデータベース（デフォルト: {DEFAULT_INDEX_PATH}）'
+    )
+    
+    parser.add_argument(
+        '--no-index',
+        action='store_true',
+        help='文字起こし結果を全文検索インデックスに登録しない'
     )
     
     parser.add_argument(
         '--start-page',
         type=int,
-        default=1,
-        help='開始ページ番号（デフォルト: 1）'
+        help='開始ページ番号（デフォルト: 1、--replay使用時は最初のページ）'
     )
     
     parser.add_argument(
@@ -610,28 +7125,590 @@ def main():
         help='Gemini APIキー（--ocrオプション使用時、環境変数GEMINI_API_KEYからも取得可能）'
     )
     
+    parser.add_argument(
+        '--adaptive-settle',
+        action='store_true',
+        help='固定の待機時間の代わりに、ページめくり後に画面が静止した時点でキャプチャする（--delayは無視されます）'
+    )
+    
+    parser.add_argument(
+        '--settle-timeout',
+        type=float,
+        default=5.0,
+        help='--adaptive-settle使用時に画面の静止を待つ最大時間（秒、デフォルト: 5.0）'
+    )
+    
+    parser.add_argument(
+        '--detect-end',
+        action='store_true',
+        help='直前と同じ画面を検出し、ページめくりを再試行・本の終わりで自動終了する（--pagesは上限として扱われます）'
+    )
+    
+    parser.add_argument(
+        '--end-after',
+        type=int,
+        default=3,
+        help='--detect-end使用時、同じ画面が何回続いたら本の終わりとみなすか（デフォルト: 3）'
+    )
+    
+    parser.add_argument(
+        '--hash-threshold',
+        type=int,
+        default=6,
+        help='--detect-end使用時、同じ画面とみなす知覚ハッシュの差（256ビット中、デフォルト: 6）'
+    )
+    
+    parser.add_argument(
+        '--auto-crop',
+        action='store_true',
+        help='スクリーンショットを本のページ領域に自動で切り抜いてから保存・文字起こし・PDF化する'
+    )
+    
+    parser.add_argument(
+        '--frame-store',
+        metavar='DIR',
+        nargs='?',
+        const=str(DEFAULT_FRAME_STORE_PATH),
+        help='スクリーンショットを画素のハッシュで重複を除いてフレームストアに保存する'
+             f'（DIRを省略した場合: {DEFAULT_FRAME_STORE_PATH}）'
+    )
+    
+    parser.add_argument(
+        '--frame-codec',
+        choices=list(FrameStore.CODECS),
+        default='webp',
+        help='フレームストアの保存形式（いずれも可逆圧縮、webpはPNGの半分程度のサイズ、デフォルト: webp）'
+    )
+    
+    parser.add_argument(
+        '--frame-retention',
+        choices=FrameStore.RETENTIONS,
+        default='latest',
+        help='フレームストアの保持方針（latest: どの本の最新の索引からも参照されていない画像を削除、'
+             'all: 削除しない、デフォルト: latest）'
+    )
+    
+    parser.add_argument(
+        '--compact-screenshots',
+        metavar='DIR',
+        nargs='+',
+        help='指定したディレクトリ以下の既存の screenshots/ をフレームストアに移す（--frame-store の保存先を使用）'
+    )
+    
+    parser.add_argument(
+        '--prune-screenshots',
+        action='store_true',
+        help='--compact-screenshots でフレームストアに移した元のPNGファイルを削除する'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='文字起こしキャッシュを使用しない（常にLLMで文字起こしする）'
+    )
+    
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        help='文字起こしキャッシュのディレクトリ（デフォルト: ~/.cache/kindle_ocr/transcriptions）'
+    )
+    
+    parser.add_argument(
+        '--cache-max-mb',
+        type=float,
+        default=100.0,
+        help='文字起こしキャッシュの最大サイズ（MB、デフォルト: 100）'
+    )
+    
+    parser.add_argument(
+        '--llm-backend',
+        choices=['gemini', 'fake'],
+        default='gemini',
+        help='文字起こしに使うLLMバックエンド（fakeはAPIを呼び出さない負荷試験用、デフォルト: gemini）'
+    )
+    
+    parser.add_argument(
+        '--fake-latency',
+        type=float,
+        default=1.0,
+        help='--llm-backend fake の応答時間（秒、デフォルト: 1.0）'
+    )
+    
+    parser.add_argument(
+        '--fake-error-rate',
+        type=float,
+        default=0.0,
+        help='--llm-backend fake が一時的なエラーを返す確率（0〜1、デフォルト: 0）'
+    )
+    
+    parser.add_argument(
+        '--local-ocr',
+        choices=['none', 'tesseract', 'fake'],
+        default='none',
+        help='--ocr使用時、先にローカルOCRで文字起こしし、信頼度の低いページや図・表のページだけをLLMに回す'
+             '（fakeはOCRを実行しない試験用、デフォルト: none）'
+    )
+    
+    parser.add_argument(
+        '--local-ocr-lang',
+        type=str,
+        default='jpn+eng',
+        help='--local-ocr tesseract で使う言語データ（デフォルト: jpn+eng）'
+    )
+    
+    parser.add_argument(
+        '--escalate-confidence',
+        type=float,
+        default=80.0,
+        help='ローカルOCRの信頼度（0〜100）がこの値未満のページをLLMに回す（デフォルト: 80）'
+    )
+    
+    parser.add_argument(
+        '--escalate-blocks',
+        type=int,
+        default=5,
+        help='ローカルOCRのテキストブロックがこの数より多いページ（段組み・図と本文の混在）をLLMに回す（デフォルト: 5）'
+    )
+    
+    parser.add_argument(
+        '--fake-local-confidence',
+        type=float,
+        default=90.0,
+        help='--local-ocr fake が返す信頼度の中心値（ページごとに±15の範囲でばらつく、デフォルト: 90）'
+    )
+    
+    parser.add_argument(
+        '--rpm',
+        type=float,
+        default=0,
+        help='LLMへの1分あたりの最大リクエスト数（0で制限なし、デフォルト: 0）'
+    )
+    
+    parser.add_argument(
+        '--tpm',
+        type=float,
+        default=0,
+        help='LLMへの1分あたりの最大トークン数（0で制限なし、デフォルト: 0）'
+    )
+    
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=5,
+        help='一時的なエラー（429・5xx・タイムアウト）の1リクエストあたりの最大再試行回数（デフォルト: 5）'
+    )
+    
+    parser.add_argument(
+        '--retry-budget',
+        type=int,
+        default=100,
+        help='実行全体での再試行回数の上限（デフォルト: 100）'
+    )
+    
+    parser.add_argument(
+        '--upload-profile',
+        choices=UploadEncoder.PROFILES,
+        default='jpeg',
+        help='LLMにアップロードする画像の形式: auto（ページごとに選択）/ jpeg（カラー）/ gray（グレースケール）/ '
+             'bilevel（白黒2値のPNG）（デフォルト: jpeg）'
+    )
+    
+    parser.add_argument(
+        '--upload-max-size',
+        type=int,
+        default=None,
+        help='LLMにアップロードする画像の長辺の最大ピクセル数（デフォルト: jpegは2048、gray・bilevelは1600）'
+    )
+    
+    parser.add_argument(
+        '--calibrate-upload',
+        metavar='DIR',
+        nargs='+',
+        help='既存の texts/ を正解として、アップロード画像の設定ごとのデータ量と文字起こしの一致率を比べる'
+    )
+    
+    parser.add_argument(
+        '--calibration-pages',
+        type=int,
+        default=10,
+        help='--calibrate-upload で文字起こしし直すページ数（デフォルト: 10）'
+    )
+    
+    parser.add_argument(
+        '--calibration-settings',
+        default=None,
+        help='--calibrate-upload で比べる設定（カンマ区切りの「プロファイル@長辺のピクセル数」、最初の設定が基準。'
+             f'デフォルト: {",".join(UploadCalibrator.DEFAULT_SETTINGS)}）'
+    )
+    
+    parser.add_argument(
+        '--calibration-tolerance',
+        type=float,
+        default=0.01,
+        help='--calibrate-upload で推奨する設定に許容する、基準の設定からの一致率の低下（デフォルト: 0.01）'
+    )
+    
+    parser.add_argument(
+        '--ocr-workers',
+        type=int,
+        default=0,
+        help='バックグラウンドで文字起こしを行うワーカー数（0の場合はページごとに同期処理、デフォルト: 0）'
+    )
+    
+    parser.add_argument(
+        '--ocr-batch-size',
+        type=int,
+        default=1,
+        help='1回のLLMリクエストでまとめて文字起こしするページ数（デフォルト: 1）'
+    )
+    
+    parser.add_argument(
+        '--ocr-queue-size',
+        type=int,
+        default=4,
+        help='文字起こし待ちキューの最大長（--ocr-workers使用時、デフォルト: 4）'
+    )
+    
+    parser.add_argument(
+        '--ocr-concurrency',
+        type=int,
+        default=0,
+        help='asyncioで同時に送信するLLMリクエスト数（指定した場合は--ocr-workersの代わりに使用、デフォルト: 0）'
+    )
+    
+    parser.add_argument(
+        '--ocr-timeout',
+        type=float,
+        default=120.0,
+        help='--ocr-concurrency使用時の1回のリクエストのタイムアウト（秒、デフォルト: 120）'
+    )
+    
+    parser.add_argument(
+        '--pdf-profile',
+        choices=StreamingPDFWriter.PROFILES,
+        default='jpeg',
+        help='PDFの出力プロファイル（auto: ページごとに自動選択、jpeg: カラーJPEG、gray: 可逆グレースケール、'
+             'bilevel: 白黒2値のCCITT G4、デフォルト: jpeg）'
+    )
+    
+    parser.add_argument(
+        '--pdf-dpi',
+        type=float,
+        help='PDFのページサイズの計算に使う解像度（Retinaディスプレイのスクリーンショットは144、'
+             'デフォルト: 画像に記録された解像度、なければ100）'
+    )
+    
+    parser.add_argument(
+        '--pdf-jpeg-quality',
+        type=int,
+        default=75,
+        help='PDFにJPEGで埋め込むページの品質（1〜95、デフォルト: 75）'
+    )
+    
+    parser.add_argument(
+        '--convert-workers',
+        type=int,
+        default=0,
+        help='--replay で画像の変換（デコード・切り抜き・PDF用の圧縮・アップロード用の画像）を並列に行うプロセス数'
+             '（0で並列化しない、デフォルト: 0）'
+    )
+    
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        help='並列変換で同時に処理中にするページ数の上限（デフォルト: --convert-workers の2倍）'
+    )
+    
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='cProfileでCPUプロファイルを取得し、出力ディレクトリの profile.pstats に保存する'
+    )
+    
+    parser.add_argument(
+        '--trace-memory',
+        action='store_true',
+        help='tracemallocでメモリ確保を追跡し、出力ディレクトリの memory_top.txt に保存する'
+    )
+    
+    return parser
+
+
+def components_for(args) -> List[str]:
+    """
+    コマンドライン引数で指定された処理で使う部品（COMPONENTS の部品名）を返す
+    
+    Args:
+        args: build_parser() で解析した引数
+        
+    Returns:
+        部品名のリスト（全文検索の検索・登録では空）
+    """
+    if args.search or args.index_texts:
+        return []
+    if args.compact_screenshots or args.assemble:
+        return ['pdf']
+    if args.calibrate_upload:
+        return ['pdf', 'llm'] if args.llm_backend == 'gemini' else ['pdf']
+    names = ['pdf']
+    # 再処理とワーカーではKindleアプリを操作しない
+    if not args.replay and not args.worker:
+        names += ['capture', 'focus']
+    # 作業キューに登録する場合、文字起こしはワーカーが行う（ワーカーのGemini SDKは使うときに読み込む）
+    transcribes = args.worker or (args.ocr and not args.queue)
+    if transcribes and args.llm_backend == 'gemini' and not args.worker:
+        names.append('llm')
+    if transcribes and args.local_ocr == 'tesseract':
+        names.append('local_ocr')
+    return names
+
+
+def main():
+    """メイン関数"""
+    parser = build_parser()
     args = parser.parse_args()
     
+    # 使う部品のパッケージだけを読み込む（足りない場合は処理を始める前に終了）
     try:
-        # KindlePDFインスタンスを作成
-        kindle_pdf = KindlePDF(
-            output_dir=args.output,
+        require(*components_for(args))
+    except MissingDependencyError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    # 全文検索インデックスの検索・登録はKindleアプリもLLMも使わない
+    if args.search or args.index_texts:
+        try:
+            run_index_command(args)
+        except (RuntimeError, sqlite3.Error) as e:
+            print(f"❌ 全文検索インデックスのエラー: {e}")
+            sys.exit(1)
+        return
+    
+    # フレームストアはすべての本で共有する
+    frame_store = None
+    if args.frame_store or args.compact_screenshots:
+        try:
+            frame_store = FrameStore(
+                Path(args.frame_store or DEFAULT_FRAME_STORE_PATH).expanduser(),
+                codec=args.frame_codec,
+                retention=args.frame_retention
+            )
+        except (OSError, ValueError) as e:
+            print(f"❌ フレームストアを使用できません: {e}")
+            sys.exit(1)
+    
+    # 既存のスクリーンショットの移行はKindleアプリもLLMも使わない
+    if args.compact_screenshots:
+        try:
+            run_compact_command(args, frame_store)
+        except (OSError, ValueError) as e:
+            print(f"❌ スクリーンショットの移行に失敗しました: {e}")
+            sys.exit(1)
+        return
+    
+    if (args.worker or args.assemble) and not args.queue:
+        parser.error('--worker・--assemble には --queue を指定してください')
+    if args.pages is None and not args.resume and not args.replay and not args.jobs and not args.worker and not args.assemble \
+            and not args.calibrate_upload:
+        parser.error('--pages を指定してください（--resume・--replay・--jobs・--worker・--assemble・--calibrate-upload 使用時は省略可）')
+    if sum(1 for option in (args.replay, args.resume, args.jobs) if option) > 1:
+        parser.error('--replay・--resume・--jobs は同時に指定できません')
+    if args.append_pdf and args.resume:
+        parser.error('--append-pdf と --resume は同時に指定できません（--resume は中断した実行のPDFを作り直します）')
+    
+    kindle_pdf = None
+    focus_manager = None
+    text_index = None
+    try:
+        # 文字起こし結果は保存するたびに全文検索インデックスに登録する
+        if args.ocr and not args.no_index:
+            try:
+                text_index = TextIndex(Path(args.index_db))
+            except (RuntimeError, sqlite3.Error) as e:
+                print(f"⚠️ 全文検索インデックスを使用できません: {e}")
+        
+        # LLMバックエンドの作成（Geminiの場合はKindlePDFがAPIキーから作成）
+        backend = None
+        if args.llm_backend == 'fake':
+            backend = FakeBackend(latency=args.fake_latency, error_rate=args.fake_error_rate)
+        
+        # ローカルOCRを先に使う場合の振り分け
+        ocr_router = None
+        if (args.ocr or args.worker) and args.local_ocr != 'none':
+            if args.local_ocr == 'tesseract':
+                try:
+                    local_engine = TesseractEngine(lang=args.local_ocr_lang)
+                except RuntimeError as e:
+                    print(f"❌ ローカルOCRを使用できません: {e}")
+                    sys.exit(1)
+            else:
+                local_engine = FakeLocalOCR(confidence=args.fake_local_confidence, spread=15.0)
+            ocr_router = OCRRouter(
+                local_engine,
+                min_confidence=args.escalate_confidence,
+                max_blocks=args.escalate_blocks
+            )
+        
+        # 作業キュー（キャプチャ・再処理ではPDF化と文字起こしの代わりにページを登録する）
+        work_queue = None
+        if args.queue:
+            work_queue = WorkQueue(Path(args.queue), lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+        
+        # KindlePDFの設定（--jobs の場合は本ごとに出力ディレクトリだけを変えて作成する）
+        options = dict(
             api_key=args.api_key,
-            enable_ocr=args.ocr
+            enable_ocr=args.ocr and not work_queue,
+            adaptive_settle=args.adaptive_settle,
+            settle_timeout=args.settle_timeout,
+            cache_dir=args.cache_dir,
+            cache_max_mb=args.cache_max_mb,
+            use_cache=not args.no_cache,
+            detect_duplicates=args.detect_end,
+            end_after=args.end_after,
+            hash_threshold=args.hash_threshold,
+            auto_crop=args.auto_crop,
+            ocr_batch_size=args.ocr_batch_size,
+            backend=backend,
+            rate_limiter=RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm),
+            retry_policy=RetryPolicy(max_retries=args.max_retries, retry_budget=args.retry_budget),
+            pdf_profile=args.pdf_profile,
+            pdf_dpi=args.pdf_dpi,
+            pdf_jpeg_quality=args.pdf_jpeg_quality,
+            convert_workers=args.convert_workers,
+            max_in_flight=args.max_in_flight,
+            ocr_concurrency=args.ocr_concurrency,
+            ocr_timeout=args.ocr_timeout,
+            text_index=text_index,
+            ocr_router=ocr_router,
+            frame_store=frame_store,
+            append_pdf=args.append_pdf,
+            work_queue=work_queue,
+            queue_ocr=args.ocr,
+            upload_profile=args.upload_profile,
+            upload_max_size=args.upload_max_size
         )
         
-        # Kindleアプリを開く（スキップしない場合）
-        if not args.skip_open:
-            if not kindle_pdf.open_kindle_app():
-                print("\n❌ Kindleアプリを開けませんでした。処理を終了します。")
+        # アップロード画像の設定の比較はKindleアプリを操作しない
+        if args.calibrate_upload:
+            try:
+                run_calibration_command(args, options)
+            except ValueError as e:
+                print(f"❌ {e}")
                 sys.exit(1)
+            return
         
-        # ページ処理を実行
-        kindle_pdf.process_pages(
-            num_pages=args.pages,
-            start_page=args.start_page,
-            delay_between_pages=args.delay
-        )
+        if args.worker:
+            # ワーカーは本ごとに文字起こし用のKindlePDFを作成し、文字起こしキャッシュは全冊で共有する
+            # （全文検索インデックスへの登録は --assemble で行う）
+            shared_cache = []
+            
+            def make_book_pdf(book_dir: Path, ocr: bool) -> KindlePDF:
+                book_options = dict(options, enable_ocr=ocr, text_index=None, work_queue=None, append_pdf=False,
+                                    transcription_cache=shared_cache[0] if shared_cache else None)
+                book_pdf = KindlePDF(output_dir=book_dir, **book_options)
+                if book_pdf.transcription_cache and not shared_cache:
+                    shared_cache.append(book_pdf.transcription_cache)
+                return book_pdf
+            
+            worker = QueueWorker(work_queue, make_book_pdf, idle_timeout=args.worker_idle)
+            if args.profile or args.trace_memory:
+                run_profiled(worker.run, work_queue.root, cpu=args.profile, memory=args.trace_memory)
+            else:
+                worker.run()
+            return
+        
+        if args.assemble:
+            # 本ごとにPDFと結果ファイルを作成し、ワーカーが保存した文字起こし結果を全文検索インデックスに登録する
+            for book_dir in work_queue.books():
+                book_pdf = KindlePDF(output_dir=book_dir, **dict(options, enable_ocr=False, work_queue=None))
+                results = book_pdf.assemble_from_queue(work_queue)
+                if results and results.get('text_files') and text_index is None and not args.no_index:
+                    try:
+                        text_index = TextIndex(Path(args.index_db))
+                    except (RuntimeError, sqlite3.Error) as e:
+                        print(f"⚠️ 全文検索インデックスを使用できません: {e}")
+                if results and results.get('text_files') and text_index:
+                    added, unchanged = text_index.index_book(book_dir)
+                    print(f"   全文検索インデックス: {added}ページを登録（変更なし: {unchanged}ページ）")
+            return
+        
+        if args.jobs:
+            # 複数の本を処理する場合、前面表示・レート制限・文字起こしキャッシュは全冊で共有する
+            job_path = Path(args.jobs)
+            try:
+                books = load_job_spec(job_path, manual_open=args.job_manual_open)
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            focus_manager = AppleScriptFocusManager()
+            shared_cache = []
+            
+            def make_kindle_pdf(book: dict) -> KindlePDF:
+                book_pdf = KindlePDF(
+                    output_dir=book['output'],
+                    focus_manager=focus_manager,
+                    transcription_cache=shared_cache[0] if shared_cache else None,
+                    book_title=book['title'],
+                    **options
+                )
+                if not shared_cache:
+                    shared_cache.append(book_pdf.transcription_cache)
+                return book_pdf
+            
+            scheduler = LibraryScheduler(
+                books,
+                make_kindle_pdf,
+                summary_path=job_path.with_name(job_path.stem + '_summary.json'),
+                overlap=args.job_overlap,
+                default_delay=args.delay,
+                ocr_workers=args.ocr_workers,
+                ocr_queue_size=args.ocr_queue_size,
+                skip_open=args.skip_open,
+                manual_open=args.job_manual_open
+            )
+            if args.profile or args.trace_memory:
+                run_profiled(scheduler.run, scheduler.summary_path.parent, cpu=args.profile, memory=args.trace_memory)
+            else:
+                scheduler.run()
+            return
+        
+        # KindlePDFインスタンスを作成
+        kindle_pdf = KindlePDF(output_dir=args.output, **options)
+        
+        # 取得済みのスクリーンショットを再処理する場合はKindleアプリを操作しない
+        if args.replay:
+            run = functools.partial(
+                kindle_pdf.replay_screenshots,
+                Path(args.replay),
+                num_pages=args.pages,
+                start_page=args.start_page,
+                ocr_workers=args.ocr_workers,
+                ocr_queue_size=args.ocr_queue_size
+            )
+        else:
+            # Kindleアプリを開く（スキップしない場合）
+            if not args.skip_open:
+                if not kindle_pdf.open_kindle_app():
+                    print("\n❌ Kindleアプリを開けませんでした。処理を終了します。")
+                    sys.exit(1)
+            
+            # ページ処理を実行
+            run = functools.partial(
+                kindle_pdf.process_pages,
+                num_pages=args.pages,
+                start_page=args.start_page if args.start_page is not None else 1,
+                delay_between_pages=args.delay,
+                ocr_workers=args.ocr_workers,
+                ocr_queue_size=args.ocr_queue_size,
+                resume=args.resume
+            )
+        
+        if args.profile or args.trace_memory:
+            succeeded = run_profiled(run, kindle_pdf.output_dir, cpu=args.profile, memory=args.trace_memory)
+        else:
+            succeeded = run()
+        if not succeeded:
+            sys.exit(1)
         
     except KeyboardInterrupt:
         print("\n\n⚠️ ユーザーによって処理が中断されました")
@@ -641,6 +7718,13 @@ def main():
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if kindle_pdf:
+            kindle_pdf.close()
+        if focus_manager:
+            focus_manager.close()
+        if text_index:
+            text_index.close()
 
 
 if __name__ == "__main__":
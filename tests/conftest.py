@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# リポジトリ直下の kindle_ocr.py を読み込めるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
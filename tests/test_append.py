@@ -0,0 +1,114 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import kindle_ocr
+from kindle_ocr import FakeFocusManager, KindlePDF, StreamingPDFWriter
+
+
+def save_screenshots(directory, pages):
+    directory.mkdir(exist_ok=True)
+    for page in pages:
+        image = Image.new('RGB', (200, 300), (255, 255 - page * 10, 255))
+        image.save(directory / f"page_{page:04d}_20250101_000000.png")
+    return directory
+
+
+def make_kindle_pdf(output_dir):
+    return KindlePDF(output_dir=str(output_dir), enable_ocr=False, append_pdf=True, focus_manager=FakeFocusManager())
+
+
+@pytest.fixture
+def existing_book(tmp_path):
+    """1〜5ページのPDFを作成済みの出力ディレクトリ"""
+    output_dir = tmp_path / "out"
+    assert make_kindle_pdf(output_dir).replay_screenshots(save_screenshots(tmp_path / "first", range(1, 6)))
+    return output_dir
+
+
+@pytest.mark.parametrize('new_pages', [[6, 8], [6, 6, 7], [5, 6], [7, 8]])
+def test_append_rejects_pages_that_break_the_sequence(existing_book, new_pages):
+    assert not make_kindle_pdf(existing_book).prepare_append(new_pages)
+
+
+def test_replay_with_gap_is_rejected(existing_book, tmp_path):
+    kindle_pdf = make_kindle_pdf(existing_book)
+
+    assert not kindle_pdf.replay_screenshots(save_screenshots(tmp_path / "second", [6, 8]))
+    assert kindle_ocr.results_pdf_pages(kindle_ocr.json.loads((existing_book / "results.json").read_text())) == \
+        [1, 2, 3, 4, 5]
+
+
+def test_replay_appends_contiguous_pages(existing_book, tmp_path):
+    kindle_pdf = make_kindle_pdf(existing_book)
+
+    assert kindle_pdf.replay_screenshots(save_screenshots(tmp_path / "second", [6, 7]))
+    results = kindle_ocr.json.loads((existing_book / "results.json").read_text())
+    assert kindle_ocr.results_pdf_pages(results) == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_rejected_append_exits_with_failure(existing_book, tmp_path, monkeypatch):
+    screenshots = save_screenshots(tmp_path / "second", [6, 8])
+    monkeypatch.setattr(sys, 'argv', [
+        'kindle_ocr.py', '--replay', str(screenshots), '--output', str(existing_book), '--append-pdf', '--no-index'
+    ])
+
+    with pytest.raises(SystemExit) as exit_info:
+        kindle_ocr.main()
+    assert exit_info.value.code == 1
+
+
+PILLOW_PDF = Path(__file__).resolve().parent.parent / "kindle_pdf_output" / "kindle_pages_20251230_054514.pdf"
+
+
+def append_page(pdf_path, color='red'):
+    writer = StreamingPDFWriter(pdf_path, append=True)
+    writer.add_page(Image.new('RGB', (400, 300), color))
+    writer.close()
+    return writer
+
+
+def test_append_to_pillow_pdf(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    shutil.copy(PILLOW_PDF, pdf_path)
+    original = PILLOW_PDF.read_bytes()
+    assert original.endswith(b'%%EOF')
+
+    append_page(pdf_path)
+
+    data = pdf_path.read_bytes()
+    assert data.startswith(original + b'\n')
+    trailer = data[data.rindex(b'trailer'):]
+    assert b'/Info 12 0 R' in trailer
+    assert b'/Prev ' + original.split(b'startxref')[-1].split()[0] in trailer
+    assert StreamingPDFWriter(pdf_path, append=True).existing_pages == 4
+
+
+def test_appended_pillow_pdf_parses(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    pdf_path = tmp_path / "book.pdf"
+    shutil.copy(PILLOW_PDF, pdf_path)
+
+    append_page(pdf_path, 'red')
+    append_page(pdf_path, 'blue')
+
+    reader = pypdf.PdfReader(str(pdf_path), strict=True)
+    assert len(reader.pages) == 5
+    assert reader.metadata['/Title'] == 'kindle_pages_20251230_054514'
+
+
+def test_append_keeps_file_identifier(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    writer = StreamingPDFWriter(pdf_path)
+    writer.add_page(Image.new('RGB', (400, 300), 'white'))
+    writer.close()
+    pdf_path.write_bytes(pdf_path.read_bytes().replace(b'/Root 1 0 R', b'/Root 1 0 R /ID [<0a0b><0c0d>]'))
+
+    append_page(pdf_path)
+
+    trailer = pdf_path.read_bytes().rsplit(b'trailer', 1)[1]
+    assert b'/ID [<0a0b><0c0d>]' in trailer
+    assert StreamingPDFWriter(pdf_path, append=True).existing_pages == 2
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import kindle_ocr
+from kindle_ocr import AsyncTranscriptionEngine, FakeBackend, FakeFocusManager, Frame, KindlePDF, RetryPolicy
+
+
+class RecordingBackend(FakeBackend):
+    """同時に処理中のリクエスト数を記録し、呼び出しごとに応答時間を変えられる偽バックエンド"""
+
+    def __init__(self, delays=(), default_delay=0.05):
+        super().__init__()
+        self.delays = list(delays)
+        self.default_delay = default_delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self._counter = threading.Lock()
+
+    async def generate_async(self, parts):
+        with self._counter:
+            delay = self.delays[self.calls] if self.calls < len(self.delays) else self.default_delay
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(delay)
+            return self._respond(parts, False)
+        finally:
+            with self._counter:
+                self.in_flight -= 1
+
+
+def make_kindle_pdf(tmp_path, backend, **kwargs):
+    return KindlePDF(
+        output_dir=str(tmp_path / "out"), enable_ocr=True, backend=backend, use_cache=False,
+        focus_manager=FakeFocusManager(), retry_policy=RetryPolicy(base_delay=0.01, seed=0), **kwargs
+    )
+
+
+def make_frames(count):
+    return [Frame(image=Image.new('RGB', (200, 300), (255, 255 - i * 10, 255))) for i in range(count)]
+
+
+def run_engine(engine, frames):
+    engine.start()
+    for page, frame in enumerate(frames, 1):
+        engine.submit(page, frame)
+    return engine.close()
+
+
+def test_semaphore_caps_requests_in_flight(tmp_path):
+    backend = RecordingBackend(default_delay=0.1)
+    engine = AsyncTranscriptionEngine(make_kindle_pdf(tmp_path, backend), concurrency=2, queue_size=8)
+
+    text_paths = run_engine(engine, make_frames(8))
+
+    assert sorted(text_paths) == list(range(1, 9))
+    assert backend.max_in_flight == 2
+    assert engine.failed_pages == [] and engine.cancelled_pages == []
+
+
+def test_timed_out_request_is_retried(tmp_path):
+    # 1回目のリクエストだけがタイムアウトを超える
+    backend = RecordingBackend(delays=[2.0], default_delay=0.01)
+    kindle_pdf = make_kindle_pdf(tmp_path, backend)
+    engine = AsyncTranscriptionEngine(kindle_pdf, concurrency=1, timeout=0.2)
+
+    text_paths = run_engine(engine, make_frames(1))
+
+    assert list(text_paths) == [1]
+    assert backend.calls == 2
+    assert kindle_pdf.llm_usage['retries'] == 1
+    assert kindle_pdf.llm_usage['failed_requests'] == 0
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_cancel_keeps_finished_pages_and_lists_cancelled_ones(tmp_path):
+    # 2件はすぐに完了し、残りは取り消すまで応答しない
+    backend = RecordingBackend(delays=[0.01, 0.01], default_delay=60)
+    engine = AsyncTranscriptionEngine(make_kindle_pdf(tmp_path, backend), concurrency=4, queue_size=4)
+    engine.start()
+    for page, frame in enumerate(make_frames(5), 1):
+        engine.submit(page, frame)
+    wait_for(lambda: len(engine.text_paths) == 2 and backend.in_flight == 3)
+
+    engine.cancel()
+    text_paths = engine.close()
+
+    assert len(text_paths) == 2
+    assert all(path.exists() for path in text_paths.values())
+    assert sorted(engine.cancelled_pages) == sorted(set(range(1, 6)) - set(text_paths))
+    assert engine.interrupted is None
+
+
+def test_interrupt_while_closing_cancels_and_is_handed_back(tmp_path, monkeypatch):
+    backend = RecordingBackend(delays=[0.01], default_delay=60)
+    engine = AsyncTranscriptionEngine(make_kindle_pdf(tmp_path, backend), concurrency=3, queue_size=3)
+    engine.start()
+    for page, frame in enumerate(make_frames(3), 1):
+        engine.submit(page, frame)
+    wait_for(lambda: len(engine.text_paths) == 1 and backend.in_flight == 2)
+
+    def interrupted_wait(futures):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(kindle_ocr, 'wait_futures', interrupted_wait)
+    text_paths = engine.close()
+
+    assert isinstance(engine.interrupted, KeyboardInterrupt)
+    assert len(text_paths) == 1
+    assert sorted(engine.cancelled_pages) == sorted({1, 2, 3} - set(text_paths))
+
+
+def test_interrupted_replay_records_cancelled_pages(tmp_path, monkeypatch):
+    screenshots = tmp_path / "screenshots"
+    screenshots.mkdir()
+    for i, frame in enumerate(make_frames(3), 1):
+        frame.image.save(screenshots / f"page_{i:04d}_20250101_000000.png")
+    backend = RecordingBackend(delays=[0.01], default_delay=60)
+    kindle_pdf = make_kindle_pdf(tmp_path, backend, ocr_concurrency=3)
+
+    def interrupted_wait(futures):
+        wait_for(lambda: len(list(kindle_pdf.texts_dir.glob("page_*.txt"))) == 1 and backend.in_flight == 2)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(kindle_ocr, 'wait_futures', interrupted_wait)
+    with pytest.raises(KeyboardInterrupt):
+        kindle_pdf.replay_screenshots(screenshots)
+
+    results = kindle_ocr.json.loads((kindle_pdf.output_dir / "results.json").read_text(encoding='utf-8'))
+    assert results['interrupted'] is True
+    assert len(results['text_files']) == 1
+    assert len(results['cancelled_pages']) == 2
+
+
+@pytest.mark.parametrize('batch_size', [1, 2])
+def test_results_are_saved_off_the_event_loop(tmp_path, batch_size):
+    saved_on = []
+
+    class RecordingCache(kindle_ocr.TranscriptionCache):
+        def put(self, key, text):
+            saved_on.append(threading.current_thread())
+            return super().put(key, text)
+
+    class RecordingKindle(KindlePDF):
+        def record_text(self, *args, **kwargs):
+            saved_on.append(threading.current_thread())
+            return super().record_text(*args, **kwargs)
+
+    kindle_pdf = RecordingKindle(
+        output_dir=str(tmp_path / "out"), enable_ocr=True, backend=RecordingBackend(default_delay=0.01),
+        transcription_cache=RecordingCache(tmp_path / "cache"), ocr_batch_size=batch_size,
+        focus_manager=FakeFocusManager(), retry_policy=RetryPolicy(base_delay=0.01, seed=0)
+    )
+    engine = AsyncTranscriptionEngine(kindle_pdf, concurrency=2)
+    engine.start()
+    loop_thread = engine._thread
+    for page, frame in enumerate(make_frames(4), 1):
+        engine.submit(page, frame)
+    text_paths = engine.close()
+
+    assert sorted(text_paths) == [1, 2, 3, 4]
+    assert len(saved_on) == 8
+    assert loop_thread not in saved_on
@@ -0,0 +1,67 @@
+import json
+
+from PIL import Image
+
+from kindle_ocr import (BackendResponse, FakeBackend, FakeFocusManager, Frame, KindlePDF, RetryPolicy,
+                        parse_batch_response)
+
+
+def test_parse_json_list():
+    text = json.dumps([{'page': 1, 'text': 'A'}, {'page': 2, 'text': ' B '}], ensure_ascii=False)
+
+    assert parse_batch_response(text, 2) == {1: 'A', 2: 'B'}
+
+
+def test_parse_fenced_json_object():
+    text = '```json\n{"pages": [{"page": 2, "text": "B"}, {"page": 1, "text": "A"}]}\n```'
+
+    assert parse_batch_response(text, 2) == {1: 'A', 2: 'B'}
+
+
+def test_parse_skips_invalid_entries():
+    text = json.dumps([
+        {'page': 1, 'text': 'A'},
+        {'page': 3, 'text': '範囲外'},
+        {'page': '2', 'text': '文字列のページ番号'},
+        {'page': 2, 'text': '   '},
+        'ページではない',
+    ], ensure_ascii=False)
+
+    assert parse_batch_response(text, 2) == {1: 'A'}
+
+
+def test_parse_invalid_json():
+    assert parse_batch_response('ページ1: A\nページ2: B', 2) == {}
+    assert parse_batch_response('{"page": 1}', 1) == {}
+
+
+class MergingBackend(FakeBackend):
+    """まとめた文字起こしでは2ページ目と3ページ目を1つに結合して返す偽バックエンド"""
+
+    def __init__(self):
+        super().__init__()
+        self.single_calls = 0
+
+    def generate(self, parts):
+        images = [part for part in parts if isinstance(part, dict)]
+        if len(images) > 1:
+            return BackendResponse(json.dumps([{'page': 1, 'text': 'A'}, {'page': 2, 'text': 'B+C'}]))
+        self.single_calls += 1
+        return super().generate(parts)
+
+
+def test_page_count_mismatch_retries_every_page(tmp_path):
+    backend = MergingBackend()
+    kindle_pdf = KindlePDF(
+        output_dir=str(tmp_path / "out"), enable_ocr=True, backend=backend, cache_dir=str(tmp_path / "cache"),
+        ocr_batch_size=3, focus_manager=FakeFocusManager(), retry_policy=RetryPolicy(base_delay=0.01, seed=0)
+    )
+    frames = [Frame(image=Image.new('RGB', (200, 300), (255, 255 - i * 20, 255))) for i in range(3)]
+
+    results = kindle_pdf.transcribe_pages(list(enumerate(frames, 1)))
+
+    assert backend.single_calls == 3
+    texts = [results[page].read_text(encoding='utf-8') for page in (1, 2, 3)]
+    assert all(text.startswith('（偽の文字起こし') for text in texts)
+    cached = [path.read_text(encoding='utf-8') for path in (tmp_path / "cache").glob('*/*.txt')]
+    assert sorted(cached) == sorted(texts)
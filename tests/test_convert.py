@@ -0,0 +1,33 @@
+import threading
+
+from PIL import Image
+
+from kindle_ocr import ParallelPageConverter, PDFPageEncoder, convert_page
+
+
+def make_pages(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f"page_{i + 1:04d}_20250101_000000.png"
+        Image.new('RGB', (200, 300), (255, 255 - i * 20, 255)).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_parallel_conversion_matches_serial_order_and_output(tmp_path):
+    paths = make_pages(tmp_path, 6)
+    encoder = PDFPageEncoder(profile='auto')
+    items = [(str(path), encoder) for path in paths]
+    serial = list(ParallelPageConverter(0).map(convert_page, items))
+
+    # 変換中に別のスレッドが動いていても（forkではなくspawnで起動するため）ワーカーが止まらない
+    stop = threading.Event()
+    busy = threading.Thread(target=stop.wait, daemon=True)
+    busy.start()
+    try:
+        parallel = list(ParallelPageConverter(2, max_in_flight=3).map(convert_page, items))
+    finally:
+        stop.set()
+
+    assert [result['path'] for result in parallel] == [str(path) for path in paths]
+    assert [result['pdf'].data for result in parallel] == [result['pdf'].data for result in serial]
@@ -0,0 +1,65 @@
+import pytest
+
+from kindle_ocr import FakeFocusManager, FocusManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_focus_manager_is_abstract():
+    with pytest.raises(TypeError):
+        FocusManager()
+
+
+def test_skips_activation_while_kindle_is_frontmost():
+    clock = FakeClock()
+    manager = FakeFocusManager(cache_ttl=1.0, clock=clock)
+
+    for _ in range(5):
+        assert manager.ensure_focus()
+        clock.now += 0.4
+
+    assert manager.activate_calls == 0
+    assert manager.stats() == {'activations': 0, 'skipped_activations': 5, 'focus_checks': 2}
+
+
+def test_reactivates_only_after_focus_is_lost():
+    clock = FakeClock()
+    manager = FakeFocusManager(cache_ttl=1.0, clock=clock)
+
+    assert manager.ensure_focus()
+    clock.now += 2.0
+    manager.lose_focus()
+    assert manager.ensure_focus()
+    clock.now += 2.0
+    assert manager.ensure_focus()
+
+    assert manager.activate_calls == 1
+    assert manager.stats() == {'activations': 1, 'skipped_activations': 2, 'focus_checks': 3}
+
+
+def test_invalidate_forces_a_check_within_the_cache_ttl():
+    clock = FakeClock()
+    manager = FakeFocusManager(cache_ttl=10.0, clock=clock)
+
+    manager.ensure_focus()
+    manager.lose_focus()
+    manager.invalidate()
+    manager.ensure_focus()
+
+    assert manager.activate_calls == 1
+
+
+def test_failed_activation_is_not_cached():
+    clock = FakeClock()
+    manager = FakeFocusManager(frontmost='Finder', activate_succeeds=False, cache_ttl=10.0, clock=clock)
+
+    assert not manager.ensure_focus()
+    assert not manager.ensure_focus()
+
+    assert manager.activate_calls == 2
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from kindle_ocr import LibraryScheduler, load_job_spec
+
+
+def write_spec(tmp_path, books):
+    path = tmp_path / "library.json"
+    path.write_text(json.dumps({'books': books}), encoding='utf-8')
+    return path
+
+
+BOOKS = [
+    {'title': '本A', 'output': 'a', 'pages': 10},
+    {'title': '本B', 'output': 'b', 'pages': 5},
+]
+
+
+def test_later_books_need_open_url(tmp_path):
+    with pytest.raises(ValueError, match='2冊目.*open_url'):
+        load_job_spec(write_spec(tmp_path, BOOKS))
+
+
+def test_open_url_is_optional_for_first_book(tmp_path):
+    books = [BOOKS[0], dict(BOOKS[1], open_url='kindle://book?action=open&asin=B')]
+
+    assert [book['open_url'] for book in load_job_spec(write_spec(tmp_path, books))] == \
+        [None, 'kindle://book?action=open&asin=B']
+
+
+def test_manual_open_allows_missing_open_url(tmp_path, monkeypatch):
+    books = load_job_spec(write_spec(tmp_path, BOOKS), manual_open=True)
+    prompts = []
+    monkeypatch.setattr('builtins.input', prompts.append)
+
+    scheduler = LibraryScheduler(books, None, tmp_path / "summary.json", manual_open=True)
+    assert scheduler.open_book(books[1], first=False)
+    assert len(prompts) == 1
+
+
+def test_scheduler_does_not_wait_for_input_unattended(tmp_path, monkeypatch):
+    books = load_job_spec(write_spec(tmp_path, BOOKS), manual_open=True)
+
+    def unexpected_input(prompt):
+        raise AssertionError(prompt)
+    monkeypatch.setattr('builtins.input', unexpected_input)
+
+    scheduler = LibraryScheduler(books, None, tmp_path / "summary.json")
+    assert scheduler.open_book(books[0], first=True)
+    assert not scheduler.open_book(books[1], first=False)
@@ -0,0 +1,90 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from kindle_ocr import (FakeBackend, FakeFocusManager, FakeLocalOCR, Frame, KindlePDF, LocalOCREngine, OCRRouter,
+                        RetryPolicy)
+
+
+def text_page():
+    """白地に黒い文字列が並ぶ本文ページ"""
+    image = Image.new('RGB', (600, 800), 'white')
+    draw = ImageDraw.Draw(image)
+    for y in range(80, 720, 30):
+        for x in range(60, 520, 24):
+            draw.rectangle((x, y, x + 16, y + 16), fill='black')
+    return image
+
+
+def table_page():
+    """縦横の罫線で区切られた表のページ"""
+    image = Image.new('RGB', (600, 800), 'white')
+    draw = ImageDraw.Draw(image)
+    for y in range(200, 601, 100):
+        draw.line((170, y, 430, y), fill='black', width=2)
+    for x in range(170, 431, 65):
+        draw.line((x, 200, x, 600), fill='black', width=2)
+    return image
+
+
+def figure_page():
+    """色付きのグラデーションで塗られた挿絵のページ"""
+    image = Image.new('RGB', (600, 800), 'white')
+    draw = ImageDraw.Draw(image)
+    for y in range(100, 700):
+        draw.line((50, y, 550, y), fill=(y % 256, 120, 255 - y % 256))
+    return image
+
+
+def test_local_engine_is_abstract():
+    with pytest.raises(TypeError):
+        LocalOCREngine()
+
+
+def test_confident_text_page_stays_local():
+    decision = OCRRouter(FakeLocalOCR(confidence=95.0)).route(Frame(image=text_page()))
+
+    assert decision.engine == 'local'
+    assert decision.reason == 'ok'
+    assert decision.text.startswith('（偽のローカルOCR')
+
+
+@pytest.mark.parametrize('image, local_confidence, reason', [
+    (text_page(), 50.0, 'low_confidence'),
+    (table_page(), 95.0, 'table'),
+    (figure_page(), 95.0, 'figure'),
+])
+def test_hard_pages_escalate_to_llm(image, local_confidence, reason):
+    decision = OCRRouter(FakeLocalOCR(confidence=local_confidence)).route(Frame(image=image))
+
+    assert decision.engine == 'llm'
+    assert decision.reason == reason
+
+
+def test_escalated_pages_are_sent_to_backend(tmp_path):
+    class CountingBackend(FakeBackend):
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        def generate(self, parts):
+            self.calls += 1
+            return super().generate(parts)
+
+    backend = CountingBackend()
+    kindle_pdf = KindlePDF(
+        output_dir=str(tmp_path / "out"), enable_ocr=True, backend=backend, use_cache=False,
+        focus_manager=FakeFocusManager(), retry_policy=RetryPolicy(base_delay=0.01, seed=0),
+        ocr_router=OCRRouter(FakeLocalOCR(confidence=95.0))
+    )
+    pages = [(1, Frame(image=text_page())), (2, Frame(image=table_page())), (3, Frame(image=figure_page()))]
+
+    results = kindle_pdf.transcribe_pages(pages)
+
+    assert all(results[page] and results[page].exists() for page in (1, 2, 3))
+    assert backend.calls == 2
+    assert {page: route['engine'] for page, route in kindle_pdf.page_routes.items()} == \
+        {1: 'local', 2: 'llm', 3: 'llm'}
+    assert kindle_pdf.page_routes[2]['reason'] == 'table'
+    assert kindle_pdf.page_routes[3]['reason'] == 'figure'
+    assert '偽のローカルOCR' in results[1].read_text(encoding='utf-8')
+    assert '偽の文字起こし' in results[2].read_text(encoding='utf-8')
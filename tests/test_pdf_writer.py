@@ -0,0 +1,161 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+import kindle_ocr
+from kindle_ocr import FakeFocusManager, KindlePDF, StreamingPDFWriter
+
+pypdf = pytest.importorskip('pypdf')
+
+SCREENSHOT = Path(__file__).resolve().parent.parent / "kindle_pdf_output" / "screenshots" / \
+    "page_0001_20251229_213246.png"
+
+
+def text_page():
+    """白地に黒い文字だけのページ"""
+    image = Image.new('RGB', (400, 600), 'white')
+    draw = ImageDraw.Draw(image)
+    for y in range(40, 560, 30):
+        draw.rectangle((40, y, 360, y + 8), fill='black')
+    return image
+
+
+def gray_page():
+    """白地の一部に灰色の挿絵があるページ"""
+    image = Image.new('RGB', (400, 600), 'white')
+    ImageDraw.Draw(image).rectangle((40, 40, 360, 120), fill=(128, 128, 128))
+    return image
+
+
+def photo_page():
+    """全体が中間調の写真のページ"""
+    return Image.linear_gradient('L').resize((400, 600)).convert('RGB')
+
+
+def color_page():
+    image = Image.new('RGB', (400, 600), 'white')
+    ImageDraw.Draw(image).rectangle((0, 0, 400, 200), fill=(200, 40, 40))
+    return image
+
+
+def write_pdf(pdf_path, images, **kwargs):
+    with StreamingPDFWriter(pdf_path, **kwargs) as writer:
+        for image in images:
+            writer.add_page(image)
+    return writer
+
+
+def image_filters(pdf_path):
+    reader = pypdf.PdfReader(str(pdf_path), strict=True)
+    filters = []
+    for page in reader.pages:
+        xobjects = page['/Resources']['/XObject']
+        (image,) = [xobjects[name].get_object() for name in xobjects]
+        filters.append(image['/Filter'])
+    return filters
+
+
+def test_pages_keep_order_and_count(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    images = [Image.new('RGB', (100 * (i + 1), 300), 'white') for i in range(4)]
+
+    writer = write_pdf(pdf_path, images)
+
+    reader = pypdf.PdfReader(str(pdf_path), strict=True)
+    assert writer.page_count == len(reader.pages) == 4
+    assert [float(page.mediabox.width) for page in reader.pages] == [72.0, 144.0, 216.0, 288.0]
+    assert not (tmp_path / "book.pdf.part").exists()
+
+
+def test_page_size_matches_pillow_output(tmp_path):
+    image = Image.open(SCREENSHOT).convert('RGB')
+    image.save(tmp_path / "pillow.pdf", resolution=100)
+
+    write_pdf(tmp_path / "book.pdf", [image])
+
+    (pillow_page,) = pypdf.PdfReader(str(tmp_path / "pillow.pdf")).pages
+    (page,) = pypdf.PdfReader(str(tmp_path / "book.pdf"), strict=True).pages
+    assert [float(v) for v in page.mediabox] == [float(v) for v in pillow_page.mediabox]
+    assert (float(page.mediabox.width), float(page.mediabox.height)) == pytest.approx((1843.2, 1198.08))
+
+
+def test_abort_removes_partial_file(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+
+    with pytest.raises(RuntimeError):
+        with StreamingPDFWriter(pdf_path) as writer:
+            writer.add_page(text_page())
+            assert (tmp_path / "book.pdf.part").exists()
+            raise RuntimeError
+
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize('profile, pdf_filter', [
+    ('jpeg', '/DCTDecode'),
+    ('gray', '/FlateDecode'),
+    ('bilevel', '/CCITTFaxDecode'),
+])
+def test_fixed_profile(tmp_path, profile, pdf_filter):
+    if profile == 'bilevel' and not kindle_ocr.features.check('libtiff'):
+        pytest.skip('libtiff付きのPillowが必要です')
+    pdf_path = tmp_path / "book.pdf"
+
+    writer = write_pdf(pdf_path, [text_page(), photo_page()], profile=profile)
+
+    assert image_filters(pdf_path) == [pdf_filter] * 2
+    assert writer.profile_counts[profile] == 2
+
+
+@pytest.mark.parametrize('profile', ['gray', 'bilevel'])
+def test_lossless_profile_keeps_pixels(tmp_path, profile):
+    if profile == 'bilevel' and not kindle_ocr.features.check('libtiff'):
+        pytest.skip('libtiff付きのPillowが必要です')
+    pdf_path = tmp_path / "book.pdf"
+
+    write_pdf(pdf_path, [text_page()], profile=profile)
+
+    (image,) = pypdf.PdfReader(str(pdf_path), strict=True).pages[0].images
+    assert ImageChops.difference(image.image.convert('L'), text_page().convert('L')).getbbox() is None
+
+
+def test_auto_profile_chooses_per_page(tmp_path):
+    if not kindle_ocr.features.check('libtiff'):
+        pytest.skip('libtiff付きのPillowが必要です')
+    pdf_path = tmp_path / "book.pdf"
+
+    writer = write_pdf(pdf_path, [text_page(), gray_page(), photo_page(), color_page()], profile='auto')
+
+    assert image_filters(pdf_path) == ['/CCITTFaxDecode', '/FlateDecode', '/DCTDecode', '/DCTDecode']
+    assert writer.profile_counts == {'jpeg': 2, 'gray': 1, 'bilevel': 1}
+
+
+@pytest.mark.parametrize('profile', ['bilevel', 'auto'])
+def test_bilevel_falls_back_to_gray_without_libtiff(tmp_path, monkeypatch, profile):
+    monkeypatch.setattr(kindle_ocr.features, 'check', lambda feature: feature != 'libtiff')
+    pdf_path = tmp_path / "book.pdf"
+
+    writer = write_pdf(pdf_path, [text_page()], profile=profile)
+
+    assert image_filters(pdf_path) == ['/FlateDecode']
+    assert writer.profile_counts == {'jpeg': 0, 'gray': 1, 'bilevel': 0}
+
+
+def test_create_pdf_from_images_sorts_pages(tmp_path):
+    screenshots = tmp_path / "shots"
+    screenshots.mkdir()
+    paths = []
+    for page in (3, 1, 2):
+        path = screenshots / f"page_{page:04d}_20250101_000000.png"
+        Image.new('RGB', (100 * page, 300), 'white').save(path)
+        paths.append(path)
+    kindle_pdf = KindlePDF(output_dir=str(tmp_path / "out"), enable_ocr=False, pdf_profile='gray',
+                           focus_manager=FakeFocusManager())
+
+    pdf_path = kindle_pdf.create_pdf_from_images(paths, "book.pdf")
+
+    reader = pypdf.PdfReader(str(pdf_path), strict=True)
+    assert [float(page.mediabox.width) for page in reader.pages] == [72.0, 144.0, 216.0]
+    assert image_filters(pdf_path) == ['/FlateDecode'] * 3
+    assert list(kindle_pdf.output_dir.glob("*.part")) == []
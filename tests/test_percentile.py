@@ -0,0 +1,28 @@
+import pytest
+
+from kindle_ocr import percentile
+
+
+@pytest.mark.parametrize('n, ratio, rank', [
+    (1, 0.50, 1),
+    (2, 0.50, 1),
+    (2, 0.95, 2),
+    (4, 0.50, 2),
+    (5, 0.50, 3),
+    (6, 0.50, 3),
+    (10, 0.50, 5),
+    (10, 0.95, 10),
+    (20, 0.95, 19),
+    (100, 0.95, 95),
+    (100, 1.00, 100),
+    (3, 0.0, 1),
+    (100, 0.07, 7),
+])
+def test_nearest_rank(n, ratio, rank):
+    values = [float(i) for i in range(1, n + 1)]
+
+    assert percentile(values, ratio) == rank
+
+
+def test_empty_values():
+    assert percentile([], 0.5) == 0.0
@@ -0,0 +1,128 @@
+import pytest
+
+from kindle_ocr import RateLimiter, RetryPolicy, TranscriptionBackend, TransientBackendError
+
+
+class FakeClock:
+    """sleep() で進む時計"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class HTTPError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def test_transcription_backend_is_abstract():
+    with pytest.raises(TypeError):
+        TranscriptionBackend()
+
+
+def test_unlimited_rate_limiter_never_waits():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+
+    for _ in range(100):
+        limiter.acquire(10_000)
+
+    assert clock.sleeps == []
+    assert limiter.throttled_seconds == 0
+
+
+def test_requests_per_minute_spaces_out_requests_after_the_burst():
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_minute=60, clock=clock, sleep=clock.sleep)
+
+    for _ in range(63):
+        limiter.acquire()
+
+    # バケットの60件はすぐに送信し、その後は1秒に1件
+    assert clock.now == pytest.approx(3.0)
+    assert limiter.throttled_seconds == pytest.approx(3.0)
+
+
+def test_tokens_per_minute_waits_for_the_token_bucket():
+    clock = FakeClock()
+    limiter = RateLimiter(tokens_per_minute=6000, clock=clock, sleep=clock.sleep)
+
+    limiter.acquire(6000)
+    limiter.acquire(600)
+
+    assert clock.now == pytest.approx(6.0)
+
+
+def test_request_larger_than_the_bucket_waits_for_a_full_bucket():
+    clock = FakeClock()
+    limiter = RateLimiter(tokens_per_minute=1000, clock=clock, sleep=clock.sleep)
+
+    limiter.acquire(500)
+    limiter.acquire(5000)
+
+    assert clock.now == pytest.approx(30.0)
+
+
+def test_settle_charges_the_difference_from_the_estimate():
+    clock = FakeClock()
+    limiter = RateLimiter(tokens_per_minute=6000, clock=clock, sleep=clock.sleep)
+
+    limiter.acquire(1000)
+    limiter.settle(1000, 4000)
+    # 残り 6000 - 4000 = 2000 トークン
+    assert limiter.reserve(2000) == 0.0
+    assert limiter.reserve(600) == pytest.approx(6.0)
+
+
+def test_retry_delays_stay_within_the_full_jitter_bounds():
+    policy = RetryPolicy(max_retries=10, base_delay=1.0, max_delay=8.0, retry_budget=1000, seed=1)
+    error = TransientBackendError("429")
+
+    for attempt in range(10):
+        for _ in range(50):
+            delay = policy.next_delay(attempt, error)
+            assert 0.0 <= delay <= min(8.0, 2 ** attempt)
+
+
+def test_retry_stops_after_max_retries():
+    policy = RetryPolicy(max_retries=3, seed=0)
+    error = TimeoutError()
+
+    assert policy.next_delay(2, error) is not None
+    assert policy.next_delay(3, error) is None
+
+
+def test_retry_budget_is_shared_across_requests():
+    policy = RetryPolicy(max_retries=5, retry_budget=3, seed=0)
+    error = HTTPError(503)
+
+    delays = [policy.next_delay(0, error) for _ in range(5)]
+
+    assert [delay is not None for delay in delays] == [True, True, True, False, False]
+    assert policy.retries == 3
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (TransientBackendError("x"), True),
+    (TimeoutError(), True),
+    (ConnectionError(), True),
+    (HTTPError(429), True),
+    (HTTPError(500), True),
+    (HTTPError(400), False),
+    (type('ResourceExhausted', (Exception,), {})(), True),
+    (ValueError("bad request"), False),
+])
+def test_retryable_errors(error, retryable):
+    policy = RetryPolicy(seed=0)
+
+    assert policy.is_retryable(error) is retryable
+    assert (policy.next_delay(0, error) is not None) is retryable
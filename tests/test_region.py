@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageOps
+
+from kindle_ocr import PageRegionDetector
+
+SCREENSHOTS = Path(__file__).resolve().parent.parent / "kindle_pdf_output" / "screenshots"
+
+# Kindleアプリの画面（ダークモード）とそのページ領域
+SPREAD = "page_0001_20251229_213246"    # 全画面の見開き
+COVER = "page_0001_20251229_213605"     # 全画面の表紙
+WINDOWED = "page_0001_20251229_214750"  # ツールバーとスライダーを表示したウィンドウ
+# 設定ウィンドウが Kindle の表紙に重なった画面
+OBSCURED = "page_0002_20251229_214049"
+
+
+def load(name, light=False):
+    image = Image.open(SCREENSHOTS / f"{name}.png").convert('RGB')
+    # 背景を白にして通常（ライト）モードの画面を再現する
+    return ImageOps.invert(image) if light else image
+
+
+@pytest.mark.parametrize('light', [False, True], ids=['dark', 'light'])
+@pytest.mark.parametrize('name, region', [
+    (SPREAD, (272, 164, 2288, 1476)),
+    (COVER, (764, 160, 1796, 1484)),
+    (WINDOWED, (88, 272, 2244, 1284)),
+])
+def test_detect_kindle_page(name, region, light):
+    assert PageRegionDetector().detect(load(name, light)) == region
+
+
+def test_detect_returns_none_when_window_is_covered():
+    assert PageRegionDetector().detect(load(OBSCURED)) is None
+
+
+def test_region_is_reused_until_layout_changes():
+    detector = PageRegionDetector()
+    cover = (764, 160, 1796, 1484)
+
+    for name in (COVER, "page_0002_20251229_213255", "page_0003_20251229_213304"):
+        assert detector.region_for(load(name)) == cover
+    assert detector.detections == 1
+
+    # 他のウィンドウが重なった画面では前回の領域を使う
+    assert detector.region_for(load(OBSCURED)) == cover
+    assert detector.detections == 1
+
+    # ウィンドウ表示に切り替わると検出し直す
+    assert detector.region_for(load(WINDOWED)) == (88, 272, 2244, 1284)
+    assert detector.region_for(load("page_0002_20251229_214206")) == (88, 272, 2244, 1284)
+    assert detector.detections == 2
+
+
+def test_region_grows_for_content_outside_it():
+    detector = PageRegionDetector()
+    detector.region_for(load("page_0002_20251229_214206"))
+
+    assert detector.region_for(load("page_0002_20251229_214806")) == (88, 272, 2312, 1284)
+    assert detector.detections == 2
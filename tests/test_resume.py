@@ -0,0 +1,195 @@
+import json
+
+import pytest
+from PIL import Image
+
+from kindle_ocr import (FakeBackend, FakeFocusManager, FrameStore, KindlePDF, PageJournal, RetryPolicy,
+                        load_frame_index, results_pdf_pages)
+
+
+class FakeKindle(KindlePDF):
+    """Kindleアプリの代わりに合成したページ画像を順に「キャプチャ」するKindlePDF"""
+
+    def __init__(self, shown=1, crash_at=None, **kwargs):
+        super().__init__(focus_manager=FakeFocusManager(), **kwargs)
+        self.shown = shown
+        self.crash_at = crash_at
+        self.captured = []
+        self.tracer.sleeper = self.skip_sleep
+
+    @staticmethod
+    def skip_sleep(seconds):
+        """待機しない"""
+
+    def activate_kindle_app(self):
+        return True
+
+    def take_screenshot(self, page_number):
+        if self.shown == self.crash_at:
+            raise KeyboardInterrupt
+        self.captured.append(self.shown)
+        path = self.screenshots_dir / f"page_{page_number:04d}_20250101_000000.png"
+        Image.new('RGB', (200, 300), (255, 255 - self.shown * 20, 255)).save(path)
+        return path
+
+    def turn_page(self, direction="next"):
+        self.shown += 1
+        return True
+
+
+def read_results(kindle_pdf):
+    return json.loads((kindle_pdf.output_dir / "results.json").read_text(encoding='utf-8'))
+
+
+def crash_before_storing(tmp_path, stored_frames):
+    """フレームストアに stored_frames 枚だけ書き込んだところで強制終了した実行を再現する"""
+    kindle_pdf = FakeKindle(output_dir=str(tmp_path / "out"), crash_at=4,
+                            frame_store=FrameStore(tmp_path / "store", codec='png'))
+    write_stored_frame = kindle_pdf._write_stored_frame
+    written = []
+
+    def write_some(*args):
+        if len(written) < stored_frames:
+            written.append(args)
+            write_stored_frame(*args)
+    kindle_pdf._write_stored_frame = write_some
+    kindle_pdf.capture_pages(num_pages=5, delay_between_pages=0, countdown=0)
+    # finish_pages() を呼ばずに終了する（書き込み待ちのフレームは失われる）
+    kindle_pdf.writer.close()
+    kindle_pdf.journal.close()
+    return kindle_pdf
+
+
+def resume(tmp_path):
+    kindle_pdf = FakeKindle(output_dir=str(tmp_path / "out"), shown=4,
+                            frame_store=FrameStore(tmp_path / "store", codec='png'))
+    assert kindle_pdf.process_pages(delay_between_pages=0, resume=True)
+    return kindle_pdf
+
+
+def test_resume_restores_frames_not_yet_stored(tmp_path):
+    crash_before_storing(tmp_path, stored_frames=1)
+
+    kindle_pdf = resume(tmp_path)
+
+    assert kindle_pdf.captured == [4, 5]
+    results = read_results(kindle_pdf)
+    assert results_pdf_pages(results) == [1, 2, 3, 4, 5]
+    assert 'missing_pages' not in results
+    index = load_frame_index(kindle_pdf.screenshots_dir)
+    assert sorted(int(page) for page in index['pages']) == [1, 2, 3, 4, 5]
+    assert not list(kindle_pdf.screenshots_dir.glob("page_*.png"))
+
+
+def test_resume_reports_pages_without_images(tmp_path):
+    crashed = crash_before_storing(tmp_path, stored_frames=1)
+    (crashed.screenshots_dir / "page_0002_20250101_000000.png").unlink()
+
+    kindle_pdf = resume(tmp_path)
+
+    results = read_results(kindle_pdf)
+    assert results['missing_pages'] == [2]
+    assert results_pdf_pages(results) == [1, 3, 4, 5]
+
+
+def journal_records(kindle_pdf):
+    records = []
+    for line in kindle_pdf.journal.path.read_text(encoding='utf-8').splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            records.append(None)
+    return records
+
+
+def test_load_ignores_truncated_last_line(tmp_path):
+    crashed = crash_before_storing(tmp_path, stored_frames=3)
+    with open(crashed.journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"event": "capture", "page": 4, "scre')
+
+    state = PageJournal.load(crashed.journal.path)
+
+    assert sorted(state['captures']) == [1, 2, 3]
+    assert state['last_turned'] == 4
+    assert not state['completed']
+
+    kindle_pdf = resume(tmp_path)
+
+    assert kindle_pdf.captured == [4, 5]
+    records = journal_records(kindle_pdf)
+    assert records.count(None) == 1
+    assert records[records.index(None) + 1]['event'] == 'resume'
+    assert PageJournal.load(kindle_pdf.journal.path)['completed']
+
+
+class FlakyBackend(FakeBackend):
+    """fail_calls 回目の呼び出しだけ失敗し、呼び出し回数を数える偽バックエンド"""
+
+    def __init__(self, fail_calls=()):
+        super().__init__()
+        self.fail_calls = set(fail_calls)
+        self.calls = 0
+
+    def generate(self, parts):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            raise ValueError("偽バックエンドの失敗")
+        return super().generate(parts)
+
+
+def ocr_kindle(tmp_path, backend, **kwargs):
+    return FakeKindle(output_dir=str(tmp_path / "out"), enable_ocr=True, backend=backend, use_cache=False,
+                      retry_policy=RetryPolicy(max_retries=0, base_delay=0.01, seed=0), **kwargs)
+
+
+def test_resume_skips_finished_pages_and_requeues_failed_ocr(tmp_path):
+    crashed = ocr_kindle(tmp_path, FlakyBackend(fail_calls={2}), crash_at=4)
+    crashed.capture_pages(num_pages=5, delay_between_pages=0, countdown=0)
+    crashed.writer.close()
+    crashed.journal.close()
+    state = PageJournal.load(crashed.journal.path)
+    assert {page: record['status'] for page, record in state['ocr'].items()} == {1: 'ok', 2: 'failed', 3: 'ok'}
+
+    backend = FlakyBackend()
+    kindle_pdf = ocr_kindle(tmp_path, backend, shown=4)
+    assert kindle_pdf.process_pages(delay_between_pages=0, resume=True)
+
+    # キャプチャはページ4から、文字起こしは失敗したページ2と新しいページ4・5だけを行う
+    assert kindle_pdf.captured == [4, 5]
+    assert backend.calls == 3
+    results = read_results(kindle_pdf)
+    assert results_pdf_pages(results) == [1, 2, 3, 4, 5]
+    assert len(results['text_files']) == 5
+
+
+class InterruptedTurnKindle(FakeKindle):
+    """ページ turn_at を表示中にページめくりの途中で強制終了する"""
+
+    def __init__(self, turn_at=None, **kwargs):
+        super().__init__(**kwargs)
+        self.turn_at = turn_at
+
+    def turn_page(self, direction="next"):
+        if self.shown == self.turn_at:
+            raise KeyboardInterrupt
+        return super().turn_page(direction)
+
+
+@pytest.mark.parametrize('crash, shown', [
+    # 表示中のページ3をキャプチャ済みなので、めくってから再開する
+    ({'turn_at': 3}, 3),
+    # ページ4にめくった後、キャプチャ前に終了したので、めくらずにページ4から再開する
+    ({'crash_at': 4}, 4),
+])
+def test_resume_continues_from_last_turned_page(tmp_path, crash, shown):
+    crashed = InterruptedTurnKindle(output_dir=str(tmp_path / "out"), **crash)
+    crashed.capture_pages(num_pages=5, delay_between_pages=0, countdown=0)
+    crashed.writer.close()
+    crashed.journal.close()
+    assert PageJournal.load(crashed.journal.path)['last_turned'] == shown
+
+    kindle_pdf = FakeKindle(output_dir=str(tmp_path / "out"), shown=shown)
+    assert kindle_pdf.process_pages(delay_between_pages=0, resume=True)
+
+    assert kindle_pdf.captured == [4, 5]
+    assert results_pdf_pages(read_results(kindle_pdf)) == [1, 2, 3, 4, 5]
@@ -0,0 +1,88 @@
+from PIL import Image
+
+import kindle_ocr
+from kindle_ocr import LowResFrameSource, PageSettleDetector
+
+
+class FakeClock:
+    """sleep() で進む時計"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def frames(*levels):
+    """明度のリストから合成フレームを順に返すフレームソース"""
+    images = iter([Image.new('RGB', (320, 200), (level, level, level)) for level in levels])
+    last = []
+
+    def source():
+        try:
+            last[:] = [next(images)]
+        except StopIteration:
+            pass
+        return last[0]
+    return source
+
+
+def make_detector(source, clock, **kwargs):
+    return PageSettleDetector(source, poll_interval=0.1, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_waits_for_change_then_stable_frames():
+    clock = FakeClock()
+    reference = PageSettleDetector.fingerprint(Image.new('RGB', (320, 200), (255, 255, 255)))
+    # 2フレームはページめくり前のまま、描画中に1回変化し、その後静止する
+    detector = make_detector(frames(255, 255, 40, 120, 120, 120, 120), clock, stable_frames=2)
+
+    elapsed, timed_out = detector.wait(reference)
+
+    assert not timed_out
+    assert round(elapsed, 3) == 0.6
+
+
+def test_times_out_when_screen_never_settles():
+    clock = FakeClock()
+    levels = [(i * 37) % 256 for i in range(100)]
+    detector = make_detector(frames(*levels), clock, timeout=1.0)
+
+    elapsed, timed_out = detector.wait()
+
+    assert timed_out
+    assert elapsed >= 1.0
+
+
+def test_times_out_when_page_never_changes():
+    clock = FakeClock()
+    reference = PageSettleDetector.fingerprint(Image.new('RGB', (320, 200), (255, 255, 255)))
+    detector = make_detector(frames(255), clock, timeout=0.5)
+
+    _, timed_out = detector.wait(reference)
+
+    assert timed_out
+
+
+def test_low_res_source_captures_only_the_center_region(tmp_path, monkeypatch):
+    commands = []
+
+    def runner(command, **kwargs):
+        commands.append(command)
+        Image.new('RGB', (720, 450), (10, 20, 30)).save(command[-1], format='JPEG')
+
+    monkeypatch.setattr(kindle_ocr.tempfile, 'gettempdir', lambda: str(tmp_path))
+    source = LowResFrameSource(screen_size=lambda: (1440, 900), runner=runner, use_quartz=False)
+
+    frame = source()
+
+    assert source.region == (360, 225, 720, 450)
+    assert '-R360,225,720,450' in commands[0]
+    assert frame.mode == 'L'
+    assert max(frame.size) <= 720
+    # 一時ファイルは読み込んだ後に削除する
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,130 @@
+import os
+
+import pytest
+from PIL import Image
+
+from kindle_ocr import BackendResponse, FakeBackend, FakeFocusManager, KindlePDF, RetryPolicy, TextIndex
+
+PAGES = {
+    1: "お金のむこうに人がいる。経済の問題は自分にも影響がある。",
+    2: "お金を増やしても、働く人がいなければ意味がない。",
+    3: "税金は100%の人が払う。予算_案の話。",
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    text_index = TextIndex(tmp_path / "index.db")
+    yield text_index
+    text_index.close()
+
+
+def write_book(book_dir, pages=PAGES):
+    texts = book_dir / "texts"
+    texts.mkdir(parents=True, exist_ok=True)
+    for page, text in pages.items():
+        (texts / f"page_{page:04d}.txt").write_text(text, encoding='utf-8')
+    return book_dir
+
+
+def found_pages(index, query):
+    return sorted(hit.page for hit in index.search(query))
+
+
+def test_add_replaces_page(index, tmp_path):
+    index.add(tmp_path / "book", "本", 1, "古い文字起こし結果")
+    index.add(tmp_path / "book", "本", 1, "新しい文字起こし結果")
+
+    assert index.stats() == {'books': 1, 'pages': 1}
+    assert found_pages(index, "新しい") == [1]
+    assert found_pages(index, "古い文字") == []
+
+
+def test_pages_are_indexed_as_they_are_transcribed(index, tmp_path):
+    class FixedBackend(FakeBackend):
+        def generate(self, parts):
+            return BackendResponse("経済の問題を考える")
+
+    screenshots = tmp_path / "shots"
+    screenshots.mkdir()
+    Image.new('RGB', (200, 300), 'white').save(screenshots / "page_0001_20250101_000000.png")
+    kindle_pdf = KindlePDF(
+        output_dir=str(tmp_path / "book"), enable_ocr=True, backend=FixedBackend(), use_cache=False,
+        text_index=index, book_title="経済の本", focus_manager=FakeFocusManager(),
+        retry_policy=RetryPolicy(base_delay=0.01, seed=0)
+    )
+
+    assert kindle_pdf.replay_screenshots(screenshots)
+
+    (hit,) = index.search("経済の問題")
+    assert (hit.book, hit.page) == ("経済の本", 1)
+    assert hit.snippet == "[経済の問題]を考える"
+    assert hit.screenshot.endswith("page_0001_20250101_000000.png")
+    # index_book() で登録し直しても、保存時に登録したページは読み込まない
+    assert index.index_book(kindle_pdf.output_dir) == (0, 1)
+
+
+def test_index_book_skips_unchanged_pages(index, tmp_path):
+    book_dir = write_book(tmp_path / "book")
+
+    assert index.index_book(book_dir) == (3, 0)
+    assert index.index_book(book_dir) == (0, 3)
+
+    text_file = book_dir / "texts" / "page_0002.txt"
+    text_file.write_text("書き直したページ", encoding='utf-8')
+    stat = text_file.stat()
+    os.utime(text_file, (stat.st_atime, stat.st_mtime + 10))
+
+    assert index.index_book(book_dir) == (1, 2)
+    assert found_pages(index, "書き直した") == [2]
+    assert index.stats() == {'books': 1, 'pages': 3}
+
+
+@pytest.mark.parametrize('query, pages', [
+    ("人", [1, 2, 3]),       # 1文字は LIKE で検索
+    ("お金", [1, 2]),        # 2文字も LIKE で検索
+    ("お金を", [2]),          # 3文字以上は trigram で検索
+    ("経済の問題", [1]),
+    ("お金 経済の", [1]),     # 短い語と長い語の AND
+    ("人 税金", [3]),
+    ("お金 税金", []),
+])
+def test_short_and_long_japanese_terms(index, tmp_path, query, pages):
+    index.index_book(write_book(tmp_path / "book"))
+
+    assert found_pages(index, query) == pages
+
+
+def test_short_and_long_term_snippets(index, tmp_path):
+    index.index_book(write_book(tmp_path / "book"))
+
+    (hit,) = index.search("税金")
+    assert hit.snippet == "[税金]は100%の人が払う。予算_案の話。"
+    assert hit.score == 0.0
+
+    # 3文字以上の語は trigram で検索し、BM25 の関連度が付く
+    (hit,) = index.search("税金は")
+    assert hit.snippet.startswith("[税金は]100%の人が")
+    assert hit.score < 0
+
+
+@pytest.mark.parametrize('query, pages', [
+    ("100%", [3]),
+    ("%", [3]),
+    ("_", [3]),
+    ("算_案", [3]),
+    ('"', []),
+    ('お金"', []),
+    ("*", []),
+    ("お金*", []),
+    ("AND", []),
+    ("OR NOT", []),
+    ("NEAR(お金 経済)", []),
+    ("経済の問題 AND", []),
+    ("^お金", []),
+    ("text:お金", []),
+])
+def test_fts_syntax_is_searched_literally(index, tmp_path, query, pages):
+    index.index_book(write_book(tmp_path / "book"))
+
+    assert found_pages(index, query) == pages
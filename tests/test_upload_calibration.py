@@ -0,0 +1,74 @@
+import json
+import sys
+
+from PIL import Image
+
+import kindle_ocr
+from kindle_ocr import FakeBackend, FakeFocusManager, Frame, KindlePDF, RetryPolicy, UploadCalibrator
+
+
+def replayed_book(tmp_path, pages=range(1, 5)):
+    """出力ディレクトリの外のスクリーンショットを --replay で文字起こしした本"""
+    screenshots = tmp_path / "shots"
+    screenshots.mkdir()
+    for page in pages:
+        image = Image.new('RGB', (200, 300), (255, 255 - page * 10, 255))
+        image.save(screenshots / f"page_{page:04d}_20250101_000000.png")
+    kindle_pdf = KindlePDF(
+        output_dir=str(tmp_path / "book"), enable_ocr=True, backend=FakeBackend(), use_cache=False,
+        focus_manager=FakeFocusManager(), retry_policy=RetryPolicy(base_delay=0.01, seed=0)
+    )
+    assert kindle_pdf.replay_screenshots(screenshots)
+    return kindle_pdf.output_dir, screenshots
+
+
+def test_samples_use_screenshots_recorded_in_results(tmp_path):
+    book_dir, screenshots = replayed_book(tmp_path)
+    assert not list((book_dir / "screenshots").glob("*.png"))
+
+    samples = UploadCalibrator.sample_pages([book_dir], 2)
+
+    assert [page for _, page, _, _ in samples] == [1, 3]
+    assert all(screenshot.parent == screenshots for _, _, screenshot, _ in samples)
+    assert all(reference.startswith('（偽の文字起こし') for _, _, _, reference in samples)
+
+
+def test_calibrate_upload_on_replay_output(tmp_path, monkeypatch):
+    book_dir, _ = replayed_book(tmp_path)
+    monkeypatch.setattr(sys, 'argv', [
+        'kindle_ocr.py', '--calibrate-upload', str(book_dir), '--llm-backend', 'fake',
+        '--calibration-pages', '2', '--calibration-settings', 'jpeg@2048,gray@1024'
+    ])
+
+    kindle_ocr.main()
+
+    report = json.loads((book_dir / "upload_calibration.json").read_text(encoding='utf-8'))
+    assert [row['pages'] for row in report['settings']] == [2, 2]
+
+
+def test_cache_is_not_shared_between_upload_settings(tmp_path):
+    class CountingBackend(FakeBackend):
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        def generate(self, parts):
+            self.calls += 1
+            return super().generate(parts)
+
+    backend = CountingBackend()
+    image = Image.new('RGB', (1600, 2400), (250, 250, 250))
+
+    def transcribe(**upload):
+        kindle_pdf = KindlePDF(
+            output_dir=str(tmp_path / "book"), enable_ocr=True, backend=backend, cache_dir=str(tmp_path / "cache"),
+            focus_manager=FakeFocusManager(), retry_policy=RetryPolicy(base_delay=0.01, seed=0), **upload
+        )
+        return kindle_pdf.extract_text_from_image(Frame(image=image))
+
+    low_quality = transcribe(upload_profile='bilevel', upload_max_size=1024)
+    assert transcribe(upload_profile='bilevel', upload_max_size=1024) == low_quality
+    assert backend.calls == 1
+
+    assert transcribe() != low_quality
+    assert backend.calls == 2
@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from kindle_ocr import WorkQueue, results_pdf_pages
+
+SCRIPT = Path(__file__).resolve().parent.parent / "kindle_ocr.py"
+
+
+def save_screenshots(directory, pages):
+    directory.mkdir()
+    for page in pages:
+        image = Image.new('RGB', (200, 300), (255, 255 - page * 10, 255))
+        image.save(directory / f"page_{page:04d}_20250101_000000.png")
+    return directory
+
+
+def run_cli(cwd, *args):
+    return subprocess.Popen([sys.executable, str(SCRIPT), *args], cwd=cwd,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def check_output(process):
+    output, _ = process.communicate(timeout=120)
+    assert process.returncode == 0, output
+    return output
+
+
+def backdate(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_workers_process_queue_and_assemble(tmp_path):
+    save_screenshots(tmp_path / "shots", range(1, 7))
+    check_output(run_cli(tmp_path, '--replay', 'shots', '--output', 'book', '--queue', 'queue',
+                         '--ocr', '--llm-backend', 'fake'))
+
+    workers = [run_cli(tmp_path, '--worker', '--queue', 'queue', '--llm-backend', 'fake', '--fake-latency', '0.1',
+                       '--no-cache') for _ in range(3)]
+    for worker in workers:
+        check_output(worker)
+    check_output(run_cli(tmp_path, '--assemble', '--queue', 'queue', '--no-index'))
+
+    results = json.loads((tmp_path / "book" / "results.json").read_text(encoding='utf-8'))
+    assert results_pdf_pages(results) == [1, 2, 3, 4, 5, 6]
+    assert len(results['text_files']) == 6
+    assert results['work_queue']['failed_pages'] == []
+    assert sum(results['work_queue']['workers'].values()) == 6
+    assert Path(tmp_path / "book", results['pdf_file']).exists()
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    queue = WorkQueue(tmp_path / "queue", lease_seconds=60)
+    queue.enqueue(tmp_path / "book", 1, tmp_path / "page.png")
+    lease = queue.claim('crashed')
+    backdate(lease.path, 120)
+
+    reclaimed = queue.claim('survivor')
+
+    assert reclaimed.task['id'] == lease.task['id']
+    assert reclaimed.task['worker'] == 'survivor'
+    assert reclaimed.task['attempts'] == 2
+    assert not queue.renew(lease)
+
+
+class RacingQueue(WorkQueue):
+    """リースを読み込む直前に、他のワーカーの処理を割り込ませる作業キュー"""
+
+    def __init__(self, root, interleave, **kwargs):
+        super().__init__(root, **kwargs)
+        self.interleave = interleave
+
+    def _read_json(self, path):
+        if path.parent == self.dirs['leases']:
+            self.interleave(self, path)
+        return super()._read_json(path)
+
+
+def test_new_lease_is_not_expired_by_old_task_mtime(tmp_path):
+    reclaimed = []
+    queue = RacingQueue(tmp_path / "queue", lambda queue, path: reclaimed.append(queue.reclaim_expired()),
+                        lease_seconds=60)
+    task_id = queue.enqueue(tmp_path / "book", 1, tmp_path / "page.png")
+    backdate(queue.dirs['tasks'] / f"{task_id}.json", 120)
+
+    lease = queue.claim('worker')
+
+    assert reclaimed == [0]
+    assert lease.task['id'] == task_id
+    assert lease.path.exists()
+
+
+def test_claim_skips_lease_reclaimed_by_another_worker(tmp_path):
+    def reclaim(queue, path):
+        os.rename(path, queue.dirs['tasks'] / f"{path.name.split('.')[0]}.json")
+
+    queue = RacingQueue(tmp_path / "queue", reclaim)
+    queue.enqueue(tmp_path / "book", 1, tmp_path / "page.png")
+
+    assert queue.claim('worker') is None
+    assert queue.counts()['tasks'] == 1